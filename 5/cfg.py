@@ -5,17 +5,67 @@ Control Flow Graphs (CFG)
 """
 
 import tac
+from collections import deque
+from collections.abc import Mapping
 from io import StringIO
 
 # ------------------------------------------------------------------------------
 
+class InstrList(list):
+    """The body or the jumps of a Block: a list that counts its changes in
+    the `version' of the block"""
+    __slots__ = ('block',)
+
+    def __init__(self, block, instrs=()):
+        super().__init__(instrs)
+        self.block = block
+
+def _counted(name):
+    method = getattr(list, name)
+    def mutate(self, *args, **kwargs):
+        self.block.version += 1
+        return method(self, *args, **kwargs)
+    mutate.__name__ = name
+    return mutate
+
+for _name in ('__setitem__', '__delitem__', '__iadd__', '__imul__', 'append',
+              'extend', 'insert', 'pop', 'remove', 'clear', 'sort', 'reverse'):
+    setattr(InstrList, _name, _counted(_name))
+
 class Block:
-    """Basic block -- does not support multiple labels"""
+    """Basic block -- does not support multiple labels
+
+    Every change to the lists `body' and `jumps' increases `version', which
+    tells the analyses of the cfg that they must be redone. Changes to the
+    instructions themselves must be reported with touch()."""
 
     def __init__(self, label, body=None, jumps=None):
         self.label = label
-        self.body = list(body or [])
-        self.jumps = list(jumps or [])
+        self.version = 0
+        self.body = body or []
+        self.jumps = jumps or []
+
+    @property
+    def body(self):
+        return self._body
+
+    @body.setter
+    def body(self, instrs):
+        self._body = InstrList(self, instrs)
+        self.version += 1
+
+    @property
+    def jumps(self):
+        return self._jumps
+
+    @jumps.setter
+    def jumps(self, instrs):
+        self._jumps = InstrList(self, instrs)
+        self.version += 1
+
+    def touch(self):
+        """Report that some instructions of the block were changed in place"""
+        self.version += 1
 
     def instrs(self):
         """Iterator over the instructions in the block (excluding label)"""
@@ -70,6 +120,8 @@ class CFG:
         """
         self.proc_name = proc_name
         self.lab_entry = lab_entry
+        self.version = 0        # increased by every change to the nodes or edges
+        self.analyses = AnalysisManager(self)
         self._blockmap = {bl.label: bl for bl in blocks}
         self._fwd = {lab: set() for lab in self._blockmap}  # next()
         self._bwd = {lab: set() for lab in self._blockmap}  # prev()
@@ -118,6 +170,7 @@ class CFG:
 
     def add_node(self, block):
         assert block.label not in self._blockmap
+        self.version += 1
         self._blockmap[block.label] = block
         self._fwd[block.label] = set()
         self._bwd[block.label] = set()
@@ -127,16 +180,19 @@ class CFG:
 
     def remove_node(self, block):
         assert block.label in self._blockmap
+        self.version += 1
         del self._blockmap[block.label]
         for lab_to in self._fwd[block.label]:
             self._bwd[lab_to].remove(block.label)
         del self._fwd[block.label]
 
     def add_edge(self, lab_from, lab_to):
+        self.version += 1
         self._fwd[lab_from].add(lab_to)
         self._bwd[lab_to].add(lab_from)
 
     def remove_edge(self, lab_from, lab_to):
+        self.version += 1
         self._fwd[lab_from].remove(lab_to)
         self._bwd[lab_to].remove(lab_from)
 
@@ -164,7 +220,17 @@ class CFG:
             else: yield from bl.instr_pairs()
 
     def write_dot(self, tacfile, **kwargs):
+        """Write the CFG in graphviz format. The optional keyword arguments
+        `livein' and `liveout' annotate blocks with live sets, and `heat'
+        (a dict from instructions to (hits, ns), see tac.Profile.instr_heat)
+        annotates and colors them with their execution counts and time."""
         dotfile = f'{tacfile}.{self.proc_name[1:]}.dot'
+        heat = kwargs.get('heat')
+        if heat is not None:
+            block_heat = {bl.label: (max((heat.get(i, (0, 0))[0] for i in bl.instrs()), default=0),
+                                     sum(heat.get(i, (0, 0))[1] for i in bl.instrs()))
+                          for bl in self._blockmap.values()}
+            max_ns = max((ns for _, ns in block_heat.values()), default=0) or 1
         with open(dotfile, 'w') as f:
             print(f'digraph {self.proc_name[1:]} {{', file=f)
             for bl in self._blockmap.values():
@@ -175,8 +241,13 @@ class CFG:
                     node_label += '  // LI: {' + ','.join(kwargs['livein'][bl.first_instr()]) + r'}\l'
                 if 'liveout' in kwargs:
                     node_text += '  // LO: {' + ','.join(kwargs['liveout'][bl.last_instr()]) + r'}\l'
+                style = ''
+                if heat is not None:
+                    hits, ns = block_heat[bl.label]
+                    node_label += f'  // hits: {hits}, time: {ns / 1e6:.3f} ms' + r'\l'
+                    style = f',style="filled",fillcolor="0.000 {ns / max_ns:.3f} 1.000"'
                 node_text = node_label + node_text
-                print(f'{bl.label[2:]}[shape="box",fontname="monospace",fontsize=8,label="{node_text}"];', file=f)
+                print(f'{bl.label[2:]}[shape="box",fontname="monospace",fontsize=8{style},label="{node_text}"];', file=f)
             for lab_from, lab_tos in self._fwd.items():
                 for lab_to in lab_tos:
                     print(f'{lab_from[2:]} -> {lab_to[2:]};', file=f)
@@ -184,19 +255,26 @@ class CFG:
 
 # ------------------------------------------------------------------------------
 
-import re
+def _ender(instr):
+    return tac.opcode_flags[instr.opcode] & tac.OP_TERMINATOR
+
+def _jcc(instr):
+    return tac.opcode_flags[instr.opcode] & tac.OP_CONDITIONAL
+
+def _jabs(instr):
+    """jmp or ret"""
+    flags = tac.opcode_flags[instr.opcode]
+    return flags & tac.OP_TERMINATOR and not flags & tac.OP_CONDITIONAL
 
-_enders = re.compile(r'jmp|jz|jnz|jl|jle|jnl|jnle|ret')
-_jumps  = re.compile(r'jmp|jz|jnz|jl|jle|jnl|jnle')
-_jcc    = re.compile(r'jz|jnz|jl|jle|jnl|jnle')
-_jabs   = re.compile(r'jmp|ret')
-_unconditional = re.compile(r'label|jmp|ret')
+def _unconditional(instr):
+    """label, jmp or ret"""
+    return instr.opcode == 'label' or _jabs(instr)
 
 def apply_label_rewrite(jinstr, tab):
     if jinstr.opcode == 'jmp':
         jinstr.arg1 = tab.get(jinstr.arg1, jinstr.arg1)
     elif jinstr.opcode == 'phi':
-        jinstr.arg1 = tuple((tab.get(lab, lab), tmp) for (lab, tmp) in jinstr.arg1.items())
+        jinstr.arg1 = {tab.get(lab, lab): tmp for (lab, tmp) in jinstr.arg1.items()}
     elif jinstr.opcode != 'ret':
         jinstr.arg2 = tab.get(jinstr.arg2, jinstr.arg2)
 
@@ -228,7 +306,7 @@ def normalize_labels(tac_proc):
         if instr.opcode == 'label':
             assert instr.arg1 not in norm_map
             lab = next(labels)
-            tac_proc.body.append(tac.Instr(None, 'label', (lab, None)))
+            tac_proc.body.append(tac.Instr.trusted(None, 'label', (lab, None)))
             norm_map[instr.arg1] = lab
             while cur < len(instrs) and instrs[cur].opcode == 'label':
                 norm_map[instrs[cur].arg1] = lab
@@ -244,10 +322,10 @@ def fallthrough_to_jump(tac_proc):
     instrs, tac_proc.body = tac_proc.body, []
     for cur, instr in enumerate(instrs):
         tac_proc.body.append(instr)
-        if (not _unconditional.fullmatch(instr.opcode) and \
+        if (not _unconditional(instr) and \
             cur + 1 < len(instrs) and \
             instrs[cur + 1].opcode == 'label'):
-            tac_proc.body.append(tac.Instr(None, 'jmp', (instrs[cur + 1].arg1, None)))
+            tac_proc.body.append(tac.Instr.trusted(None, 'jmp', (instrs[cur + 1].arg1, None)))
 
 def add_admin_labels(tac_proc):
     """Add labels everywhere they may be needed for basic blocks inference.
@@ -255,25 +333,25 @@ def add_admin_labels(tac_proc):
     instrs, tac_proc.body = tac_proc.body, []
     name = tac_proc.name[1:]
     admin_labels = counter(transfn=lambda x: f'%.L{name}{x}')
-    tac_proc.body.append(tac.Instr(None, 'label', (next(admin_labels), None)))
+    tac_proc.body.append(tac.Instr.trusted(None, 'label', (next(admin_labels), None)))
     cur = 0
     while cur < len(instrs):
         instr = instrs[cur]
         tac_proc.body.append(instr)
         cur += 1
-        if _jcc.fullmatch(instr.opcode):
+        if _jcc(instr):
             # skip conditional jump sequences
             while cur < len(instrs):
                 instr = instrs[cur]
-                if not _jcc.fullmatch(instr.opcode): break
+                if not _jcc(instr): break
                 tac_proc.body.append(instr)
                 cur += 1
             # skip unconditional jump
             instr = instrs[cur]
-            if _jabs.fullmatch(instr.opcode):
+            if _jabs(instr):
                 tac_proc.body.append(instr)
                 cur += 1
-            tac_proc.body.append(tac.Instr(None, 'label', (next(admin_labels), None)))
+            tac_proc.body.append(tac.Instr.trusted(None, 'label', (next(admin_labels), None)))
 
 def infer(tac_proc):
     """Return a CFG inferred from the proc"""
@@ -293,12 +371,12 @@ def infer(tac_proc):
         cur += 1
         while cur < len(tac_proc.body):
             instr = tac_proc.body[cur]
-            if _enders.fullmatch(instr.opcode): break
+            if _ender(instr): break
             bl.body.append(instr)
             cur += 1
         while cur < len(tac_proc.body):
             instr = tac_proc.body[cur]
-            if not _enders.fullmatch(instr.opcode): break
+            if not _ender(instr): break
             bl.jumps.append(instr)
             cur += 1
         blocks.append(bl)
@@ -312,7 +390,7 @@ def linearize(tac_proc, cfg):
     schedule = []
     def emit(bl):
         nonlocal schedule
-        schedule.append(tac.Instr(None, 'label', (bl.label, None)))
+        schedule.append(tac.Instr.trusted(None, 'label', (bl.label, None)))
         for instr in bl.instrs():
             schedule.append(instr)
     ret_wl = []
@@ -342,39 +420,439 @@ def filter_liveset(lab, lset):
             if x[0] == lab: yield x[1]
         else: yield x
 
+def postorder(cfg, unreachable=True):
+    """Return the labels of the blocks of `cfg' in postorder of a depth-first
+    walk from the entry block (the unreachable blocks come last, each
+    unvisited one starting a new walk, unless `unreachable' is False)"""
+    seen, order = set(), []
+    roots = [cfg.lab_entry, *(bl.label for bl in cfg.nodes())] if unreachable \
+        else [cfg.lab_entry]
+    for root in roots:
+        if root in seen or root not in cfg._blockmap: continue
+        seen.add(root)
+        stack = [(root, cfg.successors(root))]
+        while stack:
+            lab, succs = stack[-1]
+            for succ in succs:
+                if succ not in seen:
+                    seen.add(succ)
+                    stack.append((succ, cfg.successors(succ)))
+                    break
+            else:
+                stack.pop()
+                order.append(lab)
+    return order
+
+class Liveness:
+    """Liveness analysis of a cfg. The temporaries, and the (label,
+    temporary) arguments of phis, are numbered as bits of Python ints, and
+    the live sets are computed per block with a worklist, visiting the
+    blocks in postorder. The live sets of the instructions are only built
+    when looked up in the `livein' and `liveout' mappings (keyed by
+    instruction, like the dicts filled by recompute_liveness()).
+
+    The results are those of the instructions the cfg had at the time of
+    the analysis, or of the last update()."""
+
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.names = []         # bit position -> temporary, or (label, temporary)
+        self._numbers = dict()
+        self.plain = 0          # mask of the bits of the plain temporaries
+        self.phi_args = dict()  # label -> [(bit of (label, tmp), bit of tmp)]
+        self._kill_masks = dict()   # temporary -> bits of the phi arguments reading it
+        self._new_phi_args = False
+        self.blocks = dict()    # label -> (instrs, use bits, defined temps)
+        self.kills = dict()     # label -> kill bits of every instruction
+        self.gen, self.killall = dict(), dict()
+        self._where = dict()
+        for bl in cfg.nodes(): self._scan(bl)
+        for lab in self.blocks: self._gen_kill(lab)
+        self._cache = dict()    # label -> ([in bits], [out bits]) of the instructions
+        self.livein = _LiveSets(self, 0)
+        self.liveout = _LiveSets(self, 1)
+        self.live_in, self.live_out = self._solve()
+
+    def _bit(self, x):
+        n = self._numbers.get(x)
+        if n is None:
+            n = self._numbers[x] = len(self.names)
+            self.names.append(x)
+            if isinstance(x, tuple):
+                # defining a temporary kills it and the phi arguments that read it
+                lab, tmp = x
+                self._kill_masks[tmp] = self._kill_masks.get(tmp, 0) | 1 << n
+                self.phi_args.setdefault(lab, []).append((1 << n, self._bit(tmp)))
+                self._new_phi_args = True
+            else:
+                self.plain |= 1 << n
+        return 1 << n
+
+    def _scan(self, bl):
+        old = self.blocks.get(bl.label)
+        if old is not None:
+            for instr in old[0]: del self._where[instr]
+        instrs = list(bl.instrs())
+        uses = [0] * len(instrs)
+        for k, instr in enumerate(instrs):
+            for x in instr.uses(): uses[k] |= self._bit(x)
+            self._where[instr] = (bl.label, k)
+        self.blocks[bl.label] = (instrs, uses, [list(instr.defs()) for instr in instrs])
+
+    def _gen_kill(self, lab):
+        instrs, uses, defs = self.blocks[lab]
+        kills = [0] * len(instrs)
+        gen = killall = 0
+        for k in reversed(range(len(instrs))):
+            for tmp in defs[k]:
+                kills[k] |= self._kill_masks.get(tmp, 0) | self._bit(tmp)
+            gen = uses[k] | (gen & ~kills[k])
+            killall |= kills[k]
+        self.kills[lab] = kills
+        self.gen[lab], self.killall[lab] = gen, killall
+
+    def update(self, labels):
+        """Redo the analysis after the instructions of the blocks `labels'
+        changed (but not the edges of the cfg), scanning only those blocks
+        unless they read temporaries in new phi arguments"""
+        self._new_phi_args = False
+        for lab in labels: self._scan(self.cfg[lab])
+        for lab in (self.blocks if self._new_phi_args else labels):
+            self._gen_kill(lab)
+        self._cache.clear()
+        self.livein.sets.clear()
+        self.liveout.sets.clear()
+        self.live_in, self.live_out = self._solve()
+
+    def _filter(self, lab, bits):
+        """The bits live at the end of block `lab' given the bits live at the
+        start of a successor: the phi arguments become the temporaries they
+        read if they come from `lab', and are dropped otherwise"""
+        out = bits & self.plain
+        for arg_bit, tmp_bit in self.phi_args.get(lab, ()):
+            if bits & arg_bit: out |= tmp_bit
+        return out
+
+    def _through(self, lab, live_in):
+        """The bits that flow into the last instruction of block `lab'. Like
+        instr_pairs(), treat an edge from a block to itself as if it were
+        inside the block: the phi arguments flow through it unfiltered."""
+        bits = 0
+        for succ in self.cfg.successors(lab):
+            bits |= live_in[succ] if succ == lab else self._filter(lab, live_in[succ])
+        return bits
+
+    def _solve(self):
+        """Return the bits live at the start of every block, and those live
+        at its end"""
+        live_in = {lab: 0 for lab in self.blocks}
+        worklist = deque(postorder(self.cfg))
+        queued = set(worklist)
+        while worklist:
+            lab = worklist.popleft()
+            queued.discard(lab)
+            new_in = self.gen[lab] | (self._through(lab, live_in) & ~self.killall[lab])
+            if new_in != live_in[lab]:
+                live_in[lab] = new_in
+                for pred in self.cfg.predecessors(lab):
+                    if pred not in queued:
+                        queued.add(pred)
+                        worklist.append(pred)
+        live_out = dict()
+        for lab in self.blocks:
+            live_out[lab] = 0
+            for succ in self.cfg.successors(lab):
+                live_out[lab] |= self._filter(lab, live_in[succ])
+        return live_in, live_out
+
+    def _block_bits(self, lab):
+        if lab not in self._cache:
+            instrs, uses, _ = self.blocks[lab]
+            kills = self.kills[lab]
+            ins, outs = [0] * len(instrs), [0] * len(instrs)
+            live = self._through(lab, self.live_in)
+            for k in reversed(range(len(instrs))):
+                # phi arguments flow unfiltered into the previous instruction
+                # of the block, but only its own ones are live out of it
+                outs[k] = self.live_out[lab] if k == len(instrs) - 1 \
+                    else self._filter(lab, live)
+                ins[k] = live = uses[k] | (live & ~kills[k])
+            self._cache[lab] = (ins, outs)
+        return self._cache[lab]
+
+    def bits_to_set(self, bits):
+        """Return the set of temporaries whose bits are in `bits' (a phi
+        argument counts as the temporary it reads)"""
+        return {x[1] if isinstance(x, tuple) else x
+                for x, digit in zip(self.names, reversed(bin(bits))) if digit == '1'}
+
+    def is_live_out(self, instr, tmp):
+        """Return whether `tmp' is live after `instr', without building the
+        set of all the temporaries that are"""
+        n = self._numbers.get(tmp)
+        if n is None: return False
+        lab, k = self._where[instr]
+        return bool(self._block_bits(lab)[1][k] >> n & 1)
+
+class _LiveSets(Mapping):
+    """The live-in (`which' == 0) or live-out (1) sets of a Liveness, as a
+    read-only mapping from instructions to sets of temporaries"""
+
+    def __init__(self, liveness, which):
+        self.liveness = liveness
+        self.which = which
+        self.sets = dict()
+
+    def __getitem__(self, instr):
+        s = self.sets.get(instr)
+        if s is None:
+            lab, k = self.liveness._where[instr]
+            bits = self.liveness._block_bits(lab)[self.which][k]
+            s = self.sets[instr] = self.liveness.bits_to_set(bits)
+        return s
+
+    def __iter__(self):
+        return iter(self.liveness._where)
+
+    def __len__(self):
+        return len(self.liveness._where)
+
 def recompute_liveness(cfg, livein, liveout):
     """Perform liveness analysis on the given cfg, storing the results in `livein' and `liveout'.
-    Note: both `livein' and `liveout' are cleaned out before computing liveness."""
+    Note: both `livein' and `liveout' are cleaned out before computing liveness.
+    Returns the Liveness, which can also be used directly, to only build the
+    live sets that are needed."""
+    live = Liveness(cfg)
     livein.clear()
     liveout.clear()
-    # initialize livein with the use sets
-    for i in cfg.instrs():
-        livein[i] = set(i.uses())
-        liveout[i] = set()
-    dirty = True
-    
-    def update_livein(i, j_livein):
-        nonlocal dirty
-        old_count = len(livein[i])
-        old_set = str(livein[i])
-        i_defs = set(i.defs())
-        for x in j_livein:
-            if ((isinstance(x, tuple) and x[1] in i_defs) or \
-                x in i_defs): continue
-            livein[i].add(x)
-        if old_count != len(livein[i]):
-            dirty = True
-    while dirty:
-        dirty = False
-        for (li, i, lj, j) in cfg.instr_pairs(labeled=True):
-            if li == lj: update_livein(i, livein[j])
-            else: update_livein(i, filter_liveset(li, livein[j]))
-    for li, i, lj, j in cfg.instr_pairs(labeled=True):
-        liveout[i].update(filter_liveset(li, livein[j]))
-    # fix the livein sets to remove tuples
-    for i, li in livein.items():
-        livein[i] = {x[1] if isinstance(x, tuple) else x \
-                     for x in li}
+    livein.update(live.livein)
+    liveout.update(live.liveout)
+    return live
+
+# ------------------------------------------------------------------------------
+
+class DefUse:
+    """Where the temporaries of a cfg are written and read: `defs' and
+    `uses' map every temporary to a dict from the labels of the blocks to
+    the list of their instructions writing (resp. reading) it. A phi reads
+    its arguments."""
+
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.defs, self.uses = dict(), dict()
+        self._blocks = dict()   # label -> (defs, uses) of that block only
+        for bl in cfg.nodes(): self._scan(bl)
+
+    def _scan(self, bl):
+        for table, old in zip((self.defs, self.uses), self._blocks.pop(bl.label, ({}, {}))):
+            for tmp in old:
+                del table[tmp][bl.label]
+                if not table[tmp]: del table[tmp]
+        defs, uses = dict(), dict()
+        for instr in bl.instrs():
+            for tmp in instr.defs():
+                defs.setdefault(tmp, []).append(instr)
+            for x in instr.uses():
+                uses.setdefault(x[1] if isinstance(x, tuple) else x, []).append(instr)
+        for table, new in ((self.defs, defs), (self.uses, uses)):
+            for tmp, instrs in new.items():
+                table.setdefault(tmp, dict())[bl.label] = instrs
+        self._blocks[bl.label] = (defs, uses)
+
+    def update(self, labels):
+        """Redo the tables after the instructions of the blocks `labels'
+        changed"""
+        for lab in labels: self._scan(self.cfg[lab])
+
+    def def_sites(self, tmp):
+        """Iterator over the (label, instruction) pairs writing `tmp'"""
+        for lab, instrs in self.defs.get(tmp, {}).items():
+            for instr in instrs: yield (lab, instr)
+
+    def use_sites(self, tmp):
+        """Iterator over the (label, instruction) pairs reading `tmp'"""
+        for lab, instrs in self.uses.get(tmp, {}).items():
+            for instr in instrs: yield (lab, instr)
+
+class Analysis:
+    """How to compute an analysis of a cfg: `compute(cfg)' returns its
+    result, and if the analysis only depends on the nodes and edges of the
+    cfg (`structural'), it is kept when the instructions change. Otherwise,
+    if the result has an `update(labels)' method, it is called with the
+    labels of the blocks whose instructions changed instead of starting
+    over."""
+
+    def __init__(self, name, compute, structural=False):
+        self.name = name
+        self.compute = compute
+        self.structural = structural
+
+registered_analyses = dict()
+
+def register_analysis(name, compute, structural=False):
+    """Make the analysis `name' available from the AnalysisManager of every
+    cfg"""
+    registered_analyses[name] = Analysis(name, compute, structural)
+
+class AnalysisManager:
+    """The analyses of a cfg (its `analyses' attribute), computed the first
+    time they are asked for with get(), and kept until the cfg changes.
+    The results are shared, and must not be modified. `stats' counts the
+    results computed, updated and reused."""
+
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.results = dict()   # name -> (result, cfg version, {label: block version})
+        self.stats = {'computed': 0, 'updated': 0, 'reused': 0}
+
+    def _versions(self):
+        return {bl.label: bl.version for bl in self.cfg.nodes()}
+
+    def get(self, name):
+        """Return the result of the analysis `name' for the current state
+        of the cfg"""
+        analysis = registered_analyses[name]
+        cached = self.results.get(name)
+        if cached is not None and cached[1] == self.cfg.version:
+            result, _, versions = cached
+            changed = [lab for lab, v in versions.items() if self.cfg[lab].version != v]
+            if not changed or analysis.structural:
+                self.stats['reused'] += 1
+                return result
+            if hasattr(result, 'update'):
+                result.update(changed)
+                self.stats['updated'] += 1
+                self.results[name] = (result, self.cfg.version, self._versions())
+                return result
+        result = analysis.compute(self.cfg)
+        self.stats['computed'] += 1
+        self.results[name] = (result, self.cfg.version, self._versions())
+        return result
+
+    def invalidate(self, name=None):
+        """Forget the result of the analysis `name', or of all of them"""
+        if name is None: self.results.clear()
+        else: self.results.pop(name, None)
+
+register_analysis('postorder', lambda cfg: tuple(postorder(cfg)), structural=True)
+register_analysis('liveness', Liveness)
+register_analysis('defuse', DefUse)
+
+# ------------------------------------------------------------------------------
+
+class Dominators:
+    """Dominance in a cfg, computed with the algorithm of Cooper, Harvey
+    and Kennedy ("A Simple, Fast Dominance Algorithm") on the reverse
+    postorder of the blocks reachable from the entry. The unreachable
+    blocks are not in any of the tables, and neither dominate nor are
+    dominated by anything.
+
+    `idom' maps every block to its immediate dominator (None for the entry),
+    `children' to its children in the dominator tree, and `frontier' to its
+    dominance frontier. dominates() takes constant time, using the interval
+    of every block in a depth-first walk of the dominator tree."""
+
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.rpo = postorder(cfg, unreachable=False)
+        self.rpo.reverse()
+        number = {lab: k for k, lab in enumerate(self.rpo)}
+        preds = [[number[p] for p in cfg.predecessors(lab) if p in number]
+                 for lab in self.rpo]
+        idom = [None] * len(self.rpo)
+        idom[0] = 0
+        changed = True
+        while changed:
+            changed = False
+            for b in range(1, len(self.rpo)):
+                new = None
+                for p in preds[b]:
+                    if idom[p] is None: continue
+                    if new is None:
+                        new = p
+                        continue
+                    # walk up from both to their nearest common dominator
+                    while p != new:
+                        while p > new: p = idom[p]
+                        while new > p: new = idom[new]
+                if idom[b] != new:
+                    idom[b] = new
+                    changed = True
+        self.idom = {lab: self.rpo[idom[k]] if k else None for k, lab in enumerate(self.rpo)}
+        self.children = {lab: [] for lab in self.rpo}
+        for lab in self.rpo[1:]:
+            self.children[self.idom[lab]].append(lab)
+        # interval numbering of the dominator tree
+        self._pre, self._post = dict(), dict()
+        clock = 0
+        stack = [(self.rpo[0], iter(self.children[self.rpo[0]]))] if self.rpo else []
+        if stack: self._pre[self.rpo[0]] = clock
+        while stack:
+            lab, kids = stack[-1]
+            kid = next(kids, None)
+            clock += 1
+            if kid is None:
+                self._post[lab] = clock
+                stack.pop()
+            else:
+                self._pre[kid] = clock
+                stack.append((kid, iter(self.children[kid])))
+        self.frontier = {lab: set() for lab in self.rpo}
+        for k, lab in enumerate(self.rpo):
+            # the entry is also reached from outside the proc
+            if len(preds[k]) < 2 and k: continue
+            stop = idom[k] if k else None
+            for p in preds[k]:
+                while p != stop:
+                    self.frontier[self.rpo[p]].add(lab)
+                    p = idom[p] if p else None
+
+    def dominates(self, lab_a, lab_b):
+        """Return whether block `lab_a' dominates block `lab_b'"""
+        if lab_a not in self._pre or lab_b not in self._pre: return False
+        return self._pre[lab_a] <= self._pre[lab_b] and self._post[lab_b] <= self._post[lab_a]
+
+    def strictly_dominates(self, lab_a, lab_b):
+        return lab_a != lab_b and self.dominates(lab_a, lab_b)
+
+    def dominators(self, lab):
+        """Iterator over the dominators of block `lab', from itself up to the
+        entry"""
+        while lab is not None:
+            yield lab
+            lab = self.idom[lab]
+
+    def iterated_frontier(self, labs):
+        """Return the iterated dominance frontier of the blocks `labs'"""
+        result, worklist = set(), [lab for lab in labs if lab in self.frontier]
+        while worklist:
+            for lab in self.frontier[worklist.pop()]:
+                if lab not in result:
+                    result.add(lab)
+                    worklist.append(lab)
+        return result
+
+def natural_loops(cfg):
+    """Return a dict from the headers of the natural loops of `cfg' to the
+    set of the labels of the blocks in the loop: a block `h' heads a loop
+    if it dominates a predecessor, and the loop is made of the reachable
+    blocks that reach that predecessor without going through `h'"""
+    dom = cfg.analyses.get('dominators')
+    loops = dict()
+    for h in dom.rpo:
+        for lab in cfg.predecessors(h):
+            if not dom.dominates(h, lab): continue
+            body = loops.setdefault(h, {h})
+            worklist = [lab]
+            while worklist:
+                b = worklist.pop()
+                if b in body or b not in dom.idom: continue
+                body.add(b)
+                worklist.extend(cfg.predecessors(b))
+    return loops
+
+register_analysis('dominators', Dominators, structural=True)
+register_analysis('loops', natural_loops, structural=True)
 
 # ------------------------------------------------------------------------------
 
@@ -385,15 +863,40 @@ if __name__ == '__main__':
     ap.add_argument('file', metavar='FILE', type=str, nargs=1, help='A TAC file')
     ap.add_argument('-v', dest='verbosity', default=0, action='count',
                     help='increase verbosity')
+    ap.add_argument('--heat', dest='heat', action='store_true', default=False,
+                    help='Run the program first and write the CFGs as .dot '
+                    'files with the blocks annotated by their execution profile')
+    ap.add_argument('--dom', dest='dom', action='store_true', default=False,
+                    help='Print the immediate dominator and the dominance '
+                    'frontier of every reachable block')
     args = ap.parse_args()
     gvars, procs = dict(), dict()
-    for tlv in tac.load_tac(args.file[0]):
+    profile = None
+    if args.heat:
+        prog = tac.load_tac(args.file[0])
+        for tlv in prog:
+            if isinstance(tlv, tac.Proc): procs[tlv.name] = tlv
+            else: gvars[tlv.name] = tlv
+        profile = tac.Profile()
+        tac.execute(gvars, procs, '@main', (), engine='threaded', profile=profile)
+    else:
+        # one proc at a time, without keeping the whole program in memory
+        prog = tac.iter_tac(args.file[0])
+    for tlv in prog:
         if isinstance(tlv, tac.Proc):
+            heat = profile.instr_heat(tlv.name) \
+                if profile and tlv.name in profile.procs else None
             cfg = infer(tlv)
+            if heat is not None: cfg.write_dot(args.file[0], heat=heat)
             # Uncomment these two lines to have it generate a PDF of the CFG
             #   (Requires the graphviz toolkit: https://graphviz.org)
             # cfg.write_dot(args.file[0])
             # os.system(f'dot -Tpdf -O {args.file[0]}.{tlv.name[1:]}.dot')
+            if args.dom:
+                dom = cfg.analyses.get('dominators')
+                for lab in dom.rpo:
+                    print(f'{tlv.name} {lab}: idom {dom.idom[lab]}, '
+                          f'frontier {{{", ".join(sorted(dom.frontier[lab]))}}}')
             if args.verbosity > 0:
                 linearize(tlv, cfg)
                 print(tlv)
@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+
+"""
+Dataflow analyses on control flow graphs
+
+A Problem describes an analysis: its direction, its value at the boundary
+(flowing into the entry block for forward problems, out of the exit blocks
+for backward ones), its initial value everywhere else, how the values
+coming along several edges are joined, and how a block transforms a value.
+solve() computes the fixed point with a worklist of blocks, taken in
+reverse postorder for forward problems and in postorder for backward ones,
+and counts the work it took.
+"""
+
+import tac
+import cfg as cfglib
+import heapq
+
+# ------------------------------------------------------------------------------
+
+class Problem:
+    """Base class of the dataflow problems on a given cfg.
+
+    Subclasses set `forward', and define boundary(), top(), join() and
+    either transfer_instr() or, to transform whole blocks at once,
+    transfer(). The values must be compared with == and never modified in
+    place, as they are shared between blocks. `proc' is the tac.Proc of the
+    cfg, for the problems that need to know its arguments."""
+
+    forward = True
+
+    def __init__(self, cfg, proc=None):
+        self.cfg = cfg
+        self.proc = proc
+
+    def boundary(self):
+        """Return the value flowing into the entry block (forward) or out of
+        the exit blocks (backward)"""
+        raise NotImplementedError
+
+    def top(self):
+        """Return the initial value of the blocks, which must be an identity
+        of join()"""
+        raise NotImplementedError
+
+    def join(self, values):
+        """Return the join of the (non-empty) list of `values'"""
+        raise NotImplementedError
+
+    def edge(self, lab_from, lab_to, value):
+        """Return the value carried along the edge from block `lab_from' to
+        block `lab_to', `value' being the one at the end of `lab_from'
+        (forward) or at the start of `lab_to' (backward). The boundary
+        value of a forward problem comes along an edge from the proc name."""
+        return value
+
+    def transfer_instr(self, instr, value):
+        """Return the value after (forward) or before (backward) `instr'"""
+        raise NotImplementedError
+
+    def transfer(self, block, value):
+        """Return the value at the end (forward) or start (backward) of
+        `block', given the one at its other end"""
+        instrs = block.instrs() if self.forward else block.reversed_instrs()
+        for instr in instrs:
+            value = self.transfer_instr(instr, value)
+        return value
+
+class GenKillProblem(Problem):
+    """Problems on sets of facts whose transfer functions are of the form
+    gen | (value - kill). Subclasses define gen_instr() and kill_instr(),
+    which are composed once per block."""
+
+    def __init__(self, cfg, proc=None):
+        super().__init__(cfg, proc)
+        self.gen, self.kill = dict(), dict()
+        for bl in cfg.nodes():
+            gen, kill = frozenset(), frozenset()
+            instrs = bl.instrs() if self.forward else bl.reversed_instrs()
+            for instr in instrs:
+                k = self.kill_instr(instr)
+                gen = self.gen_instr(instr) | (gen - k)
+                kill = kill | k
+            self.gen[bl.label], self.kill[bl.label] = gen, kill
+
+    def gen_instr(self, instr):
+        raise NotImplementedError
+
+    def kill_instr(self, instr):
+        raise NotImplementedError
+
+    def transfer_instr(self, instr, value):
+        return self.gen_instr(instr) | (value - self.kill_instr(instr))
+
+    def transfer(self, block, value):
+        return self.gen[block.label] | (value - self.kill[block.label])
+
+# ------------------------------------------------------------------------------
+
+class Stats:
+    """How much work solve() did: the number of blocks, of transfers of a
+    block (`visits'), of those that changed its value, of passes over all
+    the blocks (for sweeps), the longest worklist, and whether a fixed point
+    was reached"""
+
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self.visits = 0
+        self.changes = 0
+        self.passes = 0
+        self.max_worklist = 0
+        self.converged = False
+
+    def __str__(self):
+        per_block = self.visits / self.blocks if self.blocks else 0
+        return (f'{self.blocks} blocks, {self.visits} visits ({per_block:.2f} per block), '
+                f'{self.changes} changes, {self.passes} passes, '
+                f'worklist <= {self.max_worklist}'
+                f'{"" if self.converged else ", NOT CONVERGED"}')
+
+class Result:
+    """The solution of a Problem: `ins' and `outs' map the label of every
+    block to the value at its start and at its end, in the order of the
+    control flow whatever the direction of the problem"""
+
+    def __init__(self, problem, ins, outs, stats):
+        self.problem = problem
+        self.ins = ins
+        self.outs = outs
+        self.stats = stats
+
+    def instr_values(self, lab):
+        """Return the list of (instr, value before it, value after it) of
+        block `lab', obtained by running transfer_instr() again over it"""
+        problem, block = self.problem, self.problem.cfg[lab]
+        if problem.forward:
+            value, triples = self.ins[lab], []
+            for instr in block.instrs():
+                after = problem.transfer_instr(instr, value)
+                triples.append((instr, value, after))
+                value = after
+            return triples
+        value, triples = self.outs[lab], []
+        for instr in block.reversed_instrs():
+            before = problem.transfer_instr(instr, value)
+            triples.append((instr, before, value))
+            value = before
+        triples.reverse()
+        return triples
+
+def solve(problem, sweep=False, limit=None):
+    """Compute the fixed point of `problem' and return it as a Result.
+
+    The blocks are taken in reverse postorder (forward problems) or in
+    postorder (backward problems). By default a block is only transformed
+    again when one of its inputs changed, taking the first one in that
+    order every time; with `sweep', all the blocks are transformed in every
+    pass until a pass changes nothing. At most `limit' transfers are done."""
+    cfg = problem.cfg
+    order = list(cfg.analyses.get('postorder'))
+    if problem.forward:
+        order.reverse()
+        inputs, dependents = cfg.predecessors, cfg.successors
+    else:
+        inputs, dependents = cfg.successors, cfg.predecessors
+    stats = Stats(len(order))
+    boundary, top = problem.boundary(), problem.top()
+    # `outs' is on the far side of the blocks in the direction of the problem
+    outs = {lab: top for lab in order}
+
+    def incoming(lab):
+        if problem.forward:
+            values = [problem.edge(p, lab, outs[p]) for p in inputs(lab)]
+            if lab == cfg.lab_entry:
+                values.append(problem.edge(cfg.proc_name, lab, boundary))
+        else:
+            values = [problem.edge(lab, s, outs[s]) for s in inputs(lab)]
+            if not values: values.append(boundary)
+        return problem.join(values) if values else top
+
+    def visit(lab):
+        stats.visits += 1
+        out = problem.transfer(cfg[lab], incoming(lab))
+        if out == outs[lab]: return False
+        outs[lab] = out
+        stats.changes += 1
+        return True
+
+    if sweep:
+        changed = True
+        while changed and (limit is None or stats.visits < limit):
+            stats.passes += 1
+            changed = False
+            for lab in order:
+                if limit is not None and stats.visits >= limit: break
+                if visit(lab): changed = True
+        stats.converged = not changed
+    else:
+        rank = {lab: k for k, lab in enumerate(order)}
+        worklist = list(range(len(order)))
+        queued = set(order)
+        while worklist and (limit is None or stats.visits < limit):
+            stats.max_worklist = max(stats.max_worklist, len(worklist))
+            lab = order[heapq.heappop(worklist)]
+            queued.discard(lab)
+            if visit(lab):
+                for dep in dependents(lab):
+                    if dep not in queued:
+                        queued.add(dep)
+                        heapq.heappush(worklist, rank[dep])
+        stats.converged = not worklist
+        stats.passes = 1
+
+    ins = {lab: incoming(lab) for lab in order}
+    if problem.forward: return Result(problem, ins, outs, stats)
+    return Result(problem, outs, ins, stats)
+
+# ------------------------------------------------------------------------------
+
+class LiveVariables(GenKillProblem):
+    """Backward: the temporaries that may be read before being written. A
+    phi reads its argument for a label at the end of that block."""
+
+    forward = False
+
+    def __init__(self, cfg, proc=None):
+        self.phi_uses = dict()  # (lab_from, lab_to) -> temporaries
+        for bl in cfg.nodes():
+            for instr in bl.instrs():
+                if instr.opcode != 'phi': continue
+                for lab, tmp in instr.arg1.items():
+                    if tac.Instr._istemp(tmp):
+                        key = (lab, bl.label)
+                        self.phi_uses[key] = self.phi_uses.get(key, frozenset()) | {tmp}
+        super().__init__(cfg, proc)
+
+    def boundary(self):
+        return frozenset()
+
+    def top(self):
+        return frozenset()
+
+    def join(self, values):
+        return frozenset().union(*values)
+
+    def edge(self, lab_from, lab_to, value):
+        return value | self.phi_uses.get((lab_from, lab_to), frozenset())
+
+    def gen_instr(self, instr):
+        return frozenset(x for x in instr.uses() if not isinstance(x, tuple))
+
+    def kill_instr(self, instr):
+        return frozenset(instr.defs())
+
+class ReachingDefinitions(GenKillProblem):
+    """Forward: the instructions whose definition of a temporary may reach a
+    point without that temporary being written again"""
+
+    def __init__(self, cfg, proc=None):
+        self.defs_of = dict()   # temporary -> instructions writing it
+        for instr in cfg.instrs():
+            for tmp in instr.defs():
+                self.defs_of.setdefault(tmp, set()).add(instr)
+        self.defs_of = {tmp: frozenset(s) for tmp, s in self.defs_of.items()}
+        super().__init__(cfg, proc)
+
+    def boundary(self):
+        return frozenset()
+
+    def top(self):
+        return frozenset()
+
+    def join(self, values):
+        return frozenset().union(*values)
+
+    def gen_instr(self, instr):
+        return frozenset([instr]) if instr.dest in self.defs_of else frozenset()
+
+    def kill_instr(self, instr):
+        return frozenset().union(*(self.defs_of[tmp] for tmp in instr.defs()))
+
+def expression(instr):
+    """Return the expression computed by `instr', as a tuple (opcode, arg1,
+    arg2) with the arguments of commutative opcodes sorted, or None if it is
+    not a pure operation on its arguments"""
+    info = tac.opcode_info.get(instr.opcode)
+    if info is None or info.eval is None or not info.flags & tac.OP_DEFS_DEST \
+       or info.flags & tac.OP_SIDE_EFFECTS:
+        return None
+    arg1, arg2 = instr.arg1, instr.arg2
+    if info.flags & tac.OP_COMMUTATIVE and arg2 < arg1:
+        arg1, arg2 = arg2, arg1
+    return (instr.opcode, arg1, arg2)
+
+class AvailableExpressions(GenKillProblem):
+    """Forward: the expressions (see expression()) computed on every path to
+    a point without any of their arguments being written since. Calls may
+    write the globals."""
+
+    def __init__(self, cfg, proc=None):
+        self.exprs_of = dict()  # temporary or global -> expressions reading it
+        self.global_exprs = set()
+        self.universe = set()
+        for instr in cfg.instrs():
+            e = expression(instr)
+            if e is None: continue
+            self.universe.add(e)
+            for arg in e[1:]:
+                if arg is None: continue
+                self.exprs_of.setdefault(arg, set()).add(e)
+                if arg.startswith('@'): self.global_exprs.add(e)
+        self.universe = frozenset(self.universe)
+        self.global_exprs = frozenset(self.global_exprs)
+        self.exprs_of = {x: frozenset(s) for x, s in self.exprs_of.items()}
+        super().__init__(cfg, proc)
+
+    def boundary(self):
+        return frozenset()
+
+    def top(self):
+        return self.universe
+
+    def join(self, values):
+        return frozenset.intersection(*values)
+
+    def gen_instr(self, instr):
+        e = expression(instr)
+        if e is None or instr.dest in e[1:]: return frozenset()
+        return frozenset([e])
+
+    def kill_instr(self, instr):
+        kill = self.exprs_of.get(instr.dest, frozenset())
+        if instr.opcode == 'call': kill = kill | self.global_exprs
+        return kill
+
+# ------------------------------------------------------------------------------
+
+class NotAConstant:
+    """The value of a temporary that may hold several values"""
+
+    def __repr__(self):
+        return 'NAC'
+
+NAC = NotAConstant()
+
+class ConstantPropagation(Problem):
+    """Forward: the temporaries known to hold a constant (a 64-bit word, as
+    in tac.execute()), or NAC. The values are dicts from temporaries to
+    these, and None is the value of the blocks not reached yet. The
+    arguments of the proc are NAC at its entry, and a temporary absent from
+    a value, such as a global or one not written on some path, is NAC."""
+
+    def __init__(self, cfg, proc):
+        super().__init__(cfg, proc)
+
+    def boundary(self):
+        return {tmp: NAC for tmp in self.proc.t_args}
+
+    def top(self):
+        return None
+
+    def join(self, values):
+        values = [v for v in values if v is not None]
+        if not values: return None
+        joined = dict(values[0])
+        for value in values[1:]:
+            for tmp in joined.keys() - value.keys(): joined[tmp] = NAC
+            for tmp, k in value.items():
+                joined[tmp] = k if joined.get(tmp, NAC) == k else NAC
+        return joined
+
+    def edge(self, lab_from, lab_to, value):
+        if value is None: return None
+        phis = [instr for instr in self.cfg[lab_to].body if instr.opcode == 'phi']
+        if not phis: return value
+        value = dict(value)
+        for instr in phis:
+            if lab_from in instr.arg1:
+                value[instr.dest] = self.arg_value(value, instr.arg1[lab_from])
+        return value
+
+    @staticmethod
+    def arg_value(value, arg):
+        if isinstance(arg, int): return tac.twoc(arg)
+        if tac.Instr._istemp(arg): return value.get(arg, NAC)
+        return NAC
+
+    def transfer_instr(self, instr, value):
+        if value is None or instr.opcode == 'phi': return value
+        dests = list(instr.defs())
+        if not dests: return value
+        value = dict(value)
+        value[dests[0]] = self.evaluate(instr, value)
+        return value
+
+    def evaluate(self, instr, value):
+        """Return the constant written by `instr', or NAC"""
+        if instr.opcode in ('const', 'copy'):
+            return self.arg_value(value, instr.arg1)
+        info = tac.opcode_info.get(instr.opcode)
+        if info is None or info.eval is None or instr.opcode == 'call':
+            return NAC
+        args = [self.arg_value(value, instr.arg1)]
+        if instr.opcode in tac.binops: args.append(self.arg_value(value, instr.arg2))
+        if any(k is NAC for k in args): return NAC
+        # the interpreter would build a huge int, or fail, for these
+        if instr.opcode in ('shl', 'shr') and not 0 <= tac.untwoc(args[1]) < tac.word_bits:
+            return NAC
+        try: return info.eval(*args)
+        except (ZeroDivisionError, ValueError): return NAC
+
+analyses = {
+    'live': LiveVariables,
+    'reaching': ReachingDefinitions,
+    'available': AvailableExpressions,
+    'constants': ConstantPropagation,
+}
+
+# ------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    ap = ArgumentParser(description='Dataflow analyses of TAC procs')
+    ap.add_argument('fname', metavar='FILE', type=str, nargs=1,
+                    help='A TAC file')
+    ap.add_argument('--analysis', dest='analyses', action='append',
+                    choices=list(analyses),
+                    help='Run this analysis (default: all of them)')
+    ap.add_argument('--sweep', dest='sweep', action='store_true', default=False,
+                    help='Also solve with full sweeps, to compare the work done')
+    ap.add_argument('-v', dest='verbosity', default=0, action='count',
+                    help='Print the values at the start and end of every block')
+    args = ap.parse_args()
+    for tlv in tac.iter_tac(args.fname[0]):
+        if not isinstance(tlv, tac.Proc): continue
+        cfg = cfglib.infer(tlv)
+        for name in args.analyses or analyses:
+            problem = analyses[name](cfg, tlv)
+            result = solve(problem)
+            print(f'{tlv.name} {name}: {result.stats}')
+            if args.sweep:
+                print(f'{tlv.name} {name} (sweeps): {solve(problem, sweep=True).stats}')
+            if args.verbosity >= 1:
+                for bl in cfg.nodes():
+                    print(f'  {bl.label}: in {result.ins[bl.label]}')
+                    print(f'  {" " * len(bl.label)}  out {result.outs[bl.label]}')
@@ -2,69 +2,70 @@
 
 import tac
 import cfg as cfglib
-import re, random, os
+import random, os
 
 # ------------------------------------------------------------------------------
 # liveness
 
-_arg1_use = re.compile(r'add|sub|mul|div|mod|neg|and|or|xor|not|shl|shr|copy|ret|jz|jnz|jl|jle|jnl|jnle')
-_arg2_use = re.compile(r'add|sub|mul|div|mod|and|or|xor|shl|shr|param')
-_dest_def = re.compile(r'add|sub|mul|div|mod|neg|and|or|xor|not|shl|shr|const|copy|phi|call')
-
 def use_set(instr):
     s = set()
-    if _arg1_use.fullmatch(instr.opcode) and instr.arg1: s.add(instr.arg1)
-    if _arg2_use.fullmatch(instr.opcode) and instr.arg2: s.add(instr.arg2)
+    flags = tac.opcode_flags[instr.opcode]
+    if flags & tac.OP_USES_ARG1 and instr.arg1: s.add(instr.arg1)
+    if flags & tac.OP_USES_ARG2 and instr.arg2: s.add(instr.arg2)
     if instr.opcode == 'phi': s.update(instr.arg1.values())
     return s
 
 def rewrite_use_temps_nonphi(instr, fn):
-    if _arg1_use.fullmatch(instr.opcode) and instr.arg1:
+    flags = tac.opcode_flags[instr.opcode]
+    if flags & tac.OP_USES_ARG1 and instr.arg1:
         instr.arg1 = fn(instr.arg1)
-    if _arg2_use.fullmatch(instr.opcode) and instr.arg2:
+    if flags & tac.OP_USES_ARG2 and instr.arg2:
         instr.arg2 = fn(instr.arg2)
 
 def def_set(instr):
     s = set()
-    if _dest_def.fullmatch(instr.opcode) and instr.dest: s.add(instr.dest)
+    if tac.opcode_flags[instr.opcode] & tac.OP_DEFS_DEST and instr.dest:
+        s.add(instr.dest)
     return s
 
 def rewrite_temps(instr, fn):
-    if _arg1_use.fullmatch(instr.opcode) and instr.arg1:
+    flags = tac.opcode_flags[instr.opcode]
+    if flags & tac.OP_USES_ARG1 and instr.arg1:
         instr.arg1 = fn(instr.arg1)
-    if _arg2_use.fullmatch(instr.opcode) and instr.arg2:
+    if flags & tac.OP_USES_ARG2 and instr.arg2:
         instr.arg2 = fn(instr.arg2)
     if instr.opcode == 'phi':
         for l, t in instr.arg1.items():
             instr.arg1[l] = fn(t)
-    if _dest_def.fullmatch(instr.opcode) and instr.dest:
+    if flags & tac.OP_DEFS_DEST and instr.dest:
         instr.dest = fn(instr.dest)
 
 # ------------------------------------------------------------------------------
 # crude SSA gen
 
 def tmp_root(tmp):
+    if isinstance(tmp, tac.Version): return tmp.root
     try: return tmp[:tmp.rindex('.')]
     except ValueError: return tmp
 
 def tmp_version(tmp):
+    if isinstance(tmp, tac.Version): return str(tmp.version)
     try: return tmp[tmp.rindex('.')+1:]
     except ValueError: return ''
 
 def crude_ssagen(tlv, cfg):
-    livein, liveout = dict(), dict()
-    cfglib.recompute_liveness(cfg, livein, liveout)
+    livein = cfg.analyses.get('liveness').livein
     for bl in cfg.nodes():
         prev_labs = list(cfg.predecessors(bl.label))
         ts = livein[bl.first_instr()]
         if bl.label == cfg.lab_entry: prev_labs.append(cfg.proc_name)
         if len(prev_labs) == 0: prev_labs = [cfg.proc_name]
-        bl.body[:0] = [tac.Instr(t, 'phi', ({l: t for l in prev_labs}, None)) \
+        bl.body[:0] = [tac.Instr.trusted(t, 'phi', ({l: t for l in prev_labs}, None)) \
                        for t in ts]
-    versions = cfglib.counter(transfn=lambda x: f'.{x}')
+    versions = cfglib.counter()
     for i in cfg.instrs():
         if i.dest and i.dest.startswith('%'):
-            i.dest = i.dest + next(versions)
+            i.dest = tlv.symbols.version(i.dest, next(versions))
     ver_maps = {cfg.proc_name: {t: t for t in tlv.t_args}}
     for bl in cfg.nodes():
         ver_map = dict()
@@ -73,22 +74,106 @@ def crude_ssagen(tlv, cfg):
             if instr.dest:
                 ver_map[tmp_root(instr.dest)] = instr.dest
         ver_maps[bl.label] = ver_map
+        bl.touch()
     for bl in cfg.nodes():
         for instr in bl.instrs():
             if instr.opcode != 'phi': continue
             for lab_prev, root in instr.arg1.items():
                 instr.arg1[lab_prev] = ver_maps[lab_prev].get(root, root)
 
+# ------------------------------------------------------------------------------
+# pruned SSA gen
+
+def pruned_ssagen(tlv, cfg):
+    """Put `cfg' (of the proc `tlv') in SSA form: a temporary only gets a
+    phi at the iterated dominance frontier of the blocks writing it, and
+    only if it is live there; then the temporaries are renamed in a walk of
+    the dominator tree (Cytron et al., pruned by liveness)."""
+    dom = cfg.analyses.get('dominators')
+    livein = cfg.analyses.get('liveness').livein
+    # the entry defines the arguments, and the other temporaries as undefined
+    defsites = dict()
+    for bl in cfg.nodes():
+        for instr in bl.instrs():
+            if instr.dest and instr.dest.startswith('%'):
+                defsites.setdefault(instr.dest, {cfg.lab_entry}).add(bl.label)
+    new_phis = dict()   # label -> [phi]
+    for root, labs in defsites.items():
+        for lab in dom.iterated_frontier(labs):
+            if root not in livein[cfg[lab].first_instr()]: continue
+            prev_labs = list(cfg.predecessors(lab))
+            if lab == cfg.lab_entry: prev_labs.append(cfg.proc_name)
+            phi = tac.Instr.trusted(root, 'phi', ({l: root for l in prev_labs}, None))
+            new_phis.setdefault(lab, []).append(phi)
+    for lab, lab_phis in new_phis.items():
+        cfg[lab].body[:0] = lab_phis
+    # these and the phis already there read the temporaries by their root
+    phis = {bl.label: [instr for instr in bl.instrs() if instr.opcode == 'phi']
+            for bl in cfg.nodes()}
+    versions = cfglib.counter()
+    stacks = {t: [t] for t in tlv.t_args}
+    def current(t):
+        stack = stacks.get(t)
+        return stack[-1] if stack else t
+    def rename(lab):
+        """Rename the temporaries of block `lab' and the phi arguments
+        coming from it; return the temporaries given new versions"""
+        pushed = []
+        bl = cfg[lab]
+        for instr in bl.instrs():
+            if instr.opcode != 'phi':
+                rewrite_use_temps_nonphi(instr, current)
+            if instr.dest and instr.dest.startswith('%'):
+                root = instr.dest
+                instr.dest = tlv.symbols.version(root, next(versions))
+                stacks.setdefault(root, []).append(instr.dest)
+                pushed.append(root)
+        for lab_next in cfg.successors(lab):
+            for phi in phis[lab_next]:
+                if lab in phi.arg1: phi.arg1[lab] = current(phi.arg1[lab])
+        bl.touch()
+        return pushed
+    # the lists of the temporaries to pop mark the ends of the subtrees
+    work = [cfg.lab_entry] if dom.rpo else []
+    while work:
+        item = work.pop()
+        if isinstance(item, list):
+            for root in item: stacks[root].pop()
+            continue
+        work.append(rename(item))
+        work.extend(reversed(dom.children[item]))
+    # the unreachable blocks only see the arguments
+    for bl in cfg.nodes():
+        if bl.label not in dom.idom:
+            for root in rename(bl.label): stacks[root].pop()
+
+def count_phis(cfg):
+    return sum(1 for instr in cfg.instrs() if instr.opcode == 'phi')
+
+def compare_ssagen(tlv):
+    """Put copies of the proc `tlv' in SSA form with crude_ssagen() and
+    with pruned_ssagen(), and return a dict from their names to the
+    number of phis they insert and the time they take (including the
+    analyses they need)"""
+    import time
+    report = dict()
+    for ssagen in (crude_ssagen, pruned_ssagen):
+        copy = tac.Proc.load(tlv.js_obj, tlv.symbols)
+        cfg = cfglib.infer(copy)
+        start = time.perf_counter()
+        ssagen(copy, cfg)
+        report[ssagen.__name__] = (count_phis(cfg), time.perf_counter() - start)
+    return report
+
 # ------------------------------------------------------------------------------
 
 def make_dotfiles(cfg, procname, fname, verbosity):
     if fname.endswith('.tac.json'): fname = fname[:-5]
     kwargs = dict()
     if verbosity >= 1:
-        livein, liveout = dict(), dict()
-        cfglib.recompute_liveness(cfg, livein, liveout)
-        kwargs['livein'] = livein
-        kwargs['liveout'] = liveout
+        live = cfg.analyses.get('liveness')
+        kwargs['livein'] = live.livein
+        kwargs['liveout'] = live.liveout
     cfg.write_dot(fname, **kwargs)
     os.system(f'dot -Tpdf -O {fname}.{procname}.dot')
 
@@ -99,13 +184,31 @@ if __name__ == '__main__':
     ap.add_argument('file', metavar='FILE', type=str, nargs=1, help='A TAC file')
     ap.add_argument('-v', dest='verbosity', default=0, action='count',
                     help='increase verbosity')
+    ap.add_argument('--crude', dest='crude', action='store_true', default=False,
+                    help='Use the crude SSA generation (a phi for every live '
+                    'temporary at the start of every block)')
+    ap.add_argument('--compare', dest='compare', action='store_true', default=False,
+                    help='Only print the number of phis and the time of the '
+                    'crude and the pruned SSA generation of every proc')
     args = ap.parse_args()
     gvars, procs = dict(), dict()
-    for tlv in tac.load_tac(args.file[0]):
-        if isinstance(tlv, tac.Proc):
+    totals = {'crude_ssagen': [0, 0.0], 'pruned_ssagen': [0, 0.0]}
+    for tlv in tac.iter_tac(args.file[0]):
+        if isinstance(tlv, tac.Proc) and args.compare:
+            report = compare_ssagen(tlv)
+            print(tlv.name + ''.join(f'  {name}: {phis} phis, {elapsed:.4f}s'
+                                     for name, (phis, elapsed) in report.items()))
+            for name, (phis, elapsed) in report.items():
+                totals[name][0] += phis
+                totals[name][1] += elapsed
+        elif isinstance(tlv, tac.Proc):
             cfg = cfglib.infer(tlv)
-            crude_ssagen(tlv, cfg)
+            if args.crude: crude_ssagen(tlv, cfg)
+            else: pruned_ssagen(tlv, cfg)
             make_dotfiles(cfg, tlv.name[1:], args.file[0], args.verbosity)
             if args.verbosity >= 2:
                 cfglib.linearize(tlv, cfg)
                 print(tlv)
+    if args.compare:
+        print('total' + ''.join(f'  {name}: {phis} phis, {elapsed:.4f}s'
+                                for name, (phis, elapsed) in totals.items()))
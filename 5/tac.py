@@ -7,6 +7,10 @@ Also includes a parser and interpreter.
 """
 
 from io import StringIO
+import os, sys
+
+# Also check the instructions created with Instr.trusted()
+debug = bool(os.environ.get('TAC_DEBUG'))
 
 # ------------------------------------------------------------------------------
 
@@ -39,6 +43,19 @@ class Instr:
         self.arg2 = None if len(args) < 2 else args[1]
         self._check()
 
+    @staticmethod
+    def trusted(dest, opcode, args):
+        """Create a new TAC instruction like Instr(), but without checking
+        it: for passes that only build instructions known to be well-formed.
+        Use Proc.check() to check a whole proc at once instead."""
+        instr = Instr.__new__(Instr)
+        instr.dest = dest
+        instr.opcode = opcode
+        instr.arg1 = None if len(args) < 1 else args[0]
+        instr.arg2 = None if len(args) < 2 else args[1]
+        if debug: instr._check()
+        return instr
+
     def __hash__(self):
         return hash(id(self))
 
@@ -97,24 +114,19 @@ class Instr:
         return f'Instr.load({self.js_obj})'
 
     def __str__(self):
-        result = StringIO()
-        if self.opcode == 'label':
-            result.write(f'{self.arg1}:')
-        elif self.opcode == 'phi':
-            result.write(f'  {self.dest} = phi(')
-            result.write(', '.join(f'{lab}:{tmp}' for lab, tmp in self.arg1.items()))
-            result.write(');')
-        else:
-            result.write('  ')
-            if self.dest != None:
-                result.write(f'{self.dest} = ')
-            result.write(f'{self.opcode}')
-            if self.arg1 != None:
-                result.write(f' {self.arg1}')
-                if self.arg2 != None:
-                    result.write(f', {self.arg2}')
-            result.write(';')
-        return result.getvalue()
+        return self.text(self.dest, self.opcode, self.arg1, self.arg2)
+
+    @staticmethod
+    def text(dest, opcode, arg1, arg2):
+        """Return the .tac form of the instruction with these fields"""
+        if opcode == 'label':
+            return f'{arg1}:'
+        if opcode == 'phi':
+            return f'  {dest} = phi({", ".join(f"{lab}:{tmp}" for lab, tmp in arg1.items())});'
+        lhs = '' if dest is None else f'{dest} = '
+        if arg1 is None: return f'  {lhs}{opcode};'
+        if arg2 is None: return f'  {lhs}{opcode} {arg1};'
+        return f'  {lhs}{opcode} {arg1}, {arg2};'
 
     @staticmethod
     def _istemp(thing):
@@ -152,12 +164,15 @@ class Instr:
             for l, t in self.arg1.items(): self.arg1[l] = lookup(t)
 
     @staticmethod
-    def load(js_obj):
+    def load(js_obj, check=True):
+        """Create the Instr of `js_obj'; with check=False, as Instr.trusted()
+        does, for loaders that check the whole proc afterwards"""
         opcode = js_obj.get('opcode', None)
         assert opcode is not None
         args = js_obj.get('args', ())
         result = js_obj.get('result', None)
-        return Instr(result, opcode, args)
+        if check: return Instr(result, opcode, args)
+        return Instr.trusted(result, opcode, args)
 
     @property
     def js_obj(self):
@@ -166,28 +181,104 @@ class Instr:
                 'args': (self.arg1, self.arg2),
                 'result': self.dest}
 
+class ProcInfo:
+    """Facts about a Proc body that the interpreters need on every call"""
+
+    def __init__(self, proc):
+        body = proc.body
+        if isinstance(body, ColumnarBody): opcodes = body.opcode_names()
+        else: opcodes = [instr.opcode for instr in body]
+        self.labels = dict()    # label -> index of the instruction after it
+        for i, opcode in enumerate(opcodes):
+            if opcode != 'label': continue
+            label = body[i].arg1
+            if label in self.labels:
+                raise RuntimeError(f'Reused label {label}')
+            ni = i + 1 # next instruction index
+            while ni < len(opcodes):
+                if opcodes[ni] != 'label': break
+                ni += 1
+            self.labels[label] = ni
+        self.nparams = len(proc.t_args)
+        self.has_phis = 'phi' in opcodes
+        self.decoded = dict()   # filled in by the threaded interpreter
+
 class Proc:
-    def __init__(self, name, t_args, body):
-        self.name = name
+    def __init__(self, name, t_args, body, symbols=None):
+        """Create a new proc. Its names are interned in `symbols', the
+        Symbols of the program, or in a new one."""
+        self.symbols = Symbols() if symbols is None else symbols
+        self.name = self.symbols.intern(name)
+        self.t_args = tuple(map(self.symbols.intern, t_args))
         self.body = body or []
-        self.t_args = tuple(t_args)
+        if not isinstance(self.body, ColumnarBody):
+            for instr in self.body: self.symbols.intern_instr(instr)
+
+    @staticmethod
+    def lazy(name, t_args, load_body, symbols=None):
+        """Return a Proc whose body is only built, by calling `load_body()',
+        and checked on first use"""
+        proc = Proc(name, t_args, None, symbols)
+        proc._body = None
+        proc._load_body = load_body
+        return proc
+
+    @property
+    def body(self):
+        if self._body is None:
+            self._body = self._load_body()
+            self._load_body = None
+            for instr in self._body: self.symbols.intern_instr(instr)
+            self.check()
+        return self._body
+
+    @body.setter
+    def body(self, body):
+        self._body = body
+        self._info = None
+
+    @property
+    def info(self):
+        """The ProcInfo of this proc, computed on first use and dropped
+        whenever the body is replaced. Call invalidate() after editing the
+        body in place."""
+        if self._info is None:
+            self._info = ProcInfo(self)
+        return self._info
+
+    def invalidate(self):
+        self._info = None
+
+    def make_columnar(self):
+        """Store the body as a ColumnarBody"""
+        if not isinstance(self.body, ColumnarBody):
+            self.body = ColumnarBody(self.body, self.symbols)
+
+    def check(self):
+        """Check that every instruction of the body is well-formed, as Instr()
+        does. Raises ValueError for the first one that is not."""
+        for instr in self.body:
+            try:
+                instr._check()
+            except ValueError as exc:
+                raise ValueError(f'{self.name}: {exc}') from None
 
     def __str__(self):
         result = StringIO()
-        result.write(f'proc {self.name}({", ".join(self.t_args)}):\n')
-        for instr in self.body:
-            print(instr, file=result)
+        write_tac([self], result)
         return result.getvalue()
 
     @staticmethod
-    def load(js_obj):
+    def load(js_obj, symbols=None):
         name = js_obj.get('proc', None)
         if not name: return
         assert isinstance(name, str)
         assert name.startswith('@')
         args = js_obj.get('args', ())
-        body = [Instr.load(i) for i in js_obj.get('body', [])]
-        return Proc(name, args, body)
+        body = [Instr.load(i, check=False) for i in js_obj.get('body', [])]
+        proc = Proc(name, args, body, symbols)
+        proc.check()
+        return proc
 
     @property
     def js_obj(self):
@@ -204,22 +295,243 @@ class Gvar:
         return f'var {self.name} = {self.value};\n'
 
     @staticmethod
-    def load(js_obj):
+    def load(js_obj, symbols=None):
         name = js_obj.get('var', None)
         if not name: return
         assert isinstance(name, str)
         assert name.startswith('@')
         init = js_obj.get('init', ())
-        return Gvar(name, init)
+        return Gvar(name if symbols is None else symbols.intern(name), init)
 
     @property
     def js_obj(self):
         return {'var': self.name,
                 'init': self.value}
 
+class Version(str):
+    """An SSA version of a temporary, such as %x.3: a str that also knows
+    its root temporary (%x) and its version (3)"""
+
+    def __new__(cls, root, version):
+        tmp = super().__new__(cls, f'{root}.{version}')
+        tmp.root = root
+        tmp.version = version
+        return tmp
+
+    def __getnewargs__(self):
+        return (self.root, self.version)
+
+class Symbols:
+    """The interned names of a program: every temporary, label and global
+    name is a single object, so that the dicts and sets keyed by them mostly
+    compare them by identity. The temporaries named like SSA versions are
+    Versions."""
+
+    def __init__(self):
+        self.names = dict()     # name -> symbol
+        self.versions = dict()  # (root, version) -> Version
+        self.table = []         # number -> symbol (see number())
+        self.numbers = dict()   # symbol -> number
+
+    def intern(self, name):
+        sym = self.names.get(name)
+        if sym is None:
+            sym = name
+            if Instr._istemp(name):
+                root, dot, version = name.rpartition('.')
+                if dot and version.isdigit() and str(int(version)) == version:
+                    sym = self.version(root, int(version))
+            self.names[name] = sym
+        return sym
+
+    def version(self, root, version):
+        """Return the Version `version' of the temporary `root'"""
+        tmp = self.versions.get((root, version))
+        if tmp is None:
+            tmp = Version(self.intern(root), version)
+            self.versions[(root, version)] = tmp
+            self.names[tmp] = tmp
+        return tmp
+
+    def intern_instr(self, instr):
+        """Intern the opcode and names of `instr', in place"""
+        instr.opcode = sys.intern(instr.opcode)
+        if instr.dest is not None: instr.dest = self.intern(instr.dest)
+        if isinstance(instr.arg1, str): instr.arg1 = self.intern(instr.arg1)
+        elif isinstance(instr.arg1, dict):
+            instr.arg1 = {self.intern(l): self.intern(t) for l, t in instr.arg1.items()}
+        if isinstance(instr.arg2, str): instr.arg2 = self.intern(instr.arg2)
+
+    def number(self, name):
+        """Return the number of the interned `name', as used by ColumnarBody"""
+        sym = self.intern(name)
+        num = self.numbers.get(sym)
+        if num is None:
+            num = self.numbers[sym] = len(self.table)
+            self.table.append(sym)
+        return num
+
+# ------------------------------------------------------------------------------
+# A proc body can also be stored by columns, in typed arrays that take a few
+# bytes per instruction instead of an Instr object each. Code that indexes
+# or iterates over it gets InstrViews, so it does not need to know.
+
+from array import array
+
+_opcode_list = tuple(opcode_kinds)
+_opcode_codes = {opcode: code for code, opcode in enumerate(_opcode_list)}
+_ARG_NONE, _ARG_SYM, _ARG_INT, _ARG_PHI = range(4)
+_ARG_UNSIGNED = 16             # << 1 for arg2
+
+class ColumnarBody:
+    """A proc body as arrays of opcode codes, dest symbol numbers (-1 for
+    none), argument kinds and arg1/arg2 values. The value of a symbol
+    argument is its number in `symbols', and that of a phi arg1 the index of
+    its dict in `phis'. An integer in [2**63, 2**64) is stored wrapped to
+    two's complement with its _ARG_UNSIGNED bit set. Behaves like a list of
+    Instrs whose items are InstrViews; it can be read, assigned to and
+    appended to."""
+
+    def __init__(self, instrs=(), symbols=None):
+        self.symbols = Symbols() if symbols is None else symbols
+        self.opcodes = array('B')
+        self.dests = array('i')
+        # kind of arg1 | kind of arg2 << 2 | _ARG_UNSIGNED bits
+        self.kinds = array('B')
+        self.args1 = array('q')
+        self.args2 = array('q')
+        self.phis = []
+        for instr in instrs: self.append(instr)
+
+    def __len__(self):
+        return len(self.opcodes)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [InstrView(self, j) for j in range(*i.indices(len(self)))]
+        if i < 0: i += len(self)
+        if not 0 <= i < len(self): raise IndexError('instruction index out of range')
+        return InstrView(self, i)
+
+    def __iter__(self):
+        return (InstrView(self, i) for i in range(len(self)))
+
+    def __setitem__(self, i, instr):
+        self.set_field(i, 'opcode', instr.opcode)
+        self.set_field(i, 'dest', instr.dest)
+        self.set_field(i, 'arg1', instr.arg1)
+        self.set_field(i, 'arg2', instr.arg2)
+
+    def append(self, instr):
+        self.opcodes.append(0)
+        self.dests.append(-1)
+        self.kinds.append(0)
+        self.args1.append(0)
+        self.args2.append(0)
+        self[len(self) - 1] = instr
+
+    def opcode_names(self):
+        """Return the list of the opcodes of the body"""
+        return [_opcode_list[code] for code in self.opcodes]
+
+    def field(self, i, name):
+        """Return the field `name' of the instruction `i'"""
+        if name == 'opcode': return _opcode_list[self.opcodes[i]]
+        if name == 'dest':
+            num = self.dests[i]
+            return None if num < 0 else self.symbols.table[num]
+        if name == 'arg1': shift, value = 0, self.args1[i]
+        else: shift, value = 2, self.args2[i]
+        kind = self.kinds[i] >> shift & 3
+        if kind == _ARG_SYM: return self.symbols.table[value]
+        if kind == _ARG_INT:
+            if self.kinds[i] & _ARG_UNSIGNED << (shift >> 1): value += 1 << 64
+            return value
+        if kind == _ARG_PHI: return self.phis[value]
+        return None
+
+    def set_field(self, i, name, value):
+        """Set the field `name' of the instruction `i' to `value'"""
+        if name == 'opcode':
+            if value not in _opcode_codes:
+                raise ValueError(f'bad tac.Instr opcode: {value}')
+            self.opcodes[i] = _opcode_codes[value]
+            return
+        if name == 'dest':
+            self.dests[i] = -1 if value is None else self.symbols.number(value)
+            return
+        args, shift = (self.args1, 0) if name == 'arg1' else (self.args2, 2)
+        old = self.kinds[i] >> shift & 3
+        unsigned = 0
+        if value is None: kind, value = _ARG_NONE, 0
+        elif isinstance(value, str): kind, value = _ARG_SYM, self.symbols.number(value)
+        elif isinstance(value, dict):
+            kind = _ARG_PHI
+            if old == _ARG_PHI:
+                self.phis[args[i]] = value
+                value = args[i]
+            else:
+                self.phis.append(value)
+                value = len(self.phis) - 1
+        else:
+            kind = _ARG_INT
+            if not -(1 << 63) <= value < (1 << 64):
+                raise ValueError(f'{value} does not fit in 64 bits')
+            if value >= 1 << 63:
+                unsigned, value = _ARG_UNSIGNED, value - (1 << 64)
+        flags = _ARG_UNSIGNED << (shift >> 1)
+        self.kinds[i] = self.kinds[i] & ~(3 << shift | flags) | kind << shift \
+            | (flags if unsigned else 0)
+        args[i] = value
+
+def _view_field(name):
+    return property(lambda view: view.body.field(view.index, name),
+                    lambda view, value: view.body.set_field(view.index, name, value))
+
+class InstrView(Instr):
+    """The instruction at `index' in the ColumnarBody `body': its fields are
+    read from and written to the arrays of the body. Two views of the same
+    instruction are equal."""
+    __slots__ = ('body', 'index')
+
+    def __init__(self, body, index):
+        self.body = body
+        self.index = index
+
+    opcode = _view_field('opcode')
+    dest = _view_field('dest')
+    arg1 = _view_field('arg1')
+    arg2 = _view_field('arg2')
+
+    def __hash__(self):
+        return hash((id(self.body), self.index))
+
+    def __eq__(self, other):
+        return isinstance(other, InstrView) and \
+            self.body is other.body and self.index == other.index
+
 # ------------------------------------------------------------------------------
+# The lexer and parser tables are built once per process and shared by all
+# Lexer and Parser objects. They are also saved, in optimized form, as
+# modules next to this one, whose names contain a hash of the token and
+# grammar rules so that changing the rules makes new tables.
 
 import ply.lex
+import hashlib
+
+_tables_dir = os.path.dirname(os.path.abspath(__file__))
+
+def _tables_module(kind, *classes):
+    """Return the name of the module of the tables built from the rules
+    (t_* and p_* attributes) of the `classes'"""
+    h = hashlib.sha256(f'ply {ply.__version__}'.encode())
+    for cls in classes:
+        for name in sorted(vars(cls)):
+            if not name.startswith(('t_', 'p_', 'tokens')): continue
+            rule = getattr(cls, name)
+            h.update(f'{name}:{getattr(rule, "__doc__", None) if callable(rule) else rule}'
+                     .encode())
+    return f'tac_{kind}_{h.hexdigest()[:12]}'
 
 class Lexer:
     reserved = {
@@ -268,10 +580,18 @@ class Lexer:
               f'Warning: skipping illegal character: {t.value[0]}')
         t.lexer.skip(1)
 
+    _master = None
+
     def __init__(self, text, provenance="<unknown>"):
         self.text = text
         self.provenance = provenance
-        self.lexer = ply.lex.lex(module=self)
+        if Lexer._master is None:
+            Lexer._master = ply.lex.lex(module=self, optimize=True,
+                                        lextab=_tables_module('lextab', Lexer),
+                                        outputdir=_tables_dir)
+        # a copy of the master lexer with the rules bound to this object
+        self.lexer = Lexer._master.clone(self)
+        self.lexer.begin('INITIAL')     # clone() leaves the old rules active
         self.lexer.input(self.text)
 
 # ------------------------------------------------------------------------------
@@ -293,11 +613,11 @@ class Parser:
 
     def p_gvar(self, p):
         '''gvar : VAR GSYM EQ NUM64 SEMICOLON'''
-        p[0] = Gvar(p[2], p[4])
+        p[0] = Gvar(p.lexer.symbols.intern(p[2]), p[4])
 
     def p_proc(self, p):
         '''proc : PROC GSYM procparams COLON instrs'''
-        p[0] = Proc(p[2], p[3], p[5])
+        p[0] = Proc(p[2], p[3], p[5], p.lexer.symbols)
 
     def p_procparams(self, p):
         '''procparams : LPAREN argtemps RPAREN
@@ -362,13 +682,239 @@ class Parser:
             print(f'{self.lexer.provenance}:{p.lineno}:Error:syntax error at token {p.type}')
         raise RuntimeError('parsing')
 
+    _shared = None
+
     def __init__(self, lexer):
         self.lexer = lexer
-        self.parser = ply.yacc.yacc(module=self, start='program')
+        if Parser._shared is None:
+            # the rules are bound to this first object, so they only use
+            # the lexer of the parse (p.lexer); p_error() is rebound below
+            Parser._shared = ply.yacc.yacc(
+                module=self, start='program', debug=False, optimize=True,
+                tabmodule=_tables_module('parsetab', Lexer, Parser),
+                outputdir=_tables_dir,
+                write_tables=os.access(_tables_dir, os.W_OK))
+        self.parser = Parser._shared
 
     def parse(self):
+        # a new symbol table for every program, which the rules find on the
+        # PLY lexer
+        self.symbols = self.lexer.lexer.symbols = Symbols()
+        self.parser.errorfunc = self.p_error
         return self.parser.parse(lexer=self.lexer.lexer, tracking=True)
 
+# ------------------------------------------------------------------------------
+# A faster parser for the same syntax, without PLY. The text is read line by
+# line: a line that holds exactly one instruction or label is matched as a
+# whole by a compiled regex, and any other line is split into tokens with the
+# rules of Lexer, tried in the order PLY tries them. The grammar of Parser is
+# parsed by hand, reading tokens only when PLY would, so that the objects,
+# warnings and errors come out the same and in the same order.
+
+import re
+
+_ws = r'[ \t\f\v\r]*'
+_temp = r'%(?:0|[1-9][0-9]*|[A-Za-z][A-Za-z0-9_]*)'
+_gsym = r'@[A-Za-z_][A-Za-z0-9_]*'
+_label = r'%\.L[A-Za-z0-9_]*'
+_num64 = r'0|-?[1-9][0-9]*'
+_arg = f'(?:{_temp}|{_num64}|{_label}|{_gsym})'
+_comment = r'(?://.*)?'
+
+_fast_instr_re = re.compile(
+    f'{_ws}(?:(?P<lhs>{_temp}|{_gsym}){_ws}={_ws})?'
+    f'(?P<opcode>[A-Za-z_][A-Za-z0-9_]*)(?![A-Za-z0-9_])'
+    f'(?:{_ws}(?P<arg1>{_arg})(?:{_ws},{_ws}(?P<arg2>{_arg}))?)?'
+    f'{_ws};{_ws}{_comment}')
+_fast_label_re = re.compile(f'{_ws}(?P<label>{_label}){_ws}:{_ws}{_comment}')
+_fast_blank_re = re.compile(f'{_ws}{_comment}')
+_fast_token_re = re.compile(
+    f'(?P<ignore>[ \\t\\f\\v\\r]+)'
+    f'|(?P<newline>//.*)'
+    f'|(?P<OPCODE>[A-Za-z_][A-Za-z0-9_]*)'
+    f'|(?P<NUM64>{_num64})'
+    f'|(?P<TEMP>{_temp})'
+    f'|(?P<GSYM>{_gsym})'
+    f'|(?P<LABEL>{_label})'
+    r'|(?P<LPAREN>\()|(?P<RPAREN>\))|(?P<COLON>:)|(?P<COMMA>,)|(?P<EQ>=)'
+    r'|(?P<SEMICOLON>;)|(?P<error>.)')
+
+_arg_tokens = frozenset(('TEMP', 'NUM64', 'LABEL', 'GSYM'))
+# the tokens that can follow a complete instr or gvar: PLY reads one of them
+# before it builds the Instr or the Gvar
+_instr_follow = frozenset(('TEMP', 'GSYM', 'LABEL', 'OPCODE', 'VAR', 'PROC'))
+_gvar_follow = frozenset(('VAR', 'PROC'))
+
+def _fast_arg(x):
+    """Return the value of an argument token, or None for a literal that is
+    out of range (the tokenizer reports it)"""
+    if x[0] == '%' or x[0] == '@': return x
+    x = int(x)
+    return x if x & 0xffffffffffffffff == x else None
+
+class FastParser:
+    def __init__(self, text, provenance="<unknown>"):
+        self.text = text
+        self.provenance = provenance
+
+    def tokens(self):
+        """Return an iterator over the (type, value, lineno) of the tokens.
+        A line with a single instruction gives one ('INSTR', (lhs, opcode,
+        args), lineno) item instead, and a line with a single label one
+        ('LABELDEF', label, lineno) item; see unpack()."""
+        for lineno, line in enumerate(self.text.split('\n'), 1):
+            m = _fast_instr_re.fullmatch(line)
+            if m is not None and m['opcode'] not in Lexer.reserved:
+                lhs, opcode, arg1, arg2 = m.groups()
+                if arg1 is None: args = ()
+                else:
+                    arg1 = _fast_arg(arg1)
+                    if arg2 is None: args = (arg1,)
+                    else: args = (arg1, _fast_arg(arg2))
+                if None not in args:
+                    yield 'INSTR', (lhs, opcode, args), lineno
+                    continue
+            m = _fast_label_re.fullmatch(line)
+            if m is not None:
+                yield 'LABELDEF', m['label'], lineno
+                continue
+            if _fast_blank_re.fullmatch(line): continue
+            yield from self.line_tokens(line, lineno)
+
+    def line_tokens(self, line, lineno):
+        for m in _fast_token_re.finditer(line):
+            kind = m.lastgroup
+            if kind == 'ignore' or kind == 'newline': continue
+            value = m.group()
+            if kind == 'OPCODE':
+                kind = Lexer.reserved.get(value, 'OPCODE')
+            elif kind == 'NUM64':
+                value = int(value)
+                if value & 0xffffffffffffffff != value:
+                    print(f'{self.provenance}:{lineno}:'
+                          f'Error: numerical literal {value} not in [{-1<<63}, {1<<63})')
+                    raise SyntaxError('immint')
+            elif kind == 'error':
+                print(f'{self.provenance}:{lineno}:'
+                      f'Warning: skipping illegal character: {value}')
+                continue
+            yield kind, value, lineno
+
+    @staticmethod
+    def unpack(tok):
+        """Return the list of tokens of an INSTR or LABELDEF item"""
+        kind, value, lineno = tok
+        if kind == 'LABELDEF':
+            return [('LABEL', value, lineno), ('COLON', ':', lineno)]
+        lhs, opcode, args = value
+        toks = []
+        if lhs is not None:
+            toks.append(('TEMP' if lhs[0] == '%' else 'GSYM', lhs, lineno))
+            toks.append(('EQ', '=', lineno))
+        toks.append(('OPCODE', opcode, lineno))
+        for i, x in enumerate(args):
+            if i > 0: toks.append(('COMMA', ',', lineno))
+            kind = 'NUM64' if isinstance(x, int) else \
+                'GSYM' if x[0] == '@' else \
+                'LABEL' if x.startswith('%.L') else 'TEMP'
+            toks.append((kind, x, lineno))
+        toks.append(('SEMICOLON', ';', lineno))
+        return toks
+
+    def error(self, tok):
+        if tok:
+            if tok[0] == 'INSTR' or tok[0] == 'LABELDEF':
+                tok = self.unpack(tok)[0]
+            print(f'{self.provenance}:{tok[2]}:Error:syntax error at token {tok[0]}')
+        raise RuntimeError('parsing')
+
+    def parse(self):
+        tokens, back = self.tokens(), []
+        def take():
+            """Return the next token, or the next item (see tokens())"""
+            return back.pop() if back else next(tokens, None)
+        def token():
+            """Return the next token"""
+            tok = back.pop() if back else next(tokens, None)
+            if tok is not None and (tok[0] == 'INSTR' or tok[0] == 'LABELDEF'):
+                back.extend(reversed(self.unpack(tok)))
+                tok = back.pop()
+            return tok
+        def expect(kind):
+            tok = token()
+            if tok is None or tok[0] != kind: self.error(tok)
+            return tok[1]
+        def starts(tok):
+            if tok[0] == 'LABELDEF': return 'LABEL'
+            if tok[0] == 'INSTR':
+                lhs = tok[1][0]
+                return 'OPCODE' if lhs is None else 'TEMP' if lhs[0] == '%' else 'GSYM'
+            return tok[0]
+        program, symbols = [], Symbols()
+        tok = take()
+        while tok is not None:
+            if tok[0] == 'VAR':
+                name = expect('GSYM')
+                expect('EQ')
+                value = expect('NUM64')
+                expect('SEMICOLON')
+                tok = take()
+                if tok is not None and starts(tok) not in _gvar_follow: self.error(tok)
+                program.append(Gvar(symbols.intern(name), value))
+                continue
+            if tok[0] != 'PROC': self.error(tok)
+            name = expect('GSYM')
+            tok = token()
+            params = ()
+            if tok is not None and tok[0] == 'LPAREN':
+                tok = token()
+                if tok is not None and tok[0] == 'TEMP':
+                    params = [tok[1]]
+                    tok = token()
+                    while tok is not None and tok[0] == 'COMMA':
+                        params.append(expect('TEMP'))
+                        tok = token()
+                if tok is None or tok[0] != 'RPAREN': self.error(tok)
+                tok = token()
+            if tok is None or tok[0] != 'COLON': self.error(tok)
+            body = []
+            tok = take()
+            while tok is not None and tok[0] != 'VAR' and tok[0] != 'PROC':
+                kind = tok[0]
+                if kind == 'INSTR':
+                    instr = tok[1]
+                elif kind == 'LABELDEF':
+                    instr = (None, 'label', [tok[1]])
+                elif kind == 'LABEL':
+                    label = tok[1]
+                    expect('COLON')
+                    instr = (None, 'label', [label])
+                else:
+                    lhs = None
+                    if kind == 'TEMP' or kind == 'GSYM':
+                        lhs = tok[1]
+                        expect('EQ')
+                        tok = token()
+                    if tok is None or tok[0] != 'OPCODE': self.error(tok)
+                    opcode = tok[1]
+                    args = ()
+                    tok = token()
+                    if tok is not None and tok[0] in _arg_tokens:
+                        args = (tok[1],)
+                        tok = token()
+                        if tok is not None and tok[0] == 'COMMA':
+                            tok = token()
+                            if tok is None or tok[0] not in _arg_tokens: self.error(tok)
+                            args = (args[0], tok[1])
+                            tok = token()
+                    if tok is None or tok[0] != 'SEMICOLON': self.error(tok)
+                    instr = (lhs, opcode, args)
+                tok = take()
+                if tok is not None and starts(tok) not in _instr_follow: self.error(tok)
+                body.append(Instr(*instr))
+            program.append(Proc(name, params, body, symbols))
+        return program
+
 # ------------------------------------------------------------------------------
 
 word_bytes = 8
@@ -409,6 +955,61 @@ jumps = {
     'jnle': (lambda k: untwoc(k) > 0),
 }
 
+# ------------------------------------------------------------------------------
+# Facts about every opcode, looked up by the passes instead of matching
+# opcode names. The flags of an opcode are an int made of these bits:
+
+OP_USES_ARG1 = 1 << 0       # arg1 is a temporary (or global) that is read
+OP_USES_ARG2 = 1 << 1       # arg2 is a temporary (or global) that is read
+OP_DEFS_DEST = 1 << 2       # dest is written
+OP_SIDE_EFFECTS = 1 << 3    # must be kept even if nothing reads dest
+OP_TERMINATOR = 1 << 4      # ends a basic block
+OP_JUMP = 1 << 5            # may jump to a label
+OP_CONDITIONAL = 1 << 6     # may also fall through to the next instruction
+OP_COMMUTATIVE = 1 << 7     # arg1 and arg2 can be swapped
+
+_binop_flags = OP_USES_ARG1 | OP_USES_ARG2 | OP_DEFS_DEST
+_jcc_flags = OP_USES_ARG1 | OP_TERMINATOR | OP_JUMP | OP_CONDITIONAL
+
+opcode_flags = {
+    'nop': 0,
+    'jmp': OP_TERMINATOR | OP_JUMP,
+    'jz': _jcc_flags, 'jnz': _jcc_flags, 'jl': _jcc_flags, 'jle': _jcc_flags,
+    'jnl': _jcc_flags, 'jnle': _jcc_flags,
+    'add': _binop_flags | OP_COMMUTATIVE, 'sub': _binop_flags,
+    'mul': _binop_flags | OP_COMMUTATIVE, 'div': _binop_flags | OP_SIDE_EFFECTS,
+    'mod': _binop_flags | OP_SIDE_EFFECTS, 'neg': OP_USES_ARG1 | OP_DEFS_DEST,
+    'and': _binop_flags | OP_COMMUTATIVE, 'or': _binop_flags | OP_COMMUTATIVE,
+    'xor': _binop_flags | OP_COMMUTATIVE, 'not': OP_USES_ARG1 | OP_DEFS_DEST,
+    'shl': _binop_flags, 'shr': _binop_flags,
+    'const': OP_DEFS_DEST, 'copy': OP_USES_ARG1 | OP_DEFS_DEST,
+    'label': 0,
+    'param': OP_USES_ARG2 | OP_SIDE_EFFECTS,
+    'call': OP_DEFS_DEST | OP_SIDE_EFFECTS,
+    'ret': OP_USES_ARG1 | OP_TERMINATOR,
+    'phi': OP_DEFS_DEST,        # the temporaries it reads are in arg1
+}
+
+class OpcodeInfo:
+    """Everything known about an opcode: its number (its position in
+    opcode_kinds), the kinds of its dest, arg1 and arg2, its OP_* flags,
+    and the function computing its result from its arguments (for binops
+    and unops) or deciding whether it jumps (for conditional jumps)"""
+    __slots__ = ('name', 'code', 'kinds', 'flags', 'eval')
+
+    def __init__(self, name, code):
+        self.name = name
+        self.code = code
+        self.kinds = opcode_kinds[name]
+        self.flags = opcode_flags[name]
+        self.eval = binops.get(name) or unops.get(name) or jumps.get(name)
+
+    def __repr__(self):
+        return f'OpcodeInfo({self.name!r}, {self.code})'
+
+opcode_info = {name: OpcodeInfo(name, code)
+               for code, name in enumerate(opcode_kinds)}
+
 class TempMap(dict):
     """Mapping temporaries to values"""
 
@@ -446,34 +1047,194 @@ class TempMap(dict):
         else:
             super().__setitem__(tmp, val)
 
+# ------------------------------------------------------------------------------
+# Output sinks
+#
+# Everything the interpreters print, program output and traces alike, goes
+# through the write_line() method of a sink, so both stay in order. The
+# outermost execute() flushes the sink when it returns or fails.
+
+class StdoutOutput:
+    """Print every line to sys.stdout as soon as it is written"""
+
+    def write_line(self, line):
+        print(line)
+
+    def flush(self):
+        pass
+
+class BufferedOutput:
+    """Collect lines and write them to the text file `fp' (default:
+    sys.stdout) once at least `flush_size' characters are pending"""
+
+    def __init__(self, fp=None, flush_size=1 << 16):
+        self.fp = fp
+        self.flush_size = flush_size
+        self.lines = []
+        self.pending = 0
+
+    def write_line(self, line):
+        self.lines.append(line)
+        self.pending += len(line) + 1
+        if self.pending >= self.flush_size:
+            self.flush()
+
+    def _write(self, text):
+        fp = sys.stdout if self.fp is None else self.fp
+        fp.write(text)
+        fp.flush()
+
+    def flush(self):
+        if not self.lines: return
+        self.lines.append('')
+        text = '\n'.join(self.lines)
+        self.lines, self.pending = [], 0
+        self._write(text)
+
+class BinaryOutput(BufferedOutput):
+    """Same as BufferedOutput, but for a file `fp' opened in binary mode"""
+
+    def __init__(self, fp, flush_size=1 << 16, encoding='utf-8'):
+        super().__init__(fp, flush_size)
+        self.encoding = encoding
+
+    def _write(self, text):
+        self.fp.write(text.encode(self.encoding))
+        self.fp.flush()
+
+class ListOutput:
+    """Keep all the lines in the list `lines'"""
+
+    def __init__(self):
+        self.lines = []
+
+    def write_line(self, line):
+        self.lines.append(line)
+
+    def flush(self):
+        pass
+
+# ------------------------------------------------------------------------------
+# Memoization of pure procs
+
+from collections import OrderedDict
+
+def pure_procs(procs):
+    """Return the set of names of the procs in `procs' that are pure
+    functions of their arguments: they do not write globals, do not read
+    globals that are written anywhere in the program, do not print, and only
+    call pure procs."""
+    written = {instr.dest for proc in procs.values() for instr in proc.body
+               if isinstance(instr.dest, str) and instr.dest.startswith('@')}
+    def reads(instr):
+        if instr.opcode == 'phi': yield from instr.arg1.values()
+        flags = opcode_flags[instr.opcode]
+        if flags & OP_USES_ARG1: yield instr.arg1
+        if flags & OP_USES_ARG2: yield instr.arg2
+    pure, callees = set(), dict()
+    for name, proc in procs.items():
+        if any(instr.dest in written or
+               any(x in written for x in reads(instr))
+               for instr in proc.body):
+            continue
+        callees[name] = {instr.arg1 for instr in proc.body
+                         if instr.opcode == 'call'}
+        pure.add(name)
+    # a proc calling an impure proc (or a print) is impure
+    changed = True
+    while changed:
+        changed = False
+        for name in list(pure):
+            if not callees[name] <= pure:
+                pure.remove(name)
+                changed = True
+    return pure
+
+class Memo:
+    """A bounded LRU cache of the results of calls to pure procs, used with
+    execute(..., memo=Memo(procs)). A cached call does not run, so it does
+    not show up in traces. Profiled runs are not memoized."""
+
+    missing = object()
+
+    def __init__(self, procs, maxsize=1 << 16):
+        self.pure = pure_procs(procs)
+        self.nparams = {name: len(procs[name].t_args) for name in self.pure}
+        self.maxsize = maxsize
+        self.cache = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+
+    def key(self, proc_name, params):
+        """Return the cache key of a call, or None if the proc is not pure"""
+        if proc_name not in self.pure: return None
+        return (proc_name, tuple(params[:self.nparams[proc_name]]))
+
+    def lookup(self, key):
+        """Return the cached result of a call, or Memo.missing"""
+        result = self.cache.get(key, self.missing)
+        if result is self.missing:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.cache.move_to_end(key)
+        return result
+
+    def store(self, key, result):
+        self.cache[key] = result
+        if len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        return {'pure': sorted(self.pure), 'size': len(self.cache),
+                'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions}
+
+    def __str__(self):
+        return (f'memo: {self.hits} hits, {self.misses} misses, '
+                f'{self.evictions} evictions, {len(self.cache)} cached, '
+                f'pure procs: {",".join(sorted(self.pure))}')
+
+engines = ('classic', 'threaded', 'compiled')
+
 def execute(gvars, procs, proc_name, args, **kwargs):
+    output = kwargs.setdefault('output', StdoutOutput())
+    if kwargs.get('depth', 0) > 0:
+        return _execute(gvars, procs, proc_name, args, **kwargs)
+    try:
+        return _execute(gvars, procs, proc_name, args, **kwargs)
+    finally:
+        output.flush()
+
+def _execute(gvars, procs, proc_name, args, **kwargs):
+    engine = kwargs.get('engine', 'classic')
+    if engine == 'threaded':
+        return execute_threaded(gvars, procs, proc_name, args, **kwargs)
+    elif kwargs.get('profile') is not None:
+        raise ValueError('Only the threaded engine can profile')
+    elif engine == 'compiled':
+        import tac2py
+        return tac2py.execute(gvars, procs, proc_name, args, **kwargs)
+    elif engine != 'classic':
+        raise ValueError(f'Unknown engine: {engine}')
     show_proc = kwargs.get('show_proc', False)
     show_instr = kwargs.get('show_instr', False)
     only_decimal = kwargs.get('only_decimal', True)
     depth = kwargs.get('depth', 0)
     indent = '  ' * depth
+    out = kwargs['output'].write_line
 
     values = TempMap(gvars)
     proc = procs[proc_name]
+    labels = proc.info.labels
 
-    for i in range(len(proc.t_args)):
+    for i in range(proc.info.nparams):
         values[proc.t_args[i]] = args[i]
 
     oldvalues = values.copy()
 
     proc_desc = f'{proc_name}({",".join(k + "=" + str(v) for k, v in values.items())})'
-    if show_proc: print(f'// {indent}entering {proc_desc}')
-
-    labels = dict()
-    for i, instr in enumerate(proc.body):
-        if instr.opcode != 'label': continue
-        if instr.arg1 in labels:
-            raise RuntimeError(f'Reused label {instr.arg1}')
-        ni = i + 1 # next instruction index
-        while ni < len(proc.body):
-            if proc.body[ni].opcode != 'label': break
-            ni += 1
-        labels[instr.arg1] = ni
+    if show_proc: out(f'// {indent}entering {proc_desc}')
 
     lab_prev, lab_cur = None, proc_name
     pc = 0
@@ -482,11 +1243,14 @@ def execute(gvars, procs, proc_name, args, **kwargs):
         instr = proc.body[pc]
         pc += 1
 
-        if show_instr: print(f'// {indent}[{pc+1: 4d}] {instr}')
+        if show_instr: out(f'// {indent}[{pc+1: 4d}] {instr}')
         if instr.opcode == 'nop':
             pass
         elif instr.opcode == 'label':
+            # only reached by falling through: the phis of the block see
+            # the values at the end of the previous one, as after a jump
             lab_prev, lab_cur = lab_cur, instr.arg1
+            if proc.info.has_phis: oldvalues = values.copy()
         elif instr.opcode == 'phi':
             for lab, tmp in instr.arg1.items():
                 if lab == lab_prev:
@@ -512,14 +1276,14 @@ def execute(gvars, procs, proc_name, args, **kwargs):
                 pc = labels[lab_cur]
         elif instr.opcode == 'const':
             if not isinstance(instr.arg1, int):
-                print(f'Missing or bad argument: {instr.arg1}')
+                out(f'Missing or bad argument: {instr.arg1}')
                 raise RuntimeError
             values[instr.dest] = twoc(instr.arg1)
         elif instr.opcode == 'copy':
             values[instr.dest] = values[instr.arg1]
         elif instr.opcode == 'param':
             if not isinstance(instr.arg1, int) or instr.arg1 < 1:
-                print(f'Bad argument to param: '
+                out(f'Bad argument to param: '
                       f'expecting int >= 1, got {instr.arg1}')
             # make params big enough to hold instr.arg1 items
             for _ in range(instr.arg1 - len(params)):
@@ -532,25 +1296,31 @@ def execute(gvars, procs, proc_name, args, **kwargs):
                                        f'expected 1, got {len(params)}')
                 if instr.arg1 == '@__bx_print_int':
                     u = params[0]
-                    if only_decimal: print(str(untwoc(u)))
-                    else: print(f'{untwoc(u): 20d}  0x{u:016x}  0b{u:064b}')
+                    if only_decimal: out(str(untwoc(u)))
+                    else: out(f'{untwoc(u): 20d}  0x{u:016x}  0b{u:064b}')
                 elif instr.arg1 == '@__bx_print_bool':
-                    print('false' if params[0] == 0 else 'true')
+                    out('false' if params[0] == 0 else 'true')
                 else:
                     raise RuntimeError(f'Unknown print() specialization: {instr.arg1}')
             else:
                 if len(params) < instr.arg2:
                     raise RuntimeError(f'Bad number of arguments to {instr.arg1}(): '
                                        f'expected {instr.arg2}, got {len(params)}')
-                kwargs['depth'] = depth + 1
-                result = execute(gvars, procs, instr.arg1, params, **kwargs)
+                memo = kwargs.get('memo')
+                key = None if memo is None else memo.key(instr.arg1, params)
+                result = Memo.missing if key is None else memo.lookup(key)
+                if result is Memo.missing:
+                    kwargs['depth'] = depth + 1
+                    result = _execute(gvars, procs, instr.arg1, params, **kwargs)
+                    if key is not None and result is not None:
+                        memo.store(key, result)
                 if instr.dest:
                     values[instr.dest] = result
             params = []
         elif instr.opcode == 'ret':
             retval = None if instr.arg1 == None else values[instr.arg1]
             if show_proc:
-                print(f'// {indent}{proc_desc} --> {retval}')
+                out(f'// {indent}{proc_desc} --> {retval}')
             return retval
         elif instr.opcode in binops:
             u = values[instr.arg1]
@@ -559,42 +1329,1230 @@ def execute(gvars, procs, proc_name, args, **kwargs):
         elif instr.opcode in unops:
             u = values[instr.arg1]
             if instr.arg2 != None:
-                print(f'Unary operator {instr.opcode} has two arguments!')
+                out(f'Unary operator {instr.opcode} has two arguments!')
                 raise RuntimeError
             values[instr.dest] = unops[instr.opcode](u)
         else:
-            print(f'Unknown opcode {instr.opcode}')
+            out(f'Unknown opcode {instr.opcode}')
             raise RuntimeError
-    print(f'// {indent}{proc_desc} --> NONE')
+    out(f'// {indent}{proc_desc} --> NONE')
+
+# ------------------------------------------------------------------------------
+# Threaded interpreter
+#
+# Every Proc is decoded once into a list of closures (handlers), one per
+# instruction, with jump targets resolved to indices. The temporaries of the
+# Proc are numbered into slots of a flat register file (a list), and global
+# operands are resolved to their Gvar. A handler takes the register file and
+# the current frame, performs the instruction, and returns the index of the
+# next handler to run (or a negative number to leave the proc).
+#
+# Phi functions are not evaluated from a snapshot of the register file.
+# Instead, the phis of a block are turned into a parallel copy for every
+# incoming edge, computed the first time the edge is taken, and only those
+# copies are done when entering the block.
+#
+# Calls do not recurse in Python: the call handler asks the interpreter loop
+# to push a new frame on an explicit stack, so the depth of TAC recursion is
+# only limited by memory. Frames are recycled through a pool per decoded proc.
+
+import operator, time
+
+_wrapping_binops = {
+    'add': operator.add, 'sub': operator.sub, 'mul': operator.mul,
+    'and': operator.and_, 'or': operator.or_, 'xor': operator.xor,
+}
+
+_CALL = -3 # returned by a call handler; a return handler returns -1
+
+class _Frame:
+    __slots__ = ('dec', 'regs', 'args', 'pc', 'lab_prev', 'lab_cur',
+                 'params', 'result', 'depth', 'callee', 'write_result',
+                 'memo_key', 'out')
+
+    def __init__(self, dec):
+        self.dec = dec
+        self.regs = list(dec.blank)
+
+    def reset(self, args, depth):
+        """Prepare this frame for a new call of its proc with `args'"""
+        dec = self.dec
+        regs = self.regs
+        regs[:] = dec.blank
+        for i, s in enumerate(dec.arg_slots):
+            if not (isinstance(args[i], int) and 0 <= args[i] <= full_mask):
+                raise RuntimeError(f'Illegal value: {args[i]}')
+            regs[s] = args[i]
+        self.args = args
+        self.lab_prev, self.lab_cur = None, dec.proc.name
+        self.params = []
+        self.result = None
+        self.depth = depth
+        self.memo_key = None
+
+    def desc(self):
+        proc = self.dec.proc
+        entry = {t: self.args[i] for i, t in enumerate(proc.t_args)}
+        return f'{proc.name}({",".join(k + "=" + str(v) for k, v in entry.items())})'
+
+def _raiser(exc):
+    def handler(regs, fr):
+        raise exc
+    return handler
+
+def _phi_error(lab_prev, phi):
+    return RuntimeError(f'cannot resolve phi: '
+                        f'came from {lab_prev}, '
+                        f'can only handle [{",".join(phi.arg1.keys())}]')
+
+_unresolved = object()
+
+class _Unwritten:
+    """The value of a slot before the temporary `name' is written: like the
+    TempMap of _execute(), reading it raises KeyError(name). The handlers
+    that compute with a value get that from these operators; those that
+    only move it check it with _written()."""
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def _raise(self, *args):
+        raise KeyError(self.name)
+
+    __eq__ = __ne__ = __lt__ = __le__ = __gt__ = __ge__ = _raise
+    __add__ = __radd__ = __sub__ = __rsub__ = __mul__ = __rmul__ = _raise
+    __and__ = __rand__ = __or__ = __ror__ = __xor__ = __rxor__ = _raise
+    __lshift__ = __rlshift__ = __rshift__ = __rrshift__ = _raise
+    __truediv__ = __rtruediv__ = __neg__ = __invert__ = _raise
+    __bool__ = __index__ = __int__ = __hash__ = _raise
+
+def _written(val):
+    """Return `val', or raise KeyError if it is that of an unwritten slot"""
+    if val.__class__ is _Unwritten: raise KeyError(val.name)
+    return val
+
+# Superinstructions: a handler for a short sequence of instructions of the
+# same block, used in place of the handler of the first one. The handlers
+# of the others stay in the code, so the sequence can still be entered in
+# the middle (after a call returns, for instance).
+
+def _fusion_kind(instr):
+    """Return the kind of `instr' for the purpose of fusion, or None if it
+    cannot be part of a superinstruction"""
+    def temps(*xs): return all(_Decoded._istemp(x) for x in xs)
+    opcode = instr.opcode
+    if opcode == 'const':
+        if isinstance(instr.arg1, int) and temps(instr.dest): return 'const'
+    elif opcode in binops:
+        if temps(instr.dest, instr.arg1, instr.arg2): return 'binop'
+    elif opcode == 'copy':
+        if temps(instr.dest, instr.arg1): return 'copy'
+    elif opcode in jumps:
+        if temps(instr.arg1): return 'test'
+    elif opcode in ('jmp', 'param', 'call', 'ret'):
+        return opcode
+    return None
+
+# sequences with a handler of their own; any other pair that starts with an
+# instruction that always falls through is fused by chaining the handlers
+_fused_templates = frozenset({
+    ('const', 'binop', 'test'), ('const', 'binop'), ('binop', 'test'),
+    ('binop', 'jmp'), ('test', 'jmp'), ('copy', 'copy'), ('binop', 'binop'),
+})
+_falls_through = frozenset({'const', 'binop', 'copy', 'param'})
+_fusion_kinds = _falls_through | {'test', 'jmp', 'call', 'ret'}
+
+def _fusable(kinds):
+    """Return whether instructions of the given kinds make a superinstruction"""
+    if kinds in _fused_templates: return True
+    return len(kinds) == 2 and kinds[0] in _falls_through \
+        and kinds[1] in _fusion_kinds
+
+def _fusion_plan(body):
+    """Return a dict from the index of the first instruction of every
+    superinstruction of `body' to the kinds of its instructions"""
+    kinds = [_fusion_kind(instr) for instr in body]
+    plan = dict()
+    for pc in range(len(kinds)):
+        for length in (3, 2):
+            seq = tuple(kinds[pc:pc + length])
+            if len(seq) == length and _fusable(seq):
+                plan[pc] = seq
+                break
+    return plan
+
+class _Decoded:
+    """A Proc decoded for the threaded interpreter. It is kept in the
+    ProcInfo of the proc, and is only valid for the same `gvars'."""
+
+    def __init__(self, proc, gvars, show_instr, only_decimal, fuse):
+        self.proc = proc
+        self.gvars = gvars
+        self.show_instr = show_instr
+        self.only_decimal = only_decimal
+        self.slots = dict()
+        self.arg_slots = [self._slot(t) for t in proc.t_args]
+        self.has_phis = proc.info.has_phis
+        # without phis, labels do nothing and falling into them can skip them
+        self.skip_labels = fuse and not self.has_phis
+        self.spans = dict()     # pc -> where its handler falls through to
+        self._find_blocks()
+        self.code = []
+        for pc, instr in enumerate(proc.body):
+            try:
+                handler = self._decode(pc, instr)
+            except (KeyError, RuntimeError, ValueError) as exc:
+                # report the error only if the instruction is ever executed
+                handler = _raiser(exc)
+            self.code.append(handler)
+        if fuse:
+            for pc, kinds in _fusion_plan(proc.body).items():
+                try:
+                    self.code[pc] = self._fuse(pc, kinds)
+                except (KeyError, RuntimeError, ValueError):
+                    continue    # the error is raised by the unfused handlers
+                self.spans[pc] = self._next(pc + len(kinds) - 1)
+        self.code.append(self._fell_off)
+        self.nslots = len(self.slots)
+        self.blank = [_Unwritten(tmp) for tmp in self.slots]
+        self.pool = []
+
+    def _find_blocks(self):
+        """Compute the entry point of every label and the parallel copies
+        that replace the phis of the block that follows it"""
+        body = self.proc.body
+        self.labels = dict()    # label -> (pc, enter)
+        self.fall_enter = dict()  # pc of last label of a run -> enter
+        self.hidden = dict()    # pc of a phi -> slot of its incoming value
+        i = 0
+        while i < len(body):
+            if body[i].opcode != 'label':
+                i += 1
+                continue
+            j = i
+            while j < len(body) and body[j].opcode == 'label': j += 1
+            k, phis = j, []
+            while k < len(body) and body[k].opcode != 'label':
+                if body[k].opcode == 'phi': phis.append(k)
+                k += 1
+            # phis at the start of the block are done on the edge; the rest
+            # (and all of them when tracing) get their incoming value in a
+            # hidden slot and are done when executed
+            nlead = 0
+            if not self.show_instr:
+                while nlead < len(phis) and phis[nlead] == j + nlead: nlead += 1
+            for p in phis:
+                # number the temporaries now, the copies are built lazily
+                for t in (body[p].dest, *body[p].arg1.values()):
+                    if self._istemp(t): self._slot(t)
+            for p in phis[nlead:]:
+                self.hidden[p] = self.slots.setdefault(('phi', p), len(self.slots))
+            enter = self._make_enter(phis, nlead, j + nlead) if phis else None
+            for lab_pc in range(i, j):
+                lab = body[lab_pc].arg1
+                if lab in self.labels:
+                    raise RuntimeError(f'Reused label {lab}')
+                self.labels[lab] = (j, enter)
+            if enter: self.fall_enter[j - 1] = enter
+            i = j
+
+    def _make_enter(self, phis, nlead, npc):
+        """Return a function that does the parallel copy for the edge from
+        fr.lab_prev into the block with the given phis, and returns the
+        index of the next handler to run"""
+        body = self.proc.body
+        edges = dict()
+        def build(lab_prev):
+            srcs, dsts = [], []
+            for n, p in enumerate(phis):
+                phi = body[p]
+                if n < nlead:
+                    if lab_prev not in phi.arg1:
+                        return _raiser(_phi_error(lab_prev, phi))
+                    dsts.append(self._operand(phi.dest))
+                else:
+                    dsts.append(self.hidden[p])
+                if lab_prev in phi.arg1:
+                    srcs.append(self._operand(phi.arg1[lab_prev]))
+                else:
+                    srcs.append(_unresolved)
+            if all(isinstance(x, int) for x in srcs + dsts):
+                if len(srcs) == 1:
+                    d, s = dsts[0], srcs[0]
+                    def copy(regs, fr):
+                        regs[d] = _written(regs[s])
+                        return npc
+                else:
+                    read = operator.itemgetter(*srcs)
+                    def copy(regs, fr):
+                        vals = read(regs)
+                        for v in vals: _written(v)
+                        for d, v in zip(dsts, vals): regs[d] = v
+                        return npc
+                return copy
+            def value(regs, x):
+                if isinstance(x, int): return _written(regs[x])
+                if isinstance(x, Gvar): return x.value
+                return x
+            def copy(regs, fr):
+                vals = [value(regs, s) for s in srcs]
+                for d, v in zip(dsts, vals):
+                    if isinstance(d, int): regs[d] = v
+                    else: d.value = v
+                return npc
+            return copy
+        def enter(regs, fr):
+            copy = edges.get(fr.lab_prev)
+            if copy is None:
+                try: copy = build(fr.lab_prev)
+                except (KeyError, RuntimeError, ValueError) as exc:
+                    copy = _raiser(exc)
+                edges[fr.lab_prev] = copy
+            return copy(regs, fr)
+        return enter
+
+    @staticmethod
+    def _fell_off(regs, fr):
+        fr.result = None
+        return -2
+
+    def _slot(self, tmp):
+        """Return the register file index of the temporary `tmp'"""
+        if not (isinstance(tmp, str) and tmp.startswith('%')):
+            raise RuntimeError(f'Illegal temporary: {tmp}')
+        return self.slots.setdefault(tmp, len(self.slots))
+
+    def _operand(self, x):
+        """Return the Gvar of a global operand or the slot of a temporary"""
+        if isinstance(x, str) and x.startswith('@'):
+            return self.gvars[x]
+        return self._slot(x)
+
+    def _reader(self, x, moved=False):
+        """Return a function from the register file to the value of `x'; if
+        the value is `moved' somewhere rather than computed with, the
+        function checks that `x' was written"""
+        if isinstance(x, str) and x.startswith('@'):
+            gvar = self.gvars[x]
+            return lambda regs: gvar.value
+        s = self._slot(x)
+        if moved: return lambda regs: _written(regs[s])
+        return operator.itemgetter(s)
+
+    def _writer(self, x):
+        """Return a function storing a value in `x' in the register file"""
+        if isinstance(x, str) and x.startswith('@'):
+            gvar = self.gvars[x]
+            def write(regs, val): gvar.value = val
+        else:
+            s = self._slot(x)
+            def write(regs, val): regs[s] = val
+        return write
+
+    @staticmethod
+    def _istemp(x):
+        return isinstance(x, str) and x.startswith('%')
+
+    def _target(self, lab):
+        """Return (tpc, go) for a jump to `lab'. If `go' is None, the jump
+        just continues at index `tpc', otherwise go(regs, fr) must be
+        called to record the edge and get the index to continue at."""
+        if lab not in self.labels:
+            raise RuntimeError(f'Unknown jump destination {lab}')
+        tpc, enter = self.labels[lab]
+        if not self.has_phis: return tpc, None
+        if enter is None:
+            def go(regs, fr):
+                fr.lab_prev, fr.lab_cur = fr.lab_cur, lab
+                return tpc
+        else:
+            def go(regs, fr):
+                fr.lab_prev, fr.lab_cur = fr.lab_cur, lab
+                return enter(regs, fr)
+        return tpc, go
+
+    def _next(self, pc):
+        """Return the index of the handler to run after the one at `pc'"""
+        npc = pc + 1
+        if self.skip_labels:
+            body = self.proc.body
+            while npc < len(body) and body[npc].opcode == 'label': npc += 1
+            if npc > pc + 1: self.spans.setdefault(pc, npc)
+        return npc
+
+    def _decode(self, pc, instr):
+        opcode = instr.opcode
+        npc = self._next(pc)
+        if opcode == 'nop':
+            def handler(regs, fr): return npc
+        elif opcode == 'label':
+            lab = instr.arg1
+            enter = self.fall_enter.get(pc)
+            if not self.has_phis:
+                def handler(regs, fr): return npc
+            elif enter is None:
+                def handler(regs, fr):
+                    fr.lab_prev, fr.lab_cur = fr.lab_cur, lab
+                    return npc
+            else:
+                def handler(regs, fr):
+                    fr.lab_prev, fr.lab_cur = fr.lab_cur, lab
+                    return enter(regs, fr)
+        elif opcode == 'phi':
+            if pc not in self.hidden:
+                # a phi before the first label can never be resolved
+                def handler(regs, fr):
+                    raise _phi_error(fr.lab_prev, instr)
+                return handler
+            write, h = self._writer(instr.dest), self.hidden[pc]
+            def handler(regs, fr):
+                if regs[h] is _unresolved:
+                    raise _phi_error(fr.lab_prev, instr)
+                write(regs, regs[h])
+                return npc
+        elif opcode == 'jmp':
+            tpc, go = self._target(instr.arg1)
+            if go is None:
+                def handler(regs, fr): return tpc
+            else:
+                handler = go
+        elif opcode in jumps:
+            tpc, go = self._target(instr.arg2)
+            if self._istemp(instr.arg1) and opcode in ('jz', 'jnz'):
+                a, want_zero = self._slot(instr.arg1), opcode == 'jz'
+                if go is None:
+                    def handler(regs, fr):
+                        return tpc if (regs[a] == 0) == want_zero else npc
+                else:
+                    def handler(regs, fr):
+                        if (regs[a] == 0) == want_zero: return go(regs, fr)
+                        return npc
+            else:
+                read, test = self._reader(instr.arg1), jumps[opcode]
+                if go is None:
+                    def handler(regs, fr):
+                        return tpc if test(read(regs)) else npc
+                else:
+                    def handler(regs, fr):
+                        if test(read(regs)): return go(regs, fr)
+                        return npc
+        elif opcode == 'const':
+            if not isinstance(instr.arg1, int):
+                raise RuntimeError(f'Missing or bad argument: {instr.arg1}')
+            val = twoc(instr.arg1)
+            if self._istemp(instr.dest):
+                d = self._slot(instr.dest)
+                def handler(regs, fr):
+                    regs[d] = val
+                    return npc
+            else:
+                write = self._writer(instr.dest)
+                def handler(regs, fr):
+                    write(regs, val)
+                    return npc
+        elif opcode == 'copy':
+            if self._istemp(instr.dest) and self._istemp(instr.arg1):
+                d, a = self._slot(instr.dest), self._slot(instr.arg1)
+                def handler(regs, fr):
+                    regs[d] = _written(regs[a])
+                    return npc
+            else:
+                write, read = self._writer(instr.dest), self._reader(instr.arg1, moved=True)
+                def handler(regs, fr):
+                    write(regs, read(regs))
+                    return npc
+        elif opcode == 'param':
+            if not isinstance(instr.arg1, int) or instr.arg1 < 1:
+                raise RuntimeError(f'Bad argument to param: '
+                                   f'expecting int >= 1, got {instr.arg1}')
+            idx, read = instr.arg1 - 1, self._reader(instr.arg2, moved=True)
+            def handler(regs, fr):
+                params = fr.params
+                while len(params) <= idx: params.append(None)
+                params[idx] = read(regs)
+                return npc
+        elif opcode == 'call':
+            handler = self._decode_call(instr, npc)
+        elif opcode == 'ret':
+            read = None if instr.arg1 == None else self._reader(instr.arg1, moved=True)
+            def handler(regs, fr):
+                fr.result = None if read is None else read(regs)
+                return -1
+        elif opcode in binops:
+            if self._istemp(instr.dest) and self._istemp(instr.arg1) \
+               and self._istemp(instr.arg2):
+                d = self._slot(instr.dest)
+                a, b = self._slot(instr.arg1), self._slot(instr.arg2)
+                if opcode in _wrapping_binops:
+                    # the same as binops[opcode] modulo 2^64
+                    fn = _wrapping_binops[opcode]
+                    def handler(regs, fr):
+                        regs[d] = fn(regs[a], regs[b]) & full_mask
+                        return npc
+                else:
+                    fn = binops[opcode]
+                    def handler(regs, fr):
+                        regs[d] = fn(regs[a], regs[b])
+                        return npc
+            else:
+                write = self._writer(instr.dest)
+                read1, read2 = self._reader(instr.arg1), self._reader(instr.arg2)
+                fn = binops[opcode]
+                def handler(regs, fr):
+                    write(regs, fn(read1(regs), read2(regs)))
+                    return npc
+        elif opcode in unops:
+            if instr.arg2 != None:
+                raise RuntimeError(f'Unary operator {opcode} has two arguments!')
+            write, read = self._writer(instr.dest), self._reader(instr.arg1)
+            fn = unops[opcode]
+            def handler(regs, fr):
+                write(regs, fn(read(regs)))
+                return npc
+        else:
+            raise RuntimeError(f'Unknown opcode {opcode}')
+        return handler
+
+    def _fuse(self, pc, kinds):
+        """Return the handler of the superinstruction with the given kinds
+        that starts at `pc'"""
+        body = self.proc.body
+        npc = self._next(pc + len(kinds) - 1)
+        if kinds not in _fused_templates:
+            first, second = self.code[pc], self.code[pc + 1]
+            def handler(regs, fr):
+                first(regs, fr)
+                return second(regs, fr)
+            return handler
+        instrs = body[pc:pc + len(kinds)]
+        def binop(instr):
+            fn = _wrapping_binops.get(instr.opcode, binops[instr.opcode])
+            return (self._slot(instr.dest), fn,
+                    self._slot(instr.arg1), self._slot(instr.arg2))
+        def branch(instr, npc):
+            """Return (t, want_zero, test, go): the jump is taken when
+            `test(regs[t])' is true, or when `regs[t] == 0' is `want_zero'
+            if `test' is None; go(regs, fr) returns where to go then"""
+            tpc, go = self._target(instr.arg2)
+            if go is None: go = lambda regs, fr: tpc
+            if instr.opcode in ('jz', 'jnz'):
+                return self._slot(instr.arg1), instr.opcode == 'jz', None, go
+            return self._slot(instr.arg1), None, jumps[instr.opcode], go
+        if kinds == ('const', 'binop', 'test'):
+            c, k = self._slot(instrs[0].dest), twoc(instrs[0].arg1)
+            d, fn, a, b = binop(instrs[1])
+            t, want_zero, test, go = branch(instrs[2], npc)
+            if test is None:
+                def handler(regs, fr):
+                    regs[c] = k
+                    regs[d] = fn(regs[a], regs[b]) & full_mask
+                    if (regs[t] == 0) == want_zero: return go(regs, fr)
+                    return npc
+            else:
+                def handler(regs, fr):
+                    regs[c] = k
+                    regs[d] = fn(regs[a], regs[b]) & full_mask
+                    if test(regs[t]): return go(regs, fr)
+                    return npc
+        elif kinds == ('const', 'binop'):
+            c, k = self._slot(instrs[0].dest), twoc(instrs[0].arg1)
+            d, fn, a, b = binop(instrs[1])
+            def handler(regs, fr):
+                regs[c] = k
+                regs[d] = fn(regs[a], regs[b]) & full_mask
+                return npc
+        elif kinds == ('binop', 'test'):
+            d, fn, a, b = binop(instrs[0])
+            t, want_zero, test, go = branch(instrs[1], npc)
+            if test is None:
+                def handler(regs, fr):
+                    regs[d] = fn(regs[a], regs[b]) & full_mask
+                    if (regs[t] == 0) == want_zero: return go(regs, fr)
+                    return npc
+            else:
+                def handler(regs, fr):
+                    regs[d] = fn(regs[a], regs[b]) & full_mask
+                    if test(regs[t]): return go(regs, fr)
+                    return npc
+        elif kinds == ('binop', 'jmp'):
+            d, fn, a, b = binop(instrs[0])
+            tpc, go = self._target(instrs[1].arg1)
+            if go is None:
+                def handler(regs, fr):
+                    regs[d] = fn(regs[a], regs[b]) & full_mask
+                    return tpc
+            else:
+                def handler(regs, fr):
+                    regs[d] = fn(regs[a], regs[b]) & full_mask
+                    return go(regs, fr)
+        elif kinds == ('test', 'jmp'):
+            t, want_zero, test, go = branch(instrs[0], npc)
+            tpc, go2 = self._target(instrs[1].arg1)
+            if go2 is None: go2 = lambda regs, fr: tpc
+            if test is None:
+                def handler(regs, fr):
+                    if (regs[t] == 0) == want_zero: return go(regs, fr)
+                    return go2(regs, fr)
+            else:
+                def handler(regs, fr):
+                    if test(regs[t]): return go(regs, fr)
+                    return go2(regs, fr)
+        elif kinds == ('copy', 'copy'):
+            d1, a1 = self._slot(instrs[0].dest), self._slot(instrs[0].arg1)
+            d2, a2 = self._slot(instrs[1].dest), self._slot(instrs[1].arg1)
+            def handler(regs, fr):
+                regs[d1] = _written(regs[a1])
+                regs[d2] = _written(regs[a2])
+                return npc
+        elif kinds == ('binop', 'binop'):
+            d1, fn1, a1, b1 = binop(instrs[0])
+            d2, fn2, a2, b2 = binop(instrs[1])
+            def handler(regs, fr):
+                regs[d1] = fn1(regs[a1], regs[b1]) & full_mask
+                regs[d2] = fn2(regs[a2], regs[b2]) & full_mask
+                return npc
+        return handler
+
+    def _decode_call(self, instr, npc):
+        callee, nargs = instr.arg1, instr.arg2
+        if callee.startswith('@__bx_print'):
+            if callee == '@__bx_print_int':
+                if self.only_decimal:
+                    show = lambda u: str(untwoc(u))
+                else:
+                    show = lambda u: f'{untwoc(u): 20d}  0x{u:016x}  0b{u:064b}'
+            elif callee == '@__bx_print_bool':
+                show = lambda u: 'false' if u == 0 else 'true'
+            else:
+                raise RuntimeError(f'Unknown print() specialization: {callee}')
+            def handler(regs, fr):
+                if len(fr.params) != 1:
+                    raise RuntimeError(f'Bad number of arguments to print(): '
+                                       f'expected 1, got {len(fr.params)}')
+                fr.out(show(fr.params[0]))
+                fr.params = []
+                return npc
+            return handler
+        write = None if not instr.dest else self._writer(instr.dest)
+        def handler(regs, fr):
+            if len(fr.params) < nargs:
+                raise RuntimeError(f'Bad number of arguments to {callee}(): '
+                                   f'expected {nargs}, got {len(fr.params)}')
+            fr.callee, fr.write_result, fr.pc = callee, write, npc
+            return _CALL
+        return handler
+
+class _Threaded:
+    """The threaded interpreter for one program"""
+
+    def __init__(self, gvars, procs, **kwargs):
+        self.gvars = gvars
+        self.procs = procs
+        self.show_proc = kwargs.get('show_proc', False)
+        self.show_instr = kwargs.get('show_instr', False)
+        self.only_decimal = kwargs.get('only_decimal', True)
+        self.profile = kwargs.get('profile', None)
+        self.memo = kwargs.get('memo', None)
+        # superinstructions would hide instructions from traces and profiles
+        self.fuse = kwargs.get('fuse', True) and not self.show_instr \
+            and self.profile is None
+        self.out = kwargs.get('output', StdoutOutput()).write_line
+
+    def decoded(self, proc):
+        key = (self.show_instr, self.only_decimal, self.fuse)
+        dec = proc.info.decoded.get(key)
+        if dec is None or dec.gvars is not self.gvars:
+            dec = _Decoded(proc, self.gvars, *key)
+            proc.info.decoded[key] = dec
+        return dec
+
+    def enter(self, proc_name, args, depth):
+        """Return a frame for a new call of `proc_name' with `args'"""
+        dec = self.decoded(self.procs[proc_name])
+        fr = dec.pool.pop() if dec.pool else _Frame(dec)
+        fr.reset(args, depth)
+        fr.out = self.out
+        if self.show_proc: self.out(f'// {"  " * depth}entering {fr.desc()}')
+        return fr
+
+    def leave(self, fr, pc):
+        """Finish the call in frame `fr' that left with `pc' and return
+        its result"""
+        if pc == -2:
+            self.out(f'// {"  " * fr.depth}{fr.desc()} --> NONE')
+        elif self.show_proc:
+            self.out(f'// {"  " * fr.depth}{fr.desc()} --> {fr.result}')
+        if fr.memo_key is not None and pc == -1 and fr.result is not None:
+            self.memo.store(fr.memo_key, fr.result)
+        fr.args = fr.params = None
+        fr.dec.pool.append(fr)
+        return fr.result
+
+    def memo_lookup(self, fr, params):
+        """Return the memoized result of the call about to be made in `fr',
+        or Memo.missing; on a miss, the key to store the result under is
+        returned too"""
+        key = self.memo.key(fr.callee, params)
+        if key is None: return Memo.missing, None
+        return self.memo.lookup(key), key
+
+    def run(self, proc_name, args, depth=0):
+        if self.profile is not None:
+            return self.run_profiled(proc_name, args, depth)
+        memo = self.memo
+        stack = []
+        fr = self.enter(proc_name, args, depth)
+        code, regs, pc = fr.dec.code, fr.regs, 0
+        while True:
+            if self.show_instr:
+                body, indent, out = fr.dec.proc.body, '  ' * fr.depth, self.out
+                while pc >= 0:
+                    if pc < len(body): out(f'// {indent}[{pc+2: 4d}] {body[pc]}')
+                    pc = code[pc](regs, fr)
+            else:
+                while pc >= 0:
+                    pc = code[pc](regs, fr)
+            if pc == _CALL:
+                params, fr.params = fr.params, []
+                if memo is not None:
+                    result, key = self.memo_lookup(fr, params)
+                    if result is not Memo.missing:
+                        pc = fr.pc
+                        if fr.write_result is not None:
+                            fr.write_result(regs, result)
+                        continue
+                stack.append(fr)
+                fr = self.enter(fr.callee, params, fr.depth + 1)
+                if memo is not None: fr.memo_key = key
+                code, regs, pc = fr.dec.code, fr.regs, 0
+                continue
+            result = self.leave(fr, pc)
+            if not stack: return result
+            fr = stack.pop()
+            code, regs, pc = fr.dec.code, fr.regs, fr.pc
+            if fr.write_result is not None:
+                if result is None:
+                    raise RuntimeError(f'Illegal value: {result}')
+                fr.write_result(regs, result)
+
+    def run_profiled(self, proc_name, args, depth):
+        """Same as run(), but records everything in self.profile"""
+        prof, now = self.profile, time.perf_counter_ns
+        stack = []
+        fr = self.enter(proc_name, args, depth)
+        pp, node = prof.enter(fr.dec.proc, None)
+        code, regs, pc = fr.dec.code, fr.regs, 0
+        hits, ns = pp.hits, pp.ns
+        entered = seg = t = now()
+        while True:
+            while pc >= 0:
+                cur = pc
+                pc = code[pc](regs, fr)
+                t1 = now()
+                hits[cur] += 1
+                ns[cur] += t1 - t
+                t = t1
+            prof.stacks[node] = prof.stacks.get(node, 0) + t - seg
+            if pc == _CALL:
+                edge = (fr.dec.proc.name, fr.callee)
+                prof.edges[edge] = prof.edges.get(edge, 0) + 1
+                params, fr.params = fr.params, []
+                stack.append((fr, pp, node, entered))
+                fr = self.enter(fr.callee, params, fr.depth + 1)
+                pp, node = prof.enter(fr.dec.proc, node)
+                code, regs, pc = fr.dec.code, fr.regs, 0
+                hits, ns = pp.hits, pp.ns
+                entered = seg = t = now()
+                continue
+            prof.leave(pp, t - entered)
+            result = self.leave(fr, pc)
+            if not stack: return result
+            fr, pp, node, entered = stack.pop()
+            code, regs, pc = fr.dec.code, fr.regs, fr.pc
+            hits, ns = pp.hits, pp.ns
+            if fr.write_result is not None:
+                if result is None:
+                    raise RuntimeError(f'Illegal value: {result}')
+                fr.write_result(regs, result)
+            seg = t = now()
+
+def execute_threaded(gvars, procs, proc_name, args, **kwargs):
+    """Same as execute(), but using the threaded interpreter"""
+    return _Threaded(gvars, procs, **kwargs).run(proc_name, args,
+                                                  kwargs.get('depth', 0))
+
+# ------------------------------------------------------------------------------
+# Profiling
+
+class _ProcProfile:
+    def __init__(self, proc):
+        self.proc = proc
+        self.body = proc.body
+        # one more entry for falling off the end of the body
+        self.hits = [0] * (len(proc.body) + 1)
+        self.ns = [0] * (len(proc.body) + 1)
+        self.calls = 0
+        self.total_ns = 0   # wall time including callees
+        self.active = 0     # number of activations on the stack
+
+class Profile:
+    """Execution profile, filled in by execute(..., profile=Profile()) with
+    the threaded engine: hit counts and time for every instruction (and so
+    for every block and proc), call graph edge counts, and the time spent
+    in every call stack."""
+
+    def __init__(self):
+        self.procs = dict()     # proc name -> _ProcProfile
+        self.edges = dict()     # (caller, callee) -> number of calls
+        self.stacks = dict()    # call stack node -> time in its top proc
+        self._nodes = [None]    # call stack node -> (parent node, proc name)
+        self._node_ids = dict()
+
+    def enter(self, proc, parent):
+        """Record a call of `proc' from the call stack node `parent'"""
+        pp = self.procs.get(proc.name)
+        if pp is None or pp.body is not proc.body:
+            pp = self.procs[proc.name] = _ProcProfile(proc)
+        pp.calls += 1
+        pp.active += 1
+        key = (parent, proc.name)
+        node = self._node_ids.get(key)
+        if node is None:
+            node = self._node_ids[key] = len(self._nodes)
+            self._nodes.append(key)
+        return pp, node
+
+    def leave(self, pp, elapsed):
+        pp.active -= 1
+        if pp.active == 0: pp.total_ns += elapsed
+
+    def blocks(self, proc_name):
+        """Return a dict from the labels of the blocks of the proc to their
+        (hits, ns). Instructions before the first label are in a block
+        named by the proc."""
+        pp = self.procs[proc_name]
+        blocks = dict()
+        lab, hits, ns = proc_name, 0, 0
+        for pc, instr in enumerate(pp.body):
+            if instr.opcode == 'label' and \
+               (pc == 0 or pp.body[pc - 1].opcode != 'label'):
+                if pc > 0: blocks[lab] = (hits, ns)
+                lab, hits, ns = instr.arg1, 0, 0
+            hits = max(hits, pp.hits[pc])
+            ns += pp.ns[pc]
+        blocks[lab] = (hits, ns)
+        return blocks
+
+    def instr_heat(self, proc_name):
+        """Return a dict from the instructions of the proc to their (hits, ns),
+        suitable for cfg.CFG.write_dot(heat=...)"""
+        pp = self.procs[proc_name]
+        return {instr: (pp.hits[pc], pp.ns[pc]) for pc, instr in enumerate(pp.body)}
+
+    def sequences(self, length=2):
+        """Return a dict from the kinds of `length' adjacent instructions
+        of a block (as in _fusion_kind(), or the opcode) to the number of
+        times they were executed in a row, a guide to which sequences are
+        worth a superinstruction"""
+        counts = dict()
+        for pp in self.procs.values():
+            body = pp.body
+            kinds = [_fusion_kind(instr) or instr.opcode for instr in body]
+            for pc in range(len(body) - length + 1):
+                if 'label' in kinds[pc + 1:pc + length]: continue
+                n = min(pp.hits[pc:pc + length])
+                if n == 0: continue
+                seq = tuple(kinds[pc:pc + length])
+                counts[seq] = counts.get(seq, 0) + n
+        return counts
+
+    def dispatches(self, gvars):
+        """Return the number of instructions executed, and the number of
+        handlers that the threaded engine runs for them when it uses
+        superinstructions"""
+        executed = dispatched = 0
+        for pp in self.procs.values():
+            body = pp.body
+            executed += sum(pp.hits[:len(body)])
+            spans = _Decoded(pp.proc, gvars, False, True, True).spans
+            # the places reached other than by falling through
+            entries = {0}
+            for pc, instr in enumerate(body):
+                if instr.opcode == 'call':
+                    entries.add(pc + 1)
+                elif instr.opcode == 'label' and \
+                     (pc + 1 == len(body) or body[pc + 1].opcode != 'label'):
+                    entries.add(pc + 1)
+            for pc in entries:
+                while pc < len(body):
+                    dispatched += pp.hits[pc]
+                    if body[pc].opcode in ('jmp', 'ret'): break
+                    pc = spans.get(pc, pc + 1)
+                    if pc in entries: break
+        return executed, dispatched
+
+    @property
+    def js_obj(self):
+        return {'procs': [{'proc': name,
+                           'calls': pp.calls,
+                           'total_ns': pp.total_ns,
+                           'self_ns': sum(pp.ns),
+                           'blocks': [{'label': lab, 'hits': hits, 'ns': ns}
+                                      for lab, (hits, ns) in self.blocks(name).items()],
+                           'instrs': [{'pc': pc, 'instr': str(instr),
+                                       'hits': pp.hits[pc], 'ns': pp.ns[pc]}
+                                      for pc, instr in enumerate(pp.body)]}
+                          for name, pp in self.procs.items()],
+                'edges': [{'caller': caller, 'callee': callee, 'calls': n}
+                          for (caller, callee), n in self.edges.items()]}
+
+    def write_json(self, fp):
+        json.dump(self.js_obj, fp, indent=2)
+
+    def write_collapsed(self, fp):
+        """Write the time of every call stack in the collapsed format used
+        by flamegraph tools (one `proc;proc;... ns' line per stack)"""
+        paths = [None] * len(self._nodes)
+        for node in range(1, len(self._nodes)):
+            parent, name = self._nodes[node]
+            paths[node] = name if parent is None else f'{paths[parent]};{name}'
+        for node, ns in self.stacks.items():
+            fp.write(f'{paths[node]} {ns}\n')
+
+# --------------------------------------------------------------------------------
+# Binary TAC files (.tacb) are laid out as:
+#
+#   header   magic, version, size of the string table, number of items
+#   strings  every opcode, temporary, label and global name, in UTF-8,
+#            separated by NULs
+#   items    for every Gvar or Proc, in program order: kind (0 for a var, 1
+#            for a proc), name, number of proc arguments, and the initial
+#            value of the var or the file offset of the proc body
+#   bodies   for every Proc: number of instructions and of phi arguments,
+#            the proc arguments, the instructions, then the phi arguments
+#
+# An instruction is made of opcode, dest, the kinds of arg1 and arg2, arg1
+# and arg2. Names are indices in the string table, and the arg1 of a phi is
+# the range of its (label, temporary) pairs in the phi arguments. Integers
+# in [2**63, 2**64) are stored wrapped to two's complement, with the
+# _TACB_UNSIGNED bit set in the kind of the item or the arg.
+
+import mmap, struct
+from functools import partial
+
+_tacb_magic, _tacb_version = b'TACB', 1
+_tacb_header = struct.Struct('<4sHxxII')
+_tacb_item = struct.Struct('<B3xIIq')
+_tacb_body = struct.Struct('<II')
+_tacb_instr = struct.Struct('<IIB3xqq')
+_tacb_pair = struct.Struct('<II')
+_tacb_nostr = 0xffffffff
+_TACB_NONE, _TACB_STR, _TACB_INT, _TACB_PHI = range(4)
+_TACB_UNSIGNED = 16
+
+def _tacb_int(value):
+    """Return the _TACB_UNSIGNED bit and the signed word of `value'"""
+    if value >= 1 << 63: return _TACB_UNSIGNED, value - (1 << 64)
+    return 0, value
+
+def write_tacb(prog, fp):
+    """Write the Gvars and Procs of `prog' to the binary file `fp'"""
+    strings = dict()
+    def sid(name):
+        if name is None: return _tacb_nostr
+        if name not in strings:
+            if '\0' in name: raise ValueError(f'Bad name: {name!r}')
+            strings[name] = len(strings)
+        return strings[name]
+    def arg(thing, pairs):
+        if thing is None: return _TACB_NONE, 0
+        if isinstance(thing, str): return _TACB_STR, sid(thing)
+        if isinstance(thing, dict):
+            start = len(pairs)
+            pairs.extend(_tacb_pair.pack(sid(l), sid(t)) for l, t in thing.items())
+            return _TACB_PHI, start << 32 | len(thing)
+        unsigned, value = _tacb_int(thing)
+        return _TACB_INT | unsigned, value
+    items, bodies = [], []
+    for tlv in prog:
+        if isinstance(tlv, Gvar):
+            sid(tlv.name)
+            items.append((0, tlv.name, 0, tlv.value))
+            continue
+        instrs, pairs = [], []
+        for instr in tlv.body:
+            kind1, arg1 = arg(instr.arg1, pairs)
+            kind2, arg2 = arg(instr.arg2, pairs)
+            try:
+                instrs.append(_tacb_instr.pack(sid(instr.opcode), sid(instr.dest),
+                                               kind1 | kind2 << 2, arg1, arg2))
+            except struct.error as exc:
+                raise ValueError(f'{tlv.name}: cannot encode {instr}: {exc}')
+        args = struct.pack(f'<{len(tlv.t_args)}I', *map(sid, tlv.t_args))
+        bodies.append(b''.join([_tacb_body.pack(len(instrs), len(pairs)), args,
+                                *instrs, *pairs]))
+        sid(tlv.name)
+        items.append((1, tlv.name, len(tlv.t_args), None))
+    blob = '\0'.join(strings).encode('utf-8')
+    fp.write(_tacb_header.pack(_tacb_magic, _tacb_version, len(blob), len(items)))
+    fp.write(blob)
+    offset = _tacb_header.size + len(blob) + len(items) * _tacb_item.size
+    procs = iter(bodies)
+    for kind, name, nargs, value in items:
+        if kind == 1:
+            value = offset
+            offset += len(next(procs))
+        else:
+            unsigned, value = _tacb_int(value)
+            kind |= unsigned
+        try:
+            fp.write(_tacb_item.pack(kind, strings[name], nargs, value))
+        except struct.error as exc:
+            raise ValueError(f'{name}: cannot encode {value}: {exc}')
+    for body in bodies: fp.write(body)
+
+def _tacb_load_body(buf, strings, pos, ninstrs, npairs):
+    end = pos + ninstrs * _tacb_instr.size
+    pairs = [(strings[l], strings[t]) for l, t in
+             _tacb_pair.iter_unpack(buf[end:end + npairs * _tacb_pair.size])]
+    def arg(kind, value):
+        if kind == _TACB_STR: return strings[value]
+        if kind == _TACB_INT: return value
+        if kind == _TACB_INT | _TACB_UNSIGNED: return value + (1 << 64)
+        if kind == _TACB_PHI:
+            start = value >> 32
+            return dict(pairs[start:start + (value & 0xffffffff)])
+        return None
+    return [Instr.trusted(None if dest == _tacb_nostr else strings[dest],
+                          strings[opcode],
+                          (arg(kinds & (3 | _TACB_UNSIGNED), arg1),
+                           arg(kinds >> 2 & (3 | _TACB_UNSIGNED), arg2)))
+            for opcode, dest, kinds, arg1, arg2 in
+            _tacb_instr.iter_unpack(buf[pos:end])]
+
+def _tacb_elements(tac_file):
+    """Yield the Gvars and Procs of the .tacb file `tac_file', which is
+    mapped in memory; the proc bodies are only decoded when first used"""
+    with open(tac_file, 'rb') as fp:
+        try:
+            buf = memoryview(mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ))
+        except ValueError:      # empty file
+            buf = memoryview(b'')
+    if len(buf) < _tacb_header.size:
+        raise ValueError(f'{tac_file}: not a .tacb file')
+    magic, version, size, nitems = _tacb_header.unpack_from(buf, 0)
+    if magic != _tacb_magic or version != _tacb_version:
+        raise ValueError(f'{tac_file}: not a .tacb file (version {_tacb_version})')
+    pos = _tacb_header.size
+    symbols = Symbols()
+    strings = [symbols.intern(name)
+               for name in str(buf[pos:pos + size], 'utf-8').split('\0')]
+    pos += size
+    for _ in range(nitems):
+        kind, name, nargs, value = _tacb_item.unpack_from(buf, pos)
+        pos += _tacb_item.size
+        if kind & ~_TACB_UNSIGNED == 0:
+            if kind & _TACB_UNSIGNED: value += 1 << 64
+            yield Gvar(strings[name], value)
+            continue
+        ninstrs, npairs = _tacb_body.unpack_from(buf, value)
+        value += _tacb_body.size
+        args = [strings[a] for a in struct.unpack_from(f'<{nargs}I', buf, value)]
+        value += 4 * nargs
+        yield Proc.lazy(strings[name], args,
+                        partial(_tacb_load_body, buf, strings, value, ninstrs, npairs),
+                        symbols)
 
 # --------------------------------------------------------------------------------
+# Writers of whole programs. They format every instruction straight from its
+# fields, without going through Instr.__str__ or js_obj, and hand the file
+# chunks of about `chunk_size' characters.
 
 import json
 
-def load_tac(tac_file):
-    """Load the TAC instructions from the given `tac_file'"""
+def _write_chunks(fp, pieces, chunk_size):
+    chunk, size = [], 0
+    for piece in pieces:
+        chunk.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            fp.write(''.join(chunk))
+            chunk, size = [], 0
+    if chunk: fp.write(''.join(chunk))
+
+def _tac_pieces(prog):
+    text = Instr.text
+    for tlv in prog:
+        if isinstance(tlv, Gvar):
+            yield str(tlv)
+            continue
+        yield f'proc {tlv.name}({", ".join(tlv.t_args)}):\n'
+        for instr in tlv.body:
+            yield text(instr.dest, instr.opcode, instr.arg1, instr.arg2)
+            yield '\n'
+
+def write_tac(prog, fp, chunk_size=1 << 16):
+    """Write the Gvars and Procs of `prog' to `fp' in .tac form"""
+    _write_chunks(fp, _tac_pieces(prog), chunk_size)
+
+# The JSON is laid out as json.dump(..., indent=2) would
+
+_js_str = json.encoder.encode_basestring_ascii
+
+def _js_arg(arg):
+    if arg is None: return 'null'
+    if isinstance(arg, str): return _js_str(arg)
+    if isinstance(arg, dict):
+        if not arg: return '{}'
+        pairs = ',\n            '.join(f'{_js_str(lab)}: {_js_str(tmp)}'
+                                      for lab, tmp in arg.items())
+        return f'{{\n            {pairs}\n          }}'
+    return int.__repr__(arg)
+
+def _tac_json_pieces(prog):
+    sep = '[\n  '
+    for tlv in prog:
+        yield sep
+        sep = ',\n  '
+        if isinstance(tlv, Gvar):
+            yield json.dumps(tlv.js_obj, indent=2).replace('\n', '\n  ')
+            continue
+        yield f'{{\n    "proc": {_js_str(tlv.name)},\n    "args": '
+        if tlv.t_args:
+            yield '[\n      ' + ',\n      '.join(map(_js_str, tlv.t_args)) + '\n    ]'
+        else:
+            yield '[]'
+        yield ',\n    "body": '
+        if not tlv.body:
+            yield '[]\n  }'
+            continue
+        isep = '[\n      '
+        for instr in tlv.body:
+            dest = instr.dest
+            yield (f'{isep}{{\n        "opcode": {_js_str(instr.opcode)},\n'
+                   f'        "args": [\n          {_js_arg(instr.arg1)},\n'
+                   f'          {_js_arg(instr.arg2)}\n        ],\n'
+                   f'        "result": {"null" if dest is None else _js_str(dest)}\n'
+                   f'      }}')
+            isep = ',\n      '
+        yield '\n    ]\n  }'
+    yield '[]' if sep == '[\n  ' else '\n]'
+
+def write_tac_json(prog, fp, chunk_size=1 << 16):
+    """Write the Gvars and Procs of `prog' to `fp' in .tac.json form"""
+    _write_chunks(fp, _tac_json_pieces(prog), chunk_size)
+
+parsers = ('ply', 'fast')
+
+def load_tac(tac_file, parser='ply'):
+    """Load the TAC instructions from the given `tac_file'. A .tac file is
+    parsed with PLY, or with FastParser if `parser' is 'fast'. The procs of
+    a .tacb file are decoded on first use."""
+    if parser not in parsers:
+        raise ValueError(f'Unknown parser: {parser}')
+    if tac_file.endswith('.tacb'):
+        return list(_tacb_elements(tac_file))
     with open(tac_file, 'r') as fp:
         if tac_file.endswith('.tac'):
             text = fp.read()
+            if parser == 'fast':
+                return FastParser(text, tac_file).parse()
             lexer = Lexer(text, tac_file)
             parser = Parser(lexer)
             return parser.parse()
         elif tac_file.endswith('.tac.json'):
-            return [Gvar.load(obj) or Proc.load(obj) \
+            symbols = Symbols()
+            return [Gvar.load(obj, symbols) or Proc.load(obj, symbols) \
                     for obj in json.load(fp)]
         else:
-            raise ValueError(f'TAC file must be a .tac or a .tac.json')
+            raise ValueError(f'TAC file must be a .tac, a .tac.json or a .tacb')
+
+def _json_elements(fp, chunk_size):
+    """Yield (obj, text) for every element of the JSON array read from `fp',
+    where `text' is the JSON source of `obj'. Only the current element is
+    kept in memory."""
+    decoder = json.JSONDecoder()
+    buf, pos, eof = '', 0, False
+    def fill(size):
+        nonlocal buf, pos, eof
+        chunk = fp.read(size)
+        eof = not chunk
+        buf = buf[pos:] + chunk
+        pos = 0
+        return not eof
+    def skip_ws():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\n\r': pos += 1
+            if pos < len(buf) or not fill(chunk_size): return
+    skip_ws()
+    if buf[pos:pos + 1] != '[':
+        raise ValueError(f'{fp.name}: expected a JSON array')
+    pos += 1
+    skip_ws()
+    if buf[pos:pos + 1] == ']': return
+    while True:
+        while True:
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+                break
+            except json.JSONDecodeError:
+                # the element may not be complete yet: read at least as much
+                # again as is pending, so that a big element is decoded
+                # in linear time
+                if eof or not fill(max(chunk_size, len(buf) - pos)): raise
+        yield obj, buf[pos:end]
+        pos = end
+        skip_ws()
+        sep = buf[pos:pos + 1]
+        pos += 1
+        if sep == ']': return
+        if sep != ',':
+            raise ValueError(f'{fp.name}: expected , or ] in the JSON array')
+        skip_ws()
+
+def _lazy_proc(js_obj, text, symbols):
+    proc = Proc.load(dict(js_obj, body=()), symbols)
+    if proc is None: return
+    return Proc.lazy(proc.name, proc.t_args,
+                     lambda: [Instr.load(i, check=False) for i in
+                              json.loads(text).get('body', [])],
+                     symbols)
+
+def iter_tac(tac_file, parser='ply', chunk_size=1 << 16):
+    """Yield the Gvars and Procs of the given `tac_file' one by one. A
+    .tac.json file is read incrementally, and the bodies of its procs are
+    only decoded when first used, so that a tool that handles one proc at a
+    time runs in bounded memory. A .tacb file is mapped in memory and its
+    proc bodies are decoded on demand. A .tac file is loaded with
+    load_tac()."""
+    if tac_file.endswith('.tacb'):
+        yield from _tacb_elements(tac_file)
+        return
+    if not tac_file.endswith('.tac.json'):
+        yield from load_tac(tac_file, parser)
+        return
+    symbols = Symbols()
+    with open(tac_file, 'r') as fp:
+        for obj, text in _json_elements(fp, chunk_size):
+            yield Gvar.load(obj, symbols) or _lazy_proc(obj, text, symbols)
 
 if __name__ == '__main__':
     from argparse import ArgumentParser
     ap = ArgumentParser(description='TAC parser and interpreter')
     ap.add_argument('files', metavar='FILE', type=str, nargs='*',
-                    help='A TAC file (.tac or .tac.json)')
+                    help='A TAC file (.tac, .tac.json or .tacb)')
     ap.add_argument('-v', dest='verbosity', default=0, action='count',
                     help='increase verbosity')
+    ap.add_argument('--parser', dest='parser', choices=parsers, default='ply',
+                    help='Parser for .tac files (default: ply)')
     ap.add_argument('--dump-json', dest='dump_json', action='store_true',
                     default=False,
                     help='Dump the TAC in JSON form (if needed)')
+    ap.add_argument('--dump-tacb', dest='dump_tacb', action='store_true',
+                    default=False,
+                    help='Dump the TAC in binary form (.tacb, if needed)')
     ap.add_argument('--trace-procs', dest='trace_procs',
                     action='store_true', default=False,
                     help='Print enter/leave messages for procedure calls')
@@ -607,28 +2565,108 @@ if __name__ == '__main__':
     ap.add_argument('--no-exec', dest='execute', action='store_false',
                     default=True,
                     help='Do not run the interpreter')
+    ap.add_argument('--engine', dest='engine', choices=engines,
+                    default=None,
+                    help='Interpreter to use (default: classic, or threaded '
+                    'when profiling); the compiled engine (see tac2py.py) '
+                    'does not trace')
+    ap.add_argument('--columnar', dest='columnar', action='store_true',
+                    default=False,
+                    help='Store the proc bodies as arrays (see ColumnarBody)')
+    ap.add_argument('--no-fuse', dest='fuse', action='store_false',
+                    default=True,
+                    help='Do not fuse instructions into superinstructions in '
+                    'the threaded engine')
+    ap.add_argument('--profile', dest='profile', metavar='FILE',
+                    default=None,
+                    help='Profile the execution and write the result as JSON '
+                    'to FILE')
+    ap.add_argument('--profile-collapsed', dest='profile_collapsed',
+                    metavar='FILE', default=None,
+                    help='Profile the execution and write the time of every '
+                    'call stack to FILE, in the collapsed format of flamegraphs')
+    ap.add_argument('--fusion-report', dest='fusion_report',
+                    action='store_true', default=False,
+                    help='Profile the execution and print to stderr the most '
+                    'executed instruction sequences, and how many dispatches '
+                    'superinstructions save')
+    ap.add_argument('--memo', dest='memo', action='store_true', default=False,
+                    help='Memoize the calls to pure procs, and print '
+                    'statistics to stderr')
+    ap.add_argument('--memo-size', dest='memo_size', metavar='N', type=int,
+                    default=1 << 16,
+                    help='Maximum number of memoized results (default: 65536)')
+    ap.add_argument('--output', dest='output', metavar='FILE', default=None,
+                    help='Write the output of the program to FILE instead of '
+                    'stdout')
+    ap.add_argument('--flush-size', dest='flush_size', metavar='N', type=int,
+                    default=1 << 16,
+                    help='Buffer the output until N characters are pending '
+                    '(default: 65536; 0 writes every line at once)')
     args = ap.parse_args()
     if args.trace_all:
         args.trace_procs = True
         args.trace_instrs = True
+    profiling = args.profile or args.profile_collapsed or args.fusion_report
+    if args.engine is None:
+        args.engine = 'threaded' if profiling else 'classic'
     kwargs = dict(show_proc = args.trace_procs or args.verbosity > 3,
                   show_instr = args.trace_instrs or args.verbosity > 4,
-                  only_decimal = args.verbosity <= 1)
+                  only_decimal = args.verbosity <= 1,
+                  engine = args.engine,
+                  fuse = args.fuse)
+    if args.output is None:
+        kwargs['output'] = BufferedOutput(flush_size=args.flush_size)
+    else:
+        kwargs['output'] = BinaryOutput(open(args.output, 'wb'), args.flush_size)
     for srcfile in args.files:
         gvars, procs = dict(), dict()
         seen = set()
-        prog = load_tac(srcfile)
-        if args.dump_json and srcfile.endswith('.tac'):
-            with open(srcfile + '.json', 'w') as fp:
-                json.dump([tlv.js_obj for tlv in prog], fp, indent=2)
+        if args.execute or args.dump_json or args.dump_tacb:
+            prog = load_tac(srcfile, args.parser)
+        else:
+            prog = iter_tac(srcfile, args.parser)
+        if args.dump_json and srcfile.endswith(('.tac', '.tacb')):
+            with open(srcfile.removesuffix('b') + '.json', 'w') as fp:
+                write_tac_json(prog, fp)
+        if args.dump_tacb and not srcfile.endswith('.tacb'):
+            with open(srcfile.removesuffix('.json') + 'b', 'wb') as fp:
+                write_tacb(prog, fp)
         for tlv in prog:
             if tlv.name in seen:
                 raise RuntimeError(f'Repeated definition of {tlv.name}')
             seen.add(tlv.name)
             if isinstance(tlv, Proc): procs[tlv.name] = tlv
             else: gvars[tlv.name] = tlv
+        if args.columnar:
+            for proc in procs.values(): proc.make_columnar()
         if args.execute:
+            if profiling: kwargs['profile'] = Profile()
+            if args.memo: kwargs['memo'] = Memo(procs, args.memo_size)
             execute(gvars, procs, '@main', (), **kwargs)
+            if args.memo: print(kwargs['memo'], file=sys.stderr)
+            if args.profile:
+                with open(args.profile, 'w') as fp:
+                    kwargs['profile'].write_json(fp)
+            if args.profile_collapsed:
+                with open(args.profile_collapsed, 'w') as fp:
+                    kwargs['profile'].write_collapsed(fp)
+            if args.fusion_report:
+                prof = kwargs['profile']
+                executed, dispatched = prof.dispatches(gvars)
+                print(f'// {executed} instructions executed, {dispatched} '
+                      f'dispatches with superinstructions '
+                      f'({dispatched / max(executed, 1):.2f} per instruction)',
+                      file=sys.stderr)
+                for length in (2, 3):
+                    seqs = sorted(prof.sequences(length).items(),
+                                  key=lambda item: -item[1])
+                    for seq, n in seqs[:10]:
+                        print(f'// {n:12d}  {" ".join(seq)}'
+                              f'{"  (fused)" if _fusable(seq) else ""}',
+                              file=sys.stderr)
         elif args.verbosity > 0:
             for gvar in gvars.values(): print(gvar)
-            for proc in procs.values(): print(proc)
+            # drop every proc once printed: the bodies of lazily loaded
+            # procs are only built here, one at a time
+            for name in list(procs): print(procs.pop(name))
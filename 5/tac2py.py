@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+
+"""
+TAC to Python compiler
+
+Every tac.Proc is translated to the source of a Python function that works
+on 64-bit words (Python ints in [0, 2^64)), and compiled with compile().
+
+The blocks come from cfg.infer(). A block that is the target of only one
+jump, or that is very small, is inlined at the jump, so the body of a loop
+ends up inside the block of its header, which becomes a `while True' loop.
+The remaining blocks are selected by a dispatch loop on a block number.
+
+Compiled code objects are cached on disk, keyed by a hash of the JSON form
+of the proc, so later runs skip the translation.
+"""
+
+import tac
+import cfg as cfglib
+import hashlib, json, marshal, os, re, sys
+
+# ------------------------------------------------------------------------------
+
+version = 3
+cache_dir = os.environ.get('TAC2PY_CACHE',
+                           os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                        '__tac2py_cache__'))
+recursion_limit = 1 << 20
+
+max_inline_depth = 8   # nesting of inlined blocks
+max_dup_size = 4       # blocks at most this long are inlined at every jump
+
+_wrapping = {'add': '+', 'sub': '-', 'mul': '*',
+             'and': '&', 'or': '|', 'xor': '^'}
+_helpers = {'div': '_div', 'mod': '_mod', 'shl': '_shl', 'shr': '_shr'}
+_tests = {
+    'jz':   '{} == 0',
+    'jnz':  '{} != 0',
+    'jl':   '{} & SIGN',
+    'jle':  '{0} == 0 or {0} & SIGN',
+    'jnl':  'not {} & SIGN',
+    'jnle': '{0} != 0 and not {0} & SIGN',
+}
+
+class Runtime:
+    """The functions that compiled code calls into"""
+
+    def __init__(self, only_decimal=True, output=None):
+        self.div, self.mod = tac.binops['div'], tac.binops['mod']
+        self.shl, self.shr = tac.binops['shl'], tac.binops['shr']
+        out = self.out = (output or tac.StdoutOutput()).write_line
+        if only_decimal:
+            self.print_int = lambda u: out(str(tac.untwoc(u)))
+        else:
+            self.print_int = lambda u: out(f'{tac.untwoc(u): 20d}  0x{u:016x}  0b{u:064b}')
+        self.print_bool = lambda u: out('false' if u == 0 else 'true')
+
+    def unwritten(self, exc, names):
+        """Return the KeyError that the interpreters raise for the
+        NameError `exc', if it is about the Python variable of a
+        temporary in `names', else `exc'"""
+        var = re.search(r"'(\w+)'", str(exc)).group(1)
+        return KeyError(names[var]) if var in names else exc
+
+    def fell_off(self, proc_name, t_args, args):
+        # the depth of the call is the number of compiled procs running
+        depth, frame = -1, sys._getframe(1)
+        while frame is not None:
+            if frame.f_code.co_filename.startswith('<tac2py '): depth += 1
+            frame = frame.f_back
+        entry = {t: args[i] for i, t in enumerate(t_args)}
+        desc = ",".join(k + "=" + str(v) for k, v in entry.items())
+        self.out(f'// {"  " * depth}{proc_name}({desc}) --> NONE')
+
+# ------------------------------------------------------------------------------
+
+class _Translator:
+    """Translates a single tac.Proc into the source of a Python module
+    defining make(G, P, rt), which returns the compiled function and a
+    function to link it to the other procs."""
+
+    def __init__(self, proc):
+        self.proc = proc
+        # cfg.infer() rewrites the proc, so work on a copy. It renumbers the
+        # labels but not the phi arguments from labels that the proc does
+        # not have, which can never be used, so drop those
+        labels = {proc.name, *proc.info.labels}
+        copy = tac.Proc(proc.name, proc.t_args,
+                        [tac.Instr.trusted(i.dest, i.opcode,
+                                           ({l: t for l, t in i.arg1.items() if l in labels}
+                                            if i.opcode == 'phi' else i.arg1,
+                                            i.arg2))
+                         for i in proc.body],
+                        proc.symbols)
+        self.cfg = cfglib.infer(copy)
+        self.names = dict()     # operand -> Python name
+        self.globals = dict()   # global -> Python name
+        self.callees = dict()   # proc name -> Python name
+        self.lines = []
+        self.ids = {self.cfg.lab_entry: 0}
+        for bl in self.cfg.nodes():
+            self.ids.setdefault(bl.label, len(self.ids))
+        self.refs = {bl.label: 0 for bl in self.cfg.nodes()}
+        self.refs[self.cfg.lab_entry] += 1
+        self.hidden = dict()    # non-leading phi -> Python name
+        for bl in self.cfg.nodes():
+            for instr in bl.jumps:
+                dest = cfglib.get_jump_dest(instr)
+                if dest in self.refs: self.refs[dest] += 1
+            for n, instr in enumerate(bl.body):
+                if instr.opcode == 'phi' and \
+                   any(i.opcode != 'phi' for i in bl.body[:n]):
+                    self.hidden[instr] = f'h{len(self.hidden)}'
+
+    # -- operands
+
+    def temp(self, t):
+        if t not in self.names: self.names[t] = f'v{len(self.names)}'
+        return self.names[t]
+
+    def value(self, x):
+        if isinstance(x, int): return str(tac.twoc(x))
+        if x.startswith('@'):
+            if x not in self.globals: self.globals[x] = f'g{len(self.globals)}'
+            return f'{self.globals[x]}.value'
+        return self.temp(x)
+
+    def emit(self, depth, line):
+        self.lines.append('    ' * depth + line)
+
+    # -- instructions
+
+    def instr(self, depth, instr):
+        op, dest = instr.opcode, instr.dest
+        if op in ('nop', 'label'): return
+        if op == 'phi':
+            if instr in self.hidden:
+                self.emit(depth, f'{self.value(dest)} = {self.hidden[instr]}')
+        elif op == 'const':
+            self.emit(depth, f'{self.value(dest)} = {tac.twoc(instr.arg1)}')
+        elif op == 'copy':
+            self.emit(depth, f'{self.value(dest)} = {self.value(instr.arg1)}')
+        elif op in _wrapping:
+            a, b = self.value(instr.arg1), self.value(instr.arg2)
+            self.emit(depth, f'{self.value(dest)} = ({a} {_wrapping[op]} {b}) & MASK')
+        elif op in _helpers:
+            a, b = self.value(instr.arg1), self.value(instr.arg2)
+            self.emit(depth, f'{self.value(dest)} = {_helpers[op]}({a}, {b})')
+        elif op == 'neg':
+            self.emit(depth, f'{self.value(dest)} = (-{self.value(instr.arg1)}) & MASK')
+        elif op == 'not':
+            self.emit(depth, f'{self.value(dest)} = (~{self.value(instr.arg1)}) & MASK')
+        elif op == 'param':
+            self.emit(depth, f'p{instr.arg1 - 1} = {self.value(instr.arg2)}')
+        elif op == 'call':
+            args = ', '.join(f'p{i}' for i in range(instr.arg2))
+            if instr.arg1 == '@__bx_print_int':
+                self.emit(depth, f'_print_int(p0)')
+            elif instr.arg1 == '@__bx_print_bool':
+                self.emit(depth, f'_print_bool(p0)')
+            elif instr.arg1.startswith('@__bx_print'):
+                self.emit(depth, f'raise RuntimeError({repr("Unknown print() specialization: " + instr.arg1)})')
+            else:
+                if instr.arg1 not in self.callees:
+                    self.callees[instr.arg1] = f'c{len(self.callees)}'
+                call = f'{self.callees[instr.arg1]}({args})'
+                if dest: self.emit(depth, f'{self.value(dest)} = {call}')
+                else: self.emit(depth, call)
+        else:
+            raise ValueError(f'Cannot translate {instr}')
+
+    def edge(self, depth, lab_from, lab_to):
+        """Emit the parallel copy for the phis on the edge lab_from -> lab_to"""
+        dsts, srcs = [], []
+        for instr in self.cfg[lab_to].body:
+            if instr.opcode != 'phi': continue
+            if lab_from not in instr.arg1:
+                msg = (f'cannot resolve phi: came from {lab_from}, '
+                       f'can only handle [{",".join(instr.arg1.keys())}]')
+                self.emit(depth, f'raise RuntimeError({repr(msg)})')
+                return
+            dsts.append(self.hidden.get(instr) or self.value(instr.dest))
+            srcs.append(self.value(instr.arg1[lab_from]))
+        if dsts: self.emit(depth, f'{", ".join(dsts)} = {", ".join(srcs)}')
+
+    def jump(self, depth, lab_from, lab_to, region, chain):
+        """Emit the code to continue at block `lab_to' from `lab_from'"""
+        self.edge(depth, lab_from, lab_to)
+        if lab_to == region:
+            self.looping = True
+            self.emit(depth, 'continue')
+        elif lab_to != self.cfg.lab_entry and lab_to not in chain and \
+             len(chain) < max_inline_depth and \
+             (self.refs[lab_to] == 1 or
+              len(self.cfg[lab_to].body) + len(self.cfg[lab_to].jumps) <= max_dup_size):
+            self.block(depth, lab_to, region, chain + (lab_to,))
+        else:
+            if lab_to not in self.dispatched:
+                self.dispatched.add(lab_to)
+                self.worklist.append(lab_to)
+            self.emit(depth, f'blk = {self.ids[lab_to]}')
+            self.emit(depth, 'break' if self.in_region_loop else 'continue')
+
+    def block(self, depth, lab, region, chain):
+        bl = self.cfg[lab]
+        for instr in bl.body: self.instr(depth, instr)
+        for instr in bl.jumps:
+            if instr.opcode == 'ret':
+                if instr.arg1 is None: self.emit(depth, 'return None')
+                else: self.emit(depth, f'return {self.value(instr.arg1)}')
+                return
+            elif instr.opcode == 'jmp':
+                self.jump(depth, lab, instr.arg1, region, chain)
+                return
+            else:
+                self.emit(depth, f'if {_tests[instr.opcode].format(self.value(instr.arg1))}:')
+                self.jump(depth + 1, lab, instr.arg2, region, chain)
+        self.emit(depth, f'_fell_off({self.proc.name!r}, {self.proc.t_args!r}, _args)')
+        self.emit(depth, 'return None')
+        self.falls_off = True
+
+    def region(self, lab):
+        """Return the lines of the dispatch case of block `lab'"""
+        # translate assuming the block loops back to itself, and again
+        # without the loop if it does not
+        saved = set(self.dispatched), list(self.worklist)
+        self.lines, self.looping, self.in_region_loop = [], False, True
+        self.block(1, lab, lab, (lab,))
+        if self.looping: return ['while True:'] + self.lines
+        self.dispatched, self.worklist = saved
+        self.lines, self.in_region_loop = [], False
+        self.block(0, lab, lab, (lab,))
+        return self.lines
+
+    def translate(self):
+        proc = self.proc
+        self.falls_off = False
+        self.dispatched, self.worklist = {self.cfg.lab_entry}, []
+        params = [self.temp(t) for t in proc.t_args]
+        cases = [(0, self.region(self.cfg.lab_entry))]
+        while self.worklist:
+            lab = self.worklist.pop()
+            cases.append((self.ids[lab], self.region(lab)))
+        cases.sort()
+        # entry phis see the proc name as the previous label
+        self.lines = []
+        self.edge(3, proc.name, self.cfg.lab_entry)
+        body = self.lines
+        def emit(depth, line): body.append('    ' * depth + line)
+        if len(cases) == 1:
+            # no jumps out of the entry block: no dispatch needed
+            for line in cases[0][1]: emit(3, line)
+        else:
+            emit(3, 'blk = 0')
+            emit(3, 'while True:')
+            def tree(depth, cases):
+                if len(cases) == 1:
+                    for line in cases[0][1]: emit(depth, line)
+                    return
+                mid = len(cases) // 2
+                emit(depth, f'if blk < {cases[mid][0]}:')
+                tree(depth + 1, cases[:mid])
+                emit(depth, 'else:')
+                tree(depth + 1, cases[mid:])
+            tree(4, cases)
+        src = []
+        src.append(f'# {proc.name}')
+        src.append('def make(G, P, rt):')
+        src.append(f'    MASK, SIGN = {tac.full_mask}, {tac.sign_mask}')
+        src.append('    _div, _mod, _shl, _shr = rt.div, rt.mod, rt.shl, rt.shr')
+        src.append('    _print_int, _print_bool = rt.print_int, rt.print_bool')
+        src.append('    _fell_off, _unwritten = rt.fell_off, rt.unwritten')
+        for g, name in self.globals.items():
+            src.append(f'    {name} = G[{g!r}]')
+        for c, name in self.callees.items():
+            src.append(f'    {name} = None')
+        src.append(f'    def proc({", ".join(params + ["*_"])}):')
+        if self.falls_off:
+            src.append(f'        _args = ({"".join(p + ", " for p in params)})')
+        # reading a temporary that was never written raises a KeyError, as
+        # in the interpreters
+        src.append('        try:')
+        src.extend(body)
+        src.append('        except NameError as exc:')
+        names = {v: t for t, v in self.names.items()}
+        src.append(f'            raise _unwritten(exc, {names!r}) from None')
+        src.append('    def link():')
+        if self.callees:
+            src.append(f'        nonlocal {", ".join(self.callees.values())}')
+        for c, name in self.callees.items():
+            src.append(f'        {name} = P[{c!r}]')
+        if not self.callees:
+            src.append('        pass')
+        src.append('    return proc, link')
+        return '\n'.join(src) + '\n'
+
+def translate(proc):
+    """Return the Python source for the tac.Proc `proc'"""
+    return _Translator(proc).translate()
+
+# ------------------------------------------------------------------------------
+
+def _cache_key(proc):
+    js = json.dumps(proc.js_obj, sort_keys=True)
+    return hashlib.sha256(f'{version}:{js}'.encode()).hexdigest()
+
+def compile_proc(proc, use_cache=True):
+    """Return the code object for the module translated from `proc', from
+    the cache if possible"""
+    path = None
+    if use_cache:
+        path = os.path.join(cache_dir,
+                            f'{_cache_key(proc)}.{sys.implementation.cache_tag}.bin')
+        try:
+            with open(path, 'rb') as fp:
+                return marshal.load(fp)
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
+    code = compile(translate(proc), f'<tac2py {proc.name}>', 'exec')
+    if path is not None:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = f'{path}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as fp:
+                marshal.dump(code, fp)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+    return code
+
+def _memoized(func, name, memo):
+    def proc(*args):
+        key = memo.key(name, args)
+        result = memo.lookup(key)
+        if result is memo.missing:
+            result = func(*args)
+            if result is not None: memo.store(key, result)
+        return result
+    proc.__wrapped__ = func
+    return proc
+
+def load_procs(gvars, procs, use_cache=True, only_decimal=True, memo=None,
+               output=None):
+    """Compile all the `procs' and return a dict from their names to the
+    Python functions. Calls to pure procs go through `memo' if given, and
+    prints go to the sink `output' (default: stdout)."""
+    rt = Runtime(only_decimal, output)
+    funcs, links = dict(), []
+    for name, proc in procs.items():
+        namespace = dict()
+        exec(compile_proc(proc, use_cache), namespace)
+        funcs[name], link = namespace['make'](gvars, funcs, rt)
+        links.append(link)
+    if memo is not None:
+        for name in memo.pure:
+            funcs[name] = _memoized(funcs[name], name, memo)
+    for link in links: link()
+    return funcs
+
+def execute(gvars, procs, proc_name, args, **kwargs):
+    """Same as tac.execute(), but runs compiled code. Tracing is not
+    supported."""
+    funcs = load_procs(gvars, procs, kwargs.get('use_cache', True),
+                       kwargs.get('only_decimal', True), kwargs.get('memo'),
+                       kwargs.get('output'))
+    # like the interpreters, do not memoize the outermost call
+    func = funcs[proc_name]
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, recursion_limit))
+    try:
+        return getattr(func, '__wrapped__', func)(*args)
+    finally:
+        sys.setrecursionlimit(limit)
+
+# ------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    ap = ArgumentParser(description='TAC to Python compiler')
+    ap.add_argument('files', metavar='FILE', type=str, nargs='*',
+                    help='A TAC file (.tac or .tac.json)')
+    ap.add_argument('-S', dest='show_source', action='store_true',
+                    default=False,
+                    help='Print the generated Python instead of running it')
+    ap.add_argument('--no-cache', dest='use_cache', action='store_false',
+                    default=True,
+                    help='Do not use the cache of compiled procs')
+    args = ap.parse_args()
+    for srcfile in args.files:
+        gvars, procs = dict(), dict()
+        for tlv in tac.load_tac(srcfile):
+            if isinstance(tlv, tac.Proc): procs[tlv.name] = tlv
+            else: gvars[tlv.name] = tlv
+        if args.show_source:
+            for proc in procs.values(): print(translate(proc))
+        else:
+            execute(gvars, procs, '@main', (), use_cache=args.use_cache)
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+
+"""
+Batched TAC execution with NumPy
+
+execute_batch() runs the same proc on many argument vectors at once. Every
+lane (one run) keeps its temporaries in a column of uint64 arrays, and an
+instruction is performed for all the lanes of a group with a single
+vectorized operation.
+
+When the lanes of a group disagree on a conditional jump, the group is split
+in two. The waiting group with the smallest pc always runs first, and groups
+that reach the same pc are merged again, so the lanes of an if/else or of a
+loop with different trip counts run together again once they reconverge.
+
+Calls are batched too: the lanes of a group that reach a call run the callee
+together. Print output is collected per lane instead of being printed.
+"""
+
+import tac
+import numpy as np
+import sys
+
+# ------------------------------------------------------------------------------
+
+recursion_limit = 1 << 16
+
+_u64 = np.uint64
+_exact = 1 << 53       # ints below this are exact as float64
+
+_wrapping = {'add': np.add, 'sub': np.subtract, 'mul': np.multiply,
+             'and': np.bitwise_and, 'or': np.bitwise_or,
+             'xor': np.bitwise_xor}
+_tests = {
+    'jz':   lambda k: k == 0,
+    'jnz':  lambda k: k != 0,
+    'jl':   lambda k: k.view(np.int64) < 0,
+    'jle':  lambda k: k.view(np.int64) <= 0,
+    'jnl':  lambda k: k.view(np.int64) >= 0,
+    'jnle': lambda k: k.view(np.int64) > 0,
+}
+
+def _divmod(opcode, u, v):
+    """Vectorized tac.binops['div'] and tac.binops['mod']"""
+    if not v.all():
+        raise ZeroDivisionError('division by zero')
+    a, b = u.view(np.int64), v.view(np.int64)
+    big = (a >= _exact) | (a <= -_exact)
+    # truncating division, exact (like the interpreter) for small dividends
+    safe_b = np.where(big, 1, b)
+    q = np.floor_divide(a, safe_b)
+    q += (q * safe_b != a) & ((a < 0) != (safe_b < 0))
+    if opcode == 'div': res = q.view(_u64)
+    else: res = (a - safe_b * q).view(_u64)
+    # large dividends go through the interpreter's float division
+    if big.any():
+        op = tac.binops[opcode]
+        for i in np.flatnonzero(big):
+            res[i] = op(int(u[i]), int(v[i]))
+    return res
+
+def _shift(opcode, u, v):
+    """Vectorized tac.binops['shl'] and tac.binops['shr']"""
+    b = v.view(np.int64)
+    if (b < 0).any():
+        raise ValueError('negative shift count')
+    count = np.minimum(b, 63).astype(_u64)
+    if opcode == 'shl':
+        return np.where(b < 64, u << count, _u64(0))
+    return (u.view(np.int64) >> count.view(np.int64)).view(_u64)
+
+def _binop(opcode, u, v):
+    if opcode in _wrapping: return _wrapping[opcode](u, v)
+    if opcode in ('div', 'mod'): return _divmod(opcode, u, v)
+    return _shift(opcode, u, v)
+
+def _unop(opcode, u):
+    if opcode == 'neg': return np.negative(u)
+    return np.invert(u)
+
+# ------------------------------------------------------------------------------
+
+class _Group:
+    """Lanes of a call that are at the same pc. All the arrays are indexed by
+    position in the group; `pos' gives the position of each lane in the
+    call, and `lanes' its lane number in the batch."""
+
+    __slots__ = ('pc', 'pos', 'lanes', 'regs', 'old', 'prev', 'cur', 'params')
+
+    def __init__(self, pc, pos, lanes, regs, old, prev, cur, params):
+        self.pc = pc
+        self.pos = pos
+        self.lanes = lanes
+        self.regs = regs        # temporary -> array of values
+        self.old = old          # self.regs when the last jump was taken
+        self.prev = prev        # ids of the previous labels
+        self.cur = cur          # ids of the current labels
+        self.params = params
+
+    def subset(self, mask):
+        """Return the group of the lanes selected by `mask'"""
+        return _Group(self.pc, self.pos[mask], self.lanes[mask],
+                      {t: a[mask] for t, a in self.regs.items()},
+                      {t: a[mask] for t, a in self.old.items()},
+                      self.prev[mask], self.cur[mask],
+                      [None if p is None else p[mask] for p in self.params])
+
+    @staticmethod
+    def merge(groups):
+        """Return a single group with the lanes of all `groups', which must
+        be at the same pc"""
+        if len(groups) == 1: return groups[0]
+        def cat(arrays):
+            return np.concatenate(arrays)
+        def cat_temps(dicts):
+            # a temp not defined in some group is 0 there, as it is never
+            # read by those lanes in a well-formed program
+            temps = set().union(*dicts)
+            return {t: cat([d[t] if t in d else np.zeros(len(g.pos), _u64)
+                            for d, g in zip(dicts, groups)])
+                    for t in temps}
+        nparams = max(len(g.params) for g in groups)
+        params = []
+        for i in range(nparams):
+            ps = [g.params[i] if i < len(g.params) else None for g in groups]
+            if any(p is None for p in ps): params.append(None)
+            else: params.append(cat(ps))
+        return _Group(groups[0].pc,
+                      cat([g.pos for g in groups]),
+                      cat([g.lanes for g in groups]),
+                      cat_temps([g.regs for g in groups]),
+                      cat_temps([g.old for g in groups]),
+                      cat([g.prev for g in groups]),
+                      cat([g.cur for g in groups]),
+                      params)
+
+class Batch:
+    """The outcome of execute_batch() for every lane"""
+
+    def __init__(self, nlanes, gvars):
+        self.results = np.zeros(nlanes, _u64)
+        self.returned = np.zeros(nlanes, bool)
+        self.output = [[] for _ in range(nlanes)]
+        self.globals = {name: np.full(nlanes, tac.twoc(gvar.value), _u64)
+                        for name, gvar in gvars.items()}
+
+    def result(self, lane):
+        """Return the result of `lane', or None if it returned nothing"""
+        return int(self.results[lane]) if self.returned[lane] else None
+
+class _Runner:
+    def __init__(self, gvars, procs, nlanes, only_decimal=True):
+        self.procs = procs
+        self.only_decimal = only_decimal
+        self.batch = Batch(nlanes, gvars)
+        self.label_ids = dict()
+
+    def ids(self, proc):
+        """Return a dict from the labels of `proc' (and its name, which is
+        the previous label on entry) to small ints"""
+        ids = self.label_ids.get(proc.name)
+        if ids is None:
+            ids = {lab: i for i, lab in enumerate((proc.name, *proc.info.labels))}
+            self.label_ids[proc.name] = ids
+        return ids
+
+    def show(self, u):
+        if self.only_decimal: return str(tac.untwoc(u))
+        return f'{tac.untwoc(u): 20d}  0x{u:016x}  0b{u:064b}'
+
+    def run(self, proc_name, lanes, args, depth=0):
+        """Run `proc_name' on the `lanes' with arguments `args' (a list of
+        arrays) in a call `depth' calls deep, and return the arrays of
+        results and of whether a result was returned"""
+        proc = self.procs[proc_name]
+        labels, ids = proc.info.labels, self.ids(proc)
+        body, G, output = proc.body, self.batch.globals, self.batch.output
+        n = len(lanes)
+        results = np.zeros(n, _u64)
+        returned = np.zeros(n, bool)
+        regs = {t: args[i] for i, t in enumerate(proc.t_args[:proc.info.nparams])}
+        entry = _Group(0, np.arange(n), lanes, regs, dict(regs),
+                       np.full(n, ids[proc_name]), np.full(n, ids[proc_name]), [])
+        waiting = [entry]
+        while waiting:
+            pc = min(g.pc for g in waiting)
+            grp = _Group.merge([g for g in waiting if g.pc == pc])
+            waiting = [g for g in waiting if g.pc != pc]
+            stop = min((g.pc for g in waiting), default=len(body))
+            regs = grp.regs
+            def read(tmp):
+                return G[tmp][grp.lanes] if tmp.startswith('@') else regs[tmp]
+            def write(tmp, val):
+                if tmp.startswith('@'): G[tmp][grp.lanes] = val
+                else: regs[tmp] = val
+            def jump(lab):
+                if lab not in labels:
+                    raise RuntimeError(f'Unknown jump destination {lab}')
+                grp.prev, grp.cur = grp.cur, np.full(len(grp.pos), ids[lab])
+                grp.old = dict(regs)
+                return labels[lab]
+            while pc < stop:
+                instr = body[pc]
+                pc += 1
+                op = instr.opcode
+                if op == 'nop':
+                    pass
+                elif op == 'label':
+                    # fell through: the phis see the values at this point
+                    grp.prev, grp.cur = grp.cur, np.full(len(grp.pos), ids[instr.arg1])
+                    if proc.info.has_phis: grp.old = dict(regs)
+                elif op == 'phi':
+                    val = np.zeros(len(grp.pos), _u64)
+                    done = np.zeros(len(grp.pos), bool)
+                    for lab, tmp in instr.arg1.items():
+                        if lab not in ids: continue
+                        m = grp.prev == ids[lab]
+                        if m.any():
+                            old = G[tmp][grp.lanes] if tmp.startswith('@') else grp.old[tmp]
+                            val[m] = old[m]
+                            done |= m
+                    if not done.all():
+                        back = {i: lab for lab, i in ids.items()}
+                        lab_prev = back[int(grp.prev[np.argmin(done)])]
+                        raise RuntimeError(f'cannot resolve phi: '
+                                           f'came from {lab_prev}, '
+                                           f'can only handle [{",".join(instr.arg1.keys())}]')
+                    write(instr.dest, val)
+                elif op == 'jmp':
+                    pc = jump(instr.arg1)
+                elif op in _tests:
+                    taken = _tests[op](read(instr.arg1))
+                    if taken.all():
+                        pc = jump(instr.arg2)
+                    elif taken.any():
+                        grp.regs, grp.pc = regs, pc
+                        other = grp.subset(taken)
+                        grp = grp.subset(~taken)
+                        regs = grp.regs
+                        regs_other = other.regs
+                        other.prev, other.cur = other.cur, np.full(len(other.pos), ids[instr.arg2])
+                        other.old = dict(regs_other)
+                        if instr.arg2 not in labels:
+                            raise RuntimeError(f'Unknown jump destination {instr.arg2}')
+                        other.pc = labels[instr.arg2]
+                        waiting.append(other)
+                        stop = min(stop, other.pc)
+                elif op == 'const':
+                    write(instr.dest, np.full(len(grp.pos), tac.twoc(instr.arg1), _u64))
+                elif op == 'copy':
+                    write(instr.dest, read(instr.arg1))
+                elif op == 'param':
+                    params = grp.params
+                    for _ in range(instr.arg1 - len(params)): params.append(None)
+                    params[instr.arg1 - 1] = read(instr.arg2)
+                elif op == 'call':
+                    params, grp.params = grp.params, []
+                    if instr.arg1.startswith('@__bx_print'):
+                        if len(params) != 1:
+                            raise RuntimeError(f'Bad number of arguments to print(): '
+                                               f'expected 1, got {len(params)}')
+                        if instr.arg1 == '@__bx_print_int':
+                            show = self.show
+                        elif instr.arg1 == '@__bx_print_bool':
+                            show = lambda u: 'false' if u == 0 else 'true'
+                        else:
+                            raise RuntimeError(f'Unknown print() specialization: {instr.arg1}')
+                        for lane, u in zip(grp.lanes.tolist(), params[0].tolist()):
+                            output[lane].append(show(u))
+                    else:
+                        if len(params) < instr.arg2 or any(p is None for p in params[:instr.arg2]):
+                            raise RuntimeError(f'Bad number of arguments to {instr.arg1}(): '
+                                               f'expected {instr.arg2}, got {len(params)}')
+                        res, ok = self.run(instr.arg1, grp.lanes, params, depth + 1)
+                        if instr.dest:
+                            if not ok.all():
+                                raise RuntimeError(f'Illegal value: None')
+                            write(instr.dest, res)
+                elif op == 'ret':
+                    if instr.arg1 is not None:
+                        results[grp.pos] = read(instr.arg1)
+                        returned[grp.pos] = True
+                    break
+                elif op in _wrapping or op in tac.binops:
+                    write(instr.dest, _binop(op, read(instr.arg1), read(instr.arg2)))
+                elif op in tac.unops:
+                    write(instr.dest, _unop(op, read(instr.arg1)))
+                else:
+                    raise RuntimeError(f'Unknown opcode {op}')
+            else:
+                if pc < len(body):
+                    grp.regs, grp.pc = regs, pc
+                    waiting.append(grp)
+                    continue
+                # fell off the end of the body
+                for i in grp.pos.tolist():
+                    desc = ','.join(f'{t}={int(args[k][i])}'
+                                    for k, t in enumerate(proc.t_args[:proc.info.nparams]))
+                    output[int(lanes[i])].append(f'// {"  " * depth}{proc_name}({desc}) --> NONE')
+        return results, returned
+
+def execute_batch(gvars, procs, proc_name, args_matrix, **kwargs):
+    """Run `proc_name' once for every row of `args_matrix' (an N x nargs
+    array or sequence of argument tuples), and return a Batch. The
+    globals are per lane, starting from the values in `gvars', which are
+    not modified. Tracing is not supported."""
+    args_matrix = np.asarray(args_matrix)
+    if args_matrix.ndim != 2:
+        args_matrix = args_matrix.reshape(len(args_matrix), -1)
+    if args_matrix.dtype.kind == 'i':
+        args_matrix = args_matrix.astype(np.int64).view(_u64)
+    else:
+        args_matrix = args_matrix.astype(_u64)
+    nlanes = len(args_matrix)
+    runner = _Runner(gvars, procs, nlanes, kwargs.get('only_decimal', True))
+    nparams = procs[proc_name].info.nparams
+    if args_matrix.shape[1] < nparams:
+        raise RuntimeError(f'Bad number of arguments to {proc_name}(): '
+                           f'expected {nparams}, got {args_matrix.shape[1]}')
+    if nlanes == 0: return runner.batch
+    args = [np.ascontiguousarray(args_matrix[:, i]) for i in range(args_matrix.shape[1])]
+    batch = runner.batch
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, recursion_limit))
+    try:
+        batch.results, batch.returned = runner.run(proc_name, np.arange(nlanes), args)
+    finally:
+        sys.setrecursionlimit(limit)
+    return batch
+
+# ------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    ap = ArgumentParser(description='Batched TAC interpreter')
+    ap.add_argument('file', metavar='FILE', type=str,
+                    help='A TAC file (.tac or .tac.json)')
+    ap.add_argument('--proc', dest='proc', default='@main',
+                    help='The proc to run (default: @main)')
+    ap.add_argument('--args', dest='args', metavar='ARGS', default=None,
+                    help='A file with the arguments of one lane per line, '
+                    'separated by whitespace')
+    ap.add_argument('--lanes', dest='lanes', type=int, default=1,
+                    help='Number of lanes when there is no ARGS file')
+    args = ap.parse_args()
+    gvars, procs = dict(), dict()
+    for tlv in tac.load_tac(args.file):
+        if isinstance(tlv, tac.Proc): procs[tlv.name] = tlv
+        else: gvars[tlv.name] = tlv
+    if args.args is None:
+        matrix = np.zeros((args.lanes, 0), np.int64)
+    else:
+        with open(args.args) as fp:
+            matrix = [[int(x) for x in line.split()] for line in fp if line.strip()]
+    batch = execute_batch(gvars, procs, args.proc, matrix)
+    for lane, lines in enumerate(batch.output):
+        print(f'// lane {lane}')
+        for line in lines: print(line)
+        if batch.returned[lane]:
+            print(f'// --> {tac.untwoc(batch.result(lane))}')
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of the .tac parsers
+
+Times tac.load_tac() with every parser in tac.parsers on the given files, or
+on a generated program of the requested size, and checks that all the
+parsers produce the same program.
+"""
+
+import tac
+import os, random, tempfile, time
+
+# ------------------------------------------------------------------------------
+
+def generate(fp, nprocs, ninstrs, seed=0):
+    """Write to `fp' a random (but syntactically valid) TAC program with
+    `nprocs' procs of `ninstrs' instructions each"""
+    rng = random.Random(seed)
+    ops = ['add', 'sub', 'mul', 'div', 'mod', 'and', 'or', 'xor', 'shl', 'shr']
+    fp.write('var @counter = 0;\n')
+    for p in range(nprocs):
+        fp.write(f'proc @p{p}(%a, %b):\n')
+        temps = ['%a', '%b']
+        for i in range(ninstrs):
+            r = rng.random()
+            if r < 0.05:
+                fp.write(f'%.L{p}_{i}:\n')
+            elif r < 0.25:
+                temps.append(f'%t{i}')
+                fp.write(f'  {temps[-1]} = const {rng.randrange(-1000, 1000) & 0x7fffffff};\n')
+            elif r < 0.8:
+                x, y = rng.choice(temps), rng.choice(temps)
+                temps.append(f'%{i}')
+                fp.write(f'  {temps[-1]} = {rng.choice(ops)} {x}, {y};  // op\n')
+            elif r < 0.9:
+                fp.write(f'  jz {rng.choice(temps)}, %.L{p}_{i};\n%.L{p}_{i}:\n')
+            else:
+                fp.write(f'  param 1, {rng.choice(temps)};\n'
+                         f'  call @__bx_print_int, 1;\n')
+        fp.write(f'  ret {temps[-1]};\n')
+
+def bench(path, repeat=3):
+    """Return a dict from the parsers to their best time on `path', after
+    checking that they all agree"""
+    times, results = dict(), dict()
+    for parser in tac.parsers:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            prog = tac.load_tac(path, parser)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        times[parser] = best
+        results[parser] = [tlv.js_obj for tlv in prog]
+    first = results[tac.parsers[0]]
+    for parser, result in results.items():
+        if result != first:
+            raise RuntimeError(f'{path}: {parser} and {tac.parsers[0]} disagree')
+    return times
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    ap = ArgumentParser(description='Benchmark of the .tac parsers')
+    ap.add_argument('files', metavar='FILE', type=str, nargs='*',
+                    help='A .tac file (default: a generated one)')
+    ap.add_argument('--procs', dest='procs', type=int, default=50,
+                    help='Number of procs of the generated file (default: 50)')
+    ap.add_argument('--instrs', dest='instrs', type=int, default=2000,
+                    help='Number of instructions of every generated proc '
+                    '(default: 2000)')
+    ap.add_argument('--repeat', dest='repeat', type=int, default=3,
+                    help='Number of runs of every parser (default: 3)')
+    args = ap.parse_args()
+    files, tmp = args.files, None
+    if not files:
+        fd, tmp = tempfile.mkstemp(suffix='.tac')
+        with os.fdopen(fd, 'w') as fp:
+            generate(fp, args.procs, args.instrs)
+        files = [tmp]
+    # build the PLY tables before timing anything
+    tac.Parser(tac.Lexer(''))
+    try:
+        for path in files:
+            times = bench(path, args.repeat)
+            size = os.path.getsize(path)
+            print(f'{path}: {size} bytes')
+            for parser, elapsed in times.items():
+                print(f'  {parser:6s} {elapsed:8.3f}s  {size / elapsed / 1e6:6.2f} MB/s  '
+                      f'x{times[tac.parsers[0]] / elapsed:.1f}')
+    finally:
+        if tmp is not None: os.remove(tmp)
@@ -2,36 +2,33 @@ import tac
 import cfg
 import ssagen
 import sys
-import json
 from cfg import CFG
-from cfg import recompute_liveness
 
 def DSE(cfg):
     # DSE (Global Dead Store Elimination)
     modified = True
     while modified:
         modified = False
-        #live-in and live-out sets as dictionaries that map tac.Instr objects to sets of temporaries
-        livein, liveout = dict(), dict()
-        #livein,liveout are emptied out & replaced with the corresponding live sets
-        recompute_liveness(cfg, livein, liveout)
+        #liveness of the temporaries after every instruction;
+        #after the first round, only the blocks that lost instructions are analysed again
+        live = cfg.analyses.get('liveness')
         for instr in cfg.instrs():
             #instructions without side-effects
-            if instr.opcode not in ('div', 'mod', 'call') and (instr.dest != None) and (instr.dest not in liveout[instr]):
+            if not tac.opcode_flags[instr.opcode] & tac.OP_SIDE_EFFECTS and (instr.dest != None) and not live.is_live_out(instr, instr.dest):
                 modified = True
                 # delete dead store instr
                 for block in cfg._blockmap.values():
                     if instr in block.body:
                         block.body.remove(instr)
                         break
-            elif instr.opcode in ('div', 'mod', 'call'):
+            elif tac.opcode_flags[instr.opcode] & tac.OP_SIDE_EFFECTS:
                 continue
     return cfg
 
 def GCP(decl, cfg):
-    #updates the cfg.CFG instance with its SSA form (crude).
+    #updates the cfg.CFG instance with its SSA form (pruned).
     #arguments : tac.Proc instance & its cfg.CFG instance 
-    ssagen.crude_ssagen(procs[decl], cfg[decl])
+    ssagen.pruned_ssagen(procs[decl], cfg[decl])
     # GCP (Copy Propagation)
     # no need to rerun it.
     for instr in cfg.instrs():
@@ -100,13 +97,13 @@ if __name__ == '__main__':
     #if only 1 filename
     if len(sys.argv) == 2:
         #output the optimized TAC (with SSA phi instructions) to standard output
-        for instr in optimized:
-            print(instr)
+        tac.write_tac(optimized, sys.stdout)
     #if input and output filenames
     else:
         #output the optimized TAC (with SSA phi instructions)to a file specified using the -o option
         with open(sys.argv[2], 'w') as tac_file:
-            json.dump(optimized, tac_file)
+            if sys.argv[2].endswith('.tac'): tac.write_tac(optimized, tac_file)
+            else: tac.write_tac_json(optimized, tac_file)
     print('before 2nd execute')
     tac.execute(gvars, procs, '@main', [])
         
@@ -0,0 +1,127 @@
+import os, random
+import tac
+import cfg as cfglib
+from test_tac import sample_files, ssa_file, swap_file
+
+def sample_procs(tmp_path):
+    """Yield the procs of the sample programs, and of their SSA forms,
+    with their cfgs"""
+    paths = sample_files(tmp_path)
+    paths += [ssa_file(path) for path in paths] + [swap_file(tmp_path)]
+    for path in paths:
+        for tlv in tac.load_tac(path):
+            if isinstance(tlv, tac.Proc): yield tlv, cfglib.infer(tlv)
+
+def instr_pairs(cfg):
+    """Like cfg.instr_pairs(labeled=True), skipping the empty blocks"""
+    for lab_from, lab_to in cfg.edges():
+        bl_from, bl_to = cfg[lab_from], cfg[lab_to]
+        if (bl_from.body or bl_from.jumps) and (bl_to.body or bl_to.jumps):
+            yield lab_from, bl_from.last_instr(), lab_to, bl_to.first_instr()
+    for bl in cfg.nodes():
+        instrs = list(bl.instrs())
+        for i, j in zip(instrs, instrs[1:]): yield bl.label, i, bl.label, j
+
+def naive_liveness(cfg):
+    """Return the live-in and live-out sets of the instructions of `cfg',
+    iterating over every pair of successive instructions until nothing
+    changes"""
+    livein = {i: set(i.uses()) for i in cfg.instrs()}
+    liveout = {i: set() for i in cfg.instrs()}
+    changed = True
+    while changed:
+        changed = False
+        for li, i, lj, j in instr_pairs(cfg):
+            live = livein[j] if li == lj else set(cfglib.filter_liveset(li, livein[j]))
+            defs = set(i.defs())
+            new = {x for x in live if (x[1] if isinstance(x, tuple) else x) not in defs}
+            if not new <= livein[i]:
+                livein[i] |= new
+                changed = True
+    for li, i, lj, j in instr_pairs(cfg):
+        liveout[i].update(cfglib.filter_liveset(li, livein[j]))
+    livein = {i: {x[1] if isinstance(x, tuple) else x for x in s}
+              for i, s in livein.items()}
+    return livein, liveout
+
+def test_liveness_matches_naive(tmp_path):
+    for proc, cfg in sample_procs(tmp_path):
+        livein, liveout = naive_liveness(cfg)
+        live = cfglib.Liveness(cfg)
+        assert dict(live.livein) == livein, proc.name
+        assert dict(live.liveout) == liveout, proc.name
+        for instr, temps in liveout.items():
+            for tmp in proc.symbols.names:
+                assert live.is_live_out(instr, tmp) == (tmp in temps), (instr, tmp)
+        bl = max(cfg.nodes(), key=lambda bl: len(bl.body))
+        if not bl.body: continue
+        del bl.body[-1]
+        live.update([bl.label])
+        livein, liveout = naive_liveness(cfg)
+        assert (dict(live.livein), dict(live.liveout)) == (livein, liveout), proc.name
+
+def random_cfg(tmp_path, rng):
+    """Return the cfg of a random proc, whose entry block may be jumped to
+    and whose blocks may be unreachable"""
+    n = rng.randint(1, 12)
+    out = ['proc @f(%a):']
+    for k in range(n):
+        out += [f'%.L{k}:', '  %a = sub %a, %a;']
+        end = rng.choice(['jz', 'jmp', 'ret', 'fall'] if k < n - 1 else ['jz', 'jmp', 'ret'])
+        if end == 'jz': out.append(f'  jz %a, %.L{rng.randrange(n)};')
+        if end in ('jz', 'jmp'): out.append(f'  jmp %.L{rng.randrange(n)};')
+        if end == 'ret': out.append('  ret;')
+    path = os.path.join(tmp_path, 'random.tac')
+    with open(path, 'w') as fp: fp.write('\n'.join(out) + '\n')
+    return cfglib.infer(tac.load_tac(path)[0])
+
+def naive_dominators(cfg):
+    """Return the set of the dominators of every reachable block of `cfg',
+    intersecting those of the predecessors until nothing changes"""
+    reachable, stack = {cfg.lab_entry}, [cfg.lab_entry]
+    while stack:
+        for succ in cfg.successors(stack.pop()):
+            if succ not in reachable:
+                reachable.add(succ)
+                stack.append(succ)
+    dom = {lab: set(reachable) for lab in reachable}
+    dom[cfg.lab_entry] = {cfg.lab_entry}
+    changed = True
+    while changed:
+        changed = False
+        for lab in reachable - {cfg.lab_entry}:
+            new = {lab}.union(set.intersection(*(dom[p] for p in cfg.predecessors(lab)
+                                                 if p in reachable)))
+            if new != dom[lab]:
+                dom[lab] = new
+                changed = True
+    return dom
+
+def test_dominators_match_naive(tmp_path):
+    rng = random.Random(24)
+    cfgs = [cfg for _, cfg in sample_procs(tmp_path)]
+    cfgs += [random_cfg(tmp_path, rng) for _ in range(300)]
+    for cfg in cfgs:
+        dom = naive_dominators(cfg)
+        doms = cfglib.Dominators(cfg)
+        labels = [bl.label for bl in cfg.nodes()]
+        for a in labels:
+            for b in labels:
+                assert doms.dominates(a, b) == (a in dom.get(b, ())), (a, b)
+        for lab, ds in dom.items():
+            strict = ds - {lab}
+            assert doms.idom[lab] == max(strict, key=lambda d: len(dom[d]), default=None)
+            assert set(doms.dominators(lab)) == ds
+        # the frontier of `a': the blocks `b' that `a' does not strictly
+        # dominate, but that have a predecessor `a' dominates
+        frontier = {a: {b for b in dom for p in cfg.predecessors(b)
+                        if a in dom.get(p, ()) and not (a in dom[b] and a != b)}
+                    for a in dom}
+        assert doms.frontier == frontier
+        for labs in (rng.sample(labels, min(len(labels), k)) for k in (1, 2, 3)):
+            expected = set()
+            while True:
+                new = set().union(*(frontier.get(lab, ()) for lab in set(labs) | expected))
+                if new == expected: break
+                expected = new
+            assert doms.iterated_frontier(labs) == expected, labs
@@ -0,0 +1,36 @@
+import os
+import tac
+import cfg as cfglib
+import dataflow
+
+def load_proc(tmp_path, text):
+    path = os.path.join(tmp_path, 'prog.tac')
+    with open(path, 'w') as fp: fp.write(text)
+    return tac.load_tac(path)[0]
+
+def ret_values(proc):
+    """The constants known at the start of the block of the ret of `proc'"""
+    cfg = cfglib.infer(proc)
+    result = dataflow.solve(dataflow.ConstantPropagation(cfg, proc))
+    for bl in cfg.nodes():
+        if bl.last_instr().opcode == 'ret':
+            return result.ins[bl.label]
+
+def test_constants_argument_kept_on_one_path(tmp_path):
+    proc = load_proc(tmp_path, 'proc @f(%a, %c):\n'
+                     '  jz %c, %.L1;\n'
+                     '  %a = const 1;\n'
+                     '%.L1:\n'
+                     '  ret %a;\n')
+    assert ret_values(proc)['%a'] is dataflow.NAC
+
+def test_constants_written_on_one_path(tmp_path):
+    proc = load_proc(tmp_path, 'proc @f(%c):\n'
+                     '  jz %c, %.L1;\n'
+                     '  %b = const 1;\n'
+                     '%.L1:\n'
+                     '  %k = const 2;\n'
+                     '  ret %b;\n')
+    values = ret_values(proc)
+    assert values['%b'] is dataflow.NAC
+    assert values['%c'] is dataflow.NAC
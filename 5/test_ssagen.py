@@ -0,0 +1,20 @@
+import tac
+import ssagen
+from test_tac import run, sample_files, ssa_file
+
+def test_pruned_matches_crude(tmp_path):
+    for path in sample_files(tmp_path, nrandom=40):
+        expected = run(path)
+        for gen in (ssagen.crude_ssagen, ssagen.pruned_ssagen):
+            ssa_path = ssa_file(path, gen)
+            for engine in tac.engines:
+                assert run(ssa_path, engine=engine) == expected, (path, gen, engine)
+            for proc in tac.load_tac(ssa_path):
+                if not isinstance(proc, tac.Proc): continue
+                dests = [instr.dest for instr in proc.body
+                         if instr.dest and instr.dest.startswith('%')]
+                assert len(dests) == len(set(dests)), (path, gen, proc.name)
+        for proc in tac.load_tac(path):
+            if not isinstance(proc, tac.Proc): continue
+            report = ssagen.compare_ssagen(proc)
+            assert report['pruned_ssagen'][0] <= report['crude_ssagen'][0], path
@@ -0,0 +1,435 @@
+import json, os, random, sys
+import pytest
+import tac, cfg as cfglib, ssagen
+
+def write(tmp_path, name, text):
+    path = os.path.join(tmp_path, name)
+    with open(path, 'w') as fp: fp.write(text)
+    return path
+
+# --------------------------------------------------------------------------------
+# Programs that every engine, format and pass must handle the same way
+
+programs = {
+'ops': """var @g = 5;
+var @h = 0;
+proc @show(%x):
+  param 1, %x;
+  call @__bx_print_int, 1;
+  ret;
+proc @binops(%a, %b):
+  %c = add %a, %b;  param 1, %c;  call @show, 1;
+  %c = sub %a, %b;  param 1, %c;  call @show, 1;
+  %c = mul %a, %b;  param 1, %c;  call @show, 1;
+  %c = div %a, %b;  param 1, %c;  call @show, 1;
+  %c = mod %a, %b;  param 1, %c;  call @show, 1;
+  %c = and %a, %b;  param 1, %c;  call @show, 1;
+  %c = or %a, %b;   param 1, %c;  call @show, 1;
+  %c = xor %a, %b;  param 1, %c;  call @show, 1;
+  %c = shl %a, %b;  param 1, %c;  call @show, 1;
+  %c = shr %a, %b;  param 1, %c;  call @show, 1;
+  %c = neg %a;      param 1, %c;  call @show, 1;
+  %c = not %a;      param 1, %c;  call @show, 1;
+  ret %c;
+proc @main:
+  %zz = const 0;
+  %a0 = const 17;
+  %a = sub %zz, %a0;
+  %b = const 5;
+  param 1, %a;  param 2, %b;  call @binops, 2;
+  %big = const 9223372036854775807;
+  %max = const 18446744073709551615;
+  param 1, %max;  param 2, %b;  call @binops, 2;
+  %sh = const 64;
+  param 1, %big;  param 2, %sh;  %r = call @binops, 2;
+  param 1, %r;  call @show, 1;
+  %c = copy @g;
+  %c = add %c, %b;
+  @h = copy %c;
+  @g = add @g, @h;
+  param 1, @g;  call @__bx_print_int, 1;
+  param 1, @h;  call @__bx_print_bool, 1;
+  param 1, %zz;  call @__bx_print_bool, 1;
+  jz %zz, %.L1;
+  param 1, %a;  call @show, 1;
+%.L1:
+  jnz %zz, %.L2;
+  jl %a, %.L2;
+  param 1, %b;  call @show, 1;
+%.L2:
+  jle %zz, %.L3;
+  param 1, %b;  call @show, 1;
+%.L3:
+  jnle %b, %.L4;
+  param 1, %b;  call @show, 1;
+%.L4:
+  jnl %a, %.L5;
+  param 1, %a;  call @show, 1;
+%.L5:
+  nop;
+  ret;
+""",
+'loop': """var @acc = 0;
+proc @main:
+  %i = const 0;
+  %s = const 0;
+  %n = const 300;
+  %one = const 1;
+  %three = const 3;
+%.Lhead:
+  %d = sub %i, %n;
+  jnl %d, %.Lend;
+  %m = mod %i, %three;
+  jnz %m, %.Lskip;
+  %s = add %s, %i;
+%.Lskip:
+  %i = add %i, %one;
+  jmp %.Lhead;
+%.Lend:
+  @acc = copy %s;
+  param 1, @acc;
+  call @__bx_print_int, 1;
+  ret;
+""",
+'fib': """var @calls = 0;
+proc @fib(%n):
+  %one = const 1;
+  @calls = add @calls, %one;
+  %t = sub %n, %one;
+  jle %t, %.Lbase;
+  param 1, %t;
+  %a = call @fib, 1;
+  %t = sub %t, %one;
+  param 1, %t;
+  %b = call @fib, 1;
+  %r = add %a, %b;
+  ret %r;
+%.Lbase:
+  ret %n;
+proc @noret(%x):
+  param 1, %x;
+  call @__bx_print_int, 1;
+proc @main:
+  %n = const 12;
+  param 1, %n;
+  %f = call @fib, 1;
+  param 1, %f;
+  call @__bx_print_int, 1;
+  param 1, @calls;
+  call @__bx_print_int, 1;
+  param 1, %f;
+  call @noret, 1;
+  ret;
+""",
+}
+
+def random_program(rng):
+    """Return the text of a random program that loops, branches, prints
+    and always stops"""
+    n = rng.randint(1, 8)
+    temps = ['%a', '%b', '%c', '%d', '@g']
+    out = ['var @g = 3;', 'proc @main:', '%.Lentry:', '  %fuel = const 40;',
+           '  %one = const 1;']
+    for t in temps[:-1]: out.append(f'  {t} = const {rng.randrange(10)};')
+    out.append('  jmp %.L0;')
+    for i in range(n):
+        out.append(f'%.L{i}:')
+        for _ in range(rng.randint(0, 4)):
+            op = rng.choice(['add', 'sub', 'mul', 'xor', 'copy', 'const'])
+            d = rng.choice(temps)
+            if op == 'copy': out.append(f'  {d} = copy {rng.choice(temps)};')
+            elif op == 'const': out.append(f'  {d} = const {rng.randrange(10)};')
+            else: out.append(f'  {d} = {op} {rng.choice(temps)}, {rng.choice(temps)};')
+        if rng.random() < 0.3:
+            out.append(f'  param 1, {rng.choice(temps)};')
+            out.append('  call @__bx_print_int, 1;')
+        out.append('  %fuel = sub %fuel, %one;')
+        out.append('  jz %fuel, %.Lexit;')
+        out.append(f'  {rng.choice(["jz", "jnz", "jl"])} {rng.choice(temps)}, '
+                   f'%.L{rng.randrange(n)};')
+        if rng.random() < 0.8:
+            dest = '%.Lexit' if rng.random() < 0.2 else f'%.L{rng.randrange(n)}'
+            out.append(f'  jmp {dest};')
+    out.append('%.Lexit:')
+    for t in temps: out += [f'  param 1, {t};', '  call @__bx_print_int, 1;']
+    out.append('  ret;')
+    return '\n'.join(out) + '\n'
+
+def sample_files(tmp_path, nrandom=20):
+    """Write the programs above and `nrandom' random ones and return
+    their paths"""
+    paths = [write(tmp_path, f'{name}.tac', text) for name, text in programs.items()]
+    rng = random.Random(302)
+    paths += [write(tmp_path, f'random{i}.tac', random_program(rng))
+              for i in range(nrandom)]
+    return paths
+
+traces = ({}, {'show_proc': True}, {'show_proc': True, 'show_instr': True})
+
+def test_separate_symbols_per_load(tmp_path):
+    for parser in tac.parsers:
+        path1 = write(tmp_path, 'a.tac', 'proc @main:\n  %x = const 1;\n  ret;\n')
+        path2 = write(tmp_path, 'b.tac', 'proc @main:\n  %y = const 2;\n  ret;\n')
+        procs1, procs2 = tac.load_tac(path1, parser), tac.load_tac(path2, parser)
+        assert procs1[0].symbols is not procs2[0].symbols, parser
+        assert '%y' not in procs1[0].symbols.names, parser
+
+def test_columnar_unsigned_constants():
+    body = tac.ColumnarBody([tac.Instr('%x', 'const', (2**64 - 1, None)),
+                             tac.Instr(None, 'param', (1, '%x'))])
+    assert body[0].arg1 == 2**64 - 1
+    body[1].arg1 = 2**63
+    body[1].arg2 = 2**63 + 1
+    assert (body[1].arg1, body[1].arg2) == (2**63, 2**63 + 1)
+    body[1].arg1 = -1
+    assert (body[1].arg1, body[1].arg2) == (-1, 2**63 + 1)
+
+def test_tacb_unsigned_values(tmp_path):
+    path = write(tmp_path, 'big.tac', 'var @g = 9223372036854775808;\n'
+                 'proc @main:\n  %x = const 18446744073709551615;\n'
+                 '  %y = const 9223372036854775807;\n  ret;\n')
+    prog = tac.load_tac(path)
+    with open(os.path.join(tmp_path, 'big.tacb'), 'wb') as fp: tac.write_tacb(prog, fp)
+    back = tac.load_tac(os.path.join(tmp_path, 'big.tacb'))
+    assert [tlv.js_obj for tlv in back] == [tlv.js_obj for tlv in prog]
+
+def test_load_checks_instrs(tmp_path):
+    bad = {'opcode': 'add', 'args': [1, '%y'], 'result': '%x'}
+    with pytest.raises(ValueError):
+        tac.Instr.load(bad)
+    path = write(tmp_path, 'bad.tac.json', json.dumps([{'proc': '@main', 'args': [], 'body': [bad]}]))
+    with pytest.raises(ValueError):
+        tac.load_tac(path)
+    with pytest.raises(ValueError):
+        [proc.body for proc in tac.iter_tac(path)]
+
+def run(path, **kwargs):
+    """Return the lines printed by the program in `path' and the error it
+    stops with, if any"""
+    gvars, procs = dict(), dict()
+    for tlv in tac.load_tac(path):
+        if isinstance(tlv, tac.Proc): procs[tlv.name] = tlv
+        else: gvars[tlv.name] = tlv
+    if kwargs.pop('memo', False): kwargs['memo'] = tac.Memo(procs)
+    if kwargs.pop('columnar', False):
+        for proc in procs.values(): proc.make_columnar()
+    output = tac.ListOutput()
+    try:
+        tac.execute(gvars, procs, '@main', (), output=output, **kwargs)
+    except Exception as exc:
+        return output.lines, repr(exc)
+    return output.lines, None
+
+def test_memo_valueless_call(tmp_path):
+    path = write(tmp_path, 'f.tac', 'proc @f:\n  ret;\n'
+                 'proc @main:\n  call @f, 0;\n  %x = call @f, 0;\n'
+                 '  param 1, %x;\n  call @__bx_print_int, 1;\n  ret;\n')
+    assert run(path, engine='threaded')[1] == "RuntimeError('Illegal value: None')"
+    for engine in tac.engines:
+        assert run(path, engine=engine, memo=True) == run(path, engine=engine), engine
+
+def test_phi_after_fall_through(tmp_path):
+    body = [tac.Instr('%x', 'const', (1, None)), tac.Instr(None, 'jmp', ('%.L1', None)),
+            tac.Instr(None, 'label', ('%.L1', None)), tac.Instr('%x', 'const', (2, None)),
+            tac.Instr(None, 'label', ('%.L2', None)),
+            tac.Instr('%y', 'phi', ({'%.L1': '%x'}, None)),
+            tac.Instr(None, 'param', (1, '%y')),
+            tac.Instr(None, 'call', ('@__bx_print_int', 1)),
+            tac.Instr(None, 'ret', (None, None))]
+    path = write(tmp_path, 'ft.tac.json', json.dumps([tac.Proc('@main', [], body).js_obj]))
+    for engine in tac.engines:
+        assert run(path, engine=engine) == (['2'], None), engine
+    tac_batch = pytest.importorskip('tac_batch')
+    procs = {'@main': tac.load_tac(path)[0]}
+    assert tac_batch.execute_batch({}, procs, '@main', [()]).output == [['2']]
+
+def test_unwritten_temp(tmp_path):
+    path = write(tmp_path, 'u.tac', 'proc @f(%a):\n  jz %a, %.L1;\n  %x = const 1;\n'
+                 '%.L1:\n  ret %x;\n'
+                 'proc @main:\n  %z = const 0;\n  param 1, %z;\n  %y = call @f, 1;\n'
+                 '  ret;\n'
+                 'proc @g:\n  ret %never;\n')
+    for engine in tac.engines:
+        assert run(path, engine=engine) == ([], "KeyError('%x')"), engine
+
+def test_compiled_recursion_limit(tmp_path):
+    path = write(tmp_path, 'deep.tac', 'proc @down(%n):\n  jz %n, %.L1;\n'
+                 '  %one = const 1;\n  %m = sub %n, %one;\n  param 1, %m;\n'
+                 '  %r = call @down, 1;\n  ret %r;\n%.L1:\n  ret %n;\n'
+                 'proc @main:\n  %n = const 5000;\n  param 1, %n;\n'
+                 '  %r = call @down, 1;\n  param 1, %r;\n'
+                 '  call @__bx_print_int, 1;\n  ret;\n')
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(2000)
+    try:
+        assert run(path, engine='compiled') == (['0'], None)
+        assert sys.getrecursionlimit() == 2000
+    finally:
+        sys.setrecursionlimit(limit)
+
+def test_batch_recursion_limit(tmp_path):
+    tac_batch = pytest.importorskip('tac_batch')
+    path = write(tmp_path, 'down.tac', 'proc @down(%n):\n  jz %n, %.L1;\n'
+                 '  %one = const 1;\n  %m = sub %n, %one;\n  param 1, %m;\n'
+                 '  %r = call @down, 1;\n  ret %r;\n%.L1:\n  ret %n;\n')
+    procs = {'@down': tac.load_tac(path)[0]}
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(2000)
+    try:
+        batch = tac_batch.execute_batch({}, procs, '@down', [(3,), (300,)])
+        assert [batch.result(lane) for lane in range(2)] == [0, 0]
+        assert sys.getrecursionlimit() == 2000
+    finally:
+        sys.setrecursionlimit(limit)
+
+def test_threaded_matches_classic(tmp_path):
+    for path in sample_files(tmp_path):
+        for trace in traces:
+            expected = run(path, **trace)
+            assert run(path, engine='threaded', fuse=False, **trace) == expected, path
+
+def final_globals(path, **kwargs):
+    """Return the values of the globals after running the program in `path'"""
+    gvars, procs = dict(), dict()
+    for tlv in tac.load_tac(path):
+        if isinstance(tlv, tac.Proc): procs[tlv.name] = tlv
+        else: gvars[tlv.name] = tlv
+    tac.execute(gvars, procs, '@main', (), output=tac.ListOutput(), **kwargs)
+    return {name: gvar.value for name, gvar in gvars.items()}
+
+def test_register_file_globals(tmp_path):
+    for path in sample_files(tmp_path):
+        assert final_globals(path, engine='threaded') == final_globals(path), path
+
+def ssa_file(path, gen=ssagen.crude_ssagen):
+    """Write the SSA form of the program in `path' made by `gen' to a
+    .tac.json file and return its path"""
+    prog = tac.load_tac(path)
+    for tlv in prog:
+        if isinstance(tlv, tac.Proc):
+            cfg = cfglib.infer(tlv)
+            gen(tlv, cfg)
+            cfglib.linearize(tlv, cfg)
+    ssa_path = path.removesuffix('.tac') + '_ssa.tac.json'
+    with open(ssa_path, 'w') as fp: tac.write_tac_json(prog, fp)
+    return ssa_path
+
+def swap_file(tmp_path):
+    """Write a loop whose phis swap two temporaries on every iteration"""
+    body = [tac.Instr(None, 'label', ('%.L0', None)),
+            tac.Instr('%a', 'const', (1, None)), tac.Instr('%b', 'const', (2, None)),
+            tac.Instr('%n', 'const', (5, None)), tac.Instr('%one', 'const', (1, None)),
+            tac.Instr(None, 'label', ('%.L1', None)),
+            tac.Instr('%a1', 'phi', ({'%.L0': '%a', '%.L1': '%b1'}, None)),
+            tac.Instr('%b1', 'phi', ({'%.L0': '%b', '%.L1': '%a1'}, None)),
+            tac.Instr('%n1', 'phi', ({'%.L0': '%n', '%.L1': '%n2'}, None)),
+            tac.Instr(None, 'param', (1, '%a1')),
+            tac.Instr(None, 'call', ('@__bx_print_int', 1)),
+            tac.Instr('%n2', 'sub', ('%n1', '%one')),
+            tac.Instr(None, 'jnz', ('%n2', '%.L1')),
+            tac.Instr(None, 'ret', (None, None))]
+    return write(tmp_path, 'swap.tac.json',
+                 json.dumps([tac.Proc('@main', [], body).js_obj]))
+
+def test_phis_match_classic(tmp_path):
+    swap_path = swap_file(tmp_path)
+    assert run(swap_path) == (['1', '2', '1', '2', '1'], None)
+    for trace in traces:
+        expected = run(swap_path, **trace)
+        assert run(swap_path, engine='threaded', fuse=False, **trace) == expected
+    for path in sample_files(tmp_path):
+        ssa_path = ssa_file(path)
+        assert run(ssa_path) == run(path), path
+        for trace in traces:
+            expected = run(ssa_path, **trace)
+            assert run(ssa_path, engine='threaded', fuse=False, **trace) == expected, path
+
+def test_explicit_stack_deep_recursion(tmp_path):
+    path = write(tmp_path, 'sum.tac', 'proc @sum(%n):\n  jz %n, %.L1;\n'
+                 '  %one = const 1;\n  %m = sub %n, %one;\n  param 1, %m;\n'
+                 '  %r = call @sum, 1;\n  %r = add %r, %n;\n  ret %r;\n'
+                 '%.L1:\n  ret %n;\n'
+                 'proc @main:\n  %n = const 20000;\n  param 1, %n;\n'
+                 '  %r = call @sum, 1;\n  param 1, %r;\n'
+                 '  call @__bx_print_int, 1;\n  ret;\n')
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(1000)
+    try:
+        assert run(path, engine='threaded') == (['200010000'], None)
+        assert run(path, engine='compiled') == (['200010000'], None)
+    finally:
+        sys.setrecursionlimit(limit)
+    small = write(tmp_path, 'small.tac', open(path).read().replace('20000', '50'))
+    for trace in traces:
+        assert run(small, engine='threaded', **trace) == run(small, **trace)
+
+def test_superinstructions_match_classic(tmp_path):
+    paths = sample_files(tmp_path)
+    for path in paths + [ssa_file(path) for path in paths] + [swap_file(tmp_path)]:
+        for trace in traces:
+            expected = run(path, **trace)
+            assert run(path, engine='threaded', **trace) == expected, path
+        assert run(path, engine='threaded', profile=tac.Profile()) == run(path), path
+
+def parse_all(path, capsys):
+    """Return what each parser makes of the file `path': the program or
+    the error, and what it prints"""
+    results = []
+    for parser in tac.parsers:
+        try: prog = [tlv.js_obj for tlv in tac.load_tac(path, parser)]
+        except Exception as exc: prog = repr(exc)
+        results.append((prog, capsys.readouterr().out))
+    return results
+
+def test_parsers_agree(tmp_path, capsys):
+    texts = [open(path).read() for path in sample_files(tmp_path)]
+    texts += ['// comment\nproc @main:  // more\n\n  %x = const 1 ;ret;\n',
+              'proc @main:\n  %x = const 1\n  ret;\n',
+              'proc @main:\n  %x = const 99999999999999999999;\n',
+              'proc @main:\n  %x = foo 1;\n',
+              'proc @main:\n  %x = const 1;\n  $\n',
+              'var @x = ;\n', 'proc main:\n  ret;\n',
+              'proc @main(%a, ):\n  ret;\n', 'proc @main:\n  jmp 5;\n']
+    rng = random.Random(13)
+    for _ in range(200):
+        text = rng.choice(texts[:3])
+        i = rng.randrange(len(text))
+        texts.append(text[:i] + rng.choice(['', ';', ':', ',', '%', '@', '1', 'x', '(', '\n'])
+                     + text[i + 1:])
+    for text in texts:
+        results = parse_all(write(tmp_path, 'p.tac', text), capsys)
+        assert all(result == results[0] for result in results), text
+
+def test_formats_round_trip(tmp_path):
+    paths = sample_files(tmp_path)
+    paths += [ssa_file(path) for path in paths[:5]] + [swap_file(tmp_path)]
+    for path in paths:
+        prog = tac.load_tac(path)
+        expected = [tlv.js_obj for tlv in prog]
+        stem = path[:-len('.tac.json')] if path.endswith('.json') else path[:-len('.tac')]
+        copies = []
+        for ext, mode, writer in (('.tac', 'w', tac.write_tac),
+                                  ('.tac.json', 'w', tac.write_tac_json),
+                                  ('.tacb', 'wb', tac.write_tacb)):
+            if ext == '.tac' and path.endswith('.json'): continue  # no phi syntax
+            copy = f'{stem}_copy{ext}'
+            with open(copy, mode) as fp: writer(prog, fp)
+            assert [tlv.js_obj for tlv in tac.load_tac(copy)] == expected, copy
+            assert [tlv.js_obj for tlv in tac.iter_tac(copy, chunk_size=7)] \
+                == expected, copy
+            copies.append(copy)
+        for copy in copies: assert run(copy) == run(path), copy
+
+def test_columnar_bodies(tmp_path):
+    paths = sample_files(tmp_path, nrandom=10)
+    paths += [ssa_file(path) for path in paths[:3]] + [swap_file(tmp_path)]
+    for path in paths:
+        for tlv in tac.load_tac(path):
+            if not isinstance(tlv, tac.Proc): continue
+            expected = tlv.js_obj
+            tlv.make_columnar()
+            assert tlv.js_obj == expected, path
+        for engine in ('classic', 'threaded'):
+            for trace in traces:
+                assert run(path, engine=engine, columnar=True, **trace) \
+                    == run(path, engine=engine, **trace), (path, engine, trace)
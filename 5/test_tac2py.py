@@ -0,0 +1,32 @@
+import json
+import tac, tac2py
+from test_tac import run, sample_files, ssa_file, swap_file, write
+
+def test_compiled_matches_classic(tmp_path, monkeypatch):
+    monkeypatch.setattr(tac2py, 'cache_dir', str(tmp_path / 'cache'))
+    paths = sample_files(tmp_path)
+    for path in paths + [ssa_file(path) for path in paths] + [swap_file(tmp_path)]:
+        assert run(path, engine='compiled') == run(path), path
+
+def test_code_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(tac2py, 'cache_dir', str(tmp_path / 'cache'))
+    path = sample_files(tmp_path, 0)[0]
+    expected = run(path, engine='compiled')
+    assert len(list((tmp_path / 'cache').iterdir())) == len(tac.load_tac(path)) - 2
+    def translate(proc): raise AssertionError(f'{proc.name} translated again')
+    monkeypatch.setattr(tac2py, 'translate', translate)
+    assert run(path, engine='compiled') == expected
+
+def test_phi_from_missing_label(tmp_path, monkeypatch):
+    monkeypatch.setattr(tac2py, 'cache_dir', str(tmp_path / 'cache'))
+    # once cfg.infer() renumbers %.L5 as %.L0, it clashes with the key of
+    # the argument from the missing label %.L0
+    body = [tac.Instr(None, 'label', ('%.L5', None)), tac.Instr('%a', 'const', (1, None)),
+            tac.Instr(None, 'jmp', ('%.L7', None)), tac.Instr(None, 'label', ('%.L7', None)),
+            tac.Instr('%y', 'phi', ({'%.L5': '%a', '%.L0': '%zz'}, None)),
+            tac.Instr(None, 'param', (1, '%y')),
+            tac.Instr(None, 'call', ('@__bx_print_int', 1)),
+            tac.Instr(None, 'ret', (None, None))]
+    path = write(tmp_path, 'stale.tac.json',
+                 json.dumps([tac.Proc('@main', [], body).js_obj]))
+    assert run(path, engine='compiled') == run(path) == (['1'], None)
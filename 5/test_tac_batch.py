@@ -0,0 +1,82 @@
+import pytest
+np = pytest.importorskip('numpy')
+import tac, tac_batch
+from test_tac import final_globals, run, sample_files, ssa_file, write
+
+def load(path):
+    gvars, procs = dict(), dict()
+    for tlv in tac.load_tac(path):
+        if isinstance(tlv, tac.Proc): procs[tlv.name] = tlv
+        else: gvars[tlv.name] = tlv
+    return gvars, procs
+
+def test_batch_matches_classic(tmp_path):
+    paths = sample_files(tmp_path)
+    for path in paths + [ssa_file(path) for path in paths]:
+        batch = tac_batch.execute_batch(*load(path), '@main', [()] * 3)
+        expected = final_globals(path)
+        for lane in range(3):
+            assert batch.output[lane] == run(path)[0], path
+            assert {name: tac.untwoc(int(values[lane]))
+                    for name, values in batch.globals.items()} == expected, path
+
+divergent = """var @count = 0;
+proc @collatz(%n):
+  %one = const 1;
+  %two = const 2;
+  %three = const 3;
+  %steps = const 0;
+%.L1:
+  %d = sub %n, %one;
+  jz %d, %.L3;
+  %r = mod %n, %two;
+  jz %r, %.L2;
+  %n = mul %n, %three;
+  %n = add %n, %one;
+  %steps = add %steps, %one;
+  @count = add @count, %one;
+  jmp %.L1;
+%.L2:
+  %n = div %n, %two;
+  %steps = add %steps, %one;
+  jmp %.L1;
+%.L3:
+  param 1, %steps;
+  call @__bx_print_int, 1;
+  ret %steps;
+proc @ops(%a, %b, %s):
+  %x = div %a, %b;
+  %y = mod %a, %b;
+  %z = shl %a, %s;
+  %w = shr %a, %s;
+  %v = neg %a;
+  %u = not %b;
+  jl %a, %.Lneg;
+  param 1, %x;
+  call @__bx_print_int, 1;
+  jmp %.Lend;
+%.Lneg:
+  param 1, %y;
+  call @__bx_print_bool, 1;
+%.Lend:
+  %r = xor %z, %w;
+  %r = add %r, %v;
+  %r = sub %r, %u;
+  ret %r;
+"""
+
+def test_batch_lanes_diverge(tmp_path):
+    path = write(tmp_path, 'divergent.tac', divergent)
+    vals = [0, 1, -1, 7, -7, 3, 2**62, -2**63, 2**63 - 1, 2**53 + 3, -2**53 - 5]
+    rows = {'@collatz': [(n,) for n in range(1, 60)],
+            '@ops': [(a, b, s) for a in vals for b in vals if b != 0
+                     for s in (0, 1, 5, 63, 64)]}
+    for name, args in rows.items():
+        gvars, procs = load(path)
+        batch = tac_batch.execute_batch(gvars, procs, name, args)
+        for lane, row in enumerate(args):
+            output = tac.ListOutput()
+            result = tac.execute(load(path)[0], procs, name,
+                                 [tac.twoc(x) for x in row], output=output)
+            assert (batch.result(lane), batch.output[lane]) == (result, output.lines), row
+        assert gvars['@count'].value == 0